@@ -247,11 +247,17 @@ class GeminiLLMAgent():
                     if "status" in function_response["result"]:
                         if "image" in function_response["result"]["results"] and type(function_response["result"]["results"]) is dict:
                             function_response["result"]["results"].pop("image", None)
+                        # bulk tables carry one image per row
+                        if type(function_response["result"]["results"]) is dict:
+                            function_response["result"]["results"].pop("images", None)
                         if type(function_response["result"]) is dict:
                             if "results" in function_response["result"] and type(function_response["result"]["results"]) is list:
                                 for item in function_response["result"]["results"]:
                                     if "image" in item:
                                         item.pop("image", None)
+                                    # batched searches nest the hits per query
+                                    for hit in item.get("hits", []):
+                                        hit.pop("image", None)
 
                 print("function call part", function_call_part)
                 print("tool call response mod >>", function_response)
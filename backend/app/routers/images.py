@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+import hashlib
+from app.utils.image_refs import parse_image_id
+from app.utils.depiction import depict, MEDIA_TYPES
+from app.utils.tool_repository import get_pdb_image_bytes
+
+
+router = APIRouter()
+
+# molecule depictions never change for a given id, PDB images only rarely
+CACHE_CONTROL = {
+    "smiles": "public, max-age=31536000, immutable",
+    "pdb": "public, max-age=86400"
+}
+
+
+def load_image(spec: dict) -> bytes:
+    if spec["kind"] == "smiles":
+        return depict(spec["value"], size=spec["size"] or (600, 600), fmt=spec["format"])
+    return get_pdb_image_bytes(spec["value"])
+
+
+@router.get("/{image_id}")
+async def get_image(image_id: str, request: Request):
+    """
+    Serves the image behind an id returned by the tools in ref mode.
+    The image is only rendered (or fetched) when the client has no fresh copy.
+    """
+    try:
+        spec = parse_image_id(image_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    etag = '"' + hashlib.sha1(image_id.encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL[spec["kind"]]}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    try:
+        content = await run_in_threadpool(load_image, spec)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if content is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(content=content, media_type=MEDIA_TYPES[spec["format"]], headers=headers)
@@ -0,0 +1,57 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+import json
+from app.utils.tool_repository import (
+    iter_similar_proteins,
+    iter_substructure_matches,
+    similar_proteins_limit,
+    RCSBSearcher
+)
+
+
+router = APIRouter()
+
+
+def similar_proteins_events(pdb_id: str, num_candidates: int, include_info: bool):
+    try:
+        limit, truncated = similar_proteins_limit(num_candidates)
+        searcher = RCSBSearcher()
+        for hit in iter_similar_proteins(pdb_id, limit, include_info, searcher):
+            yield f"data: {json.dumps(hit)}\n\n"
+        if truncated or searcher.truncated:
+            yield f"data: {json.dumps({'truncated': True, 'num_candidates': limit})}\n\n"
+    except Exception as e:
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    yield f"data: <|end|>\n\n"
+
+
+@router.get("/proteins/{pdb_id}/similar")
+def stream_similar_proteins(pdb_id: str, num_candidates: int = 5, include_info: bool = False):
+    """
+    Streams the structurally similar proteins of a PDB entry as server-sent events,
+    one hit per event as the result pages arrive, closed by an <|end|> event. When
+    num_candidates exceeds the limit (or the offline PDB mirror holds fewer hits),
+    a {"truncated": true, "num_candidates": limit} event precedes the end.
+    """
+    return StreamingResponse(similar_proteins_events(pdb_id, num_candidates, include_info),
+                             media_type="text/event-stream")
+
+
+def substructure_events(smarts: str, space: str, max_hits: int):
+    try:
+        for match in iter_substructure_matches(smarts, space, max_hits):
+            yield f"data: {json.dumps(match)}\n\n"
+    except Exception as e:
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    yield f"data: <|end|>\n\n"
+
+
+@router.get("/substructure")
+def stream_substructure_matches(smarts: str, space: str = "smiles", max_hits: int = 25):
+    """
+    Streams the molecules (space=smiles) or polymers (space=psmiles) containing a
+    SMARTS pattern as server-sent events, one match per event as the fingerprint
+    screen survivors are verified, closed by an <|end|> event.
+    """
+    return StreamingResponse(substructure_events(smarts, space, max_hits),
+                             media_type="text/event-stream")
@@ -0,0 +1,186 @@
+import os
+import base64
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from rdkit import Chem
+from rdkit.Chem import Draw
+from rdkit.Chem.Draw import rdMolDraw2D
+from PIL import Image
+from app.utils.mol_cache import mol_cache
+
+DEPICTION_FORMATS = ["png", "webp", "svg"]
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "svg": "image/svg+xml", "jpeg": "image/jpeg"}
+# default output format of the explorer and similarity tools
+DEPICTION_FORMAT = os.environ.get("DEPICTION_FORMAT", "png")
+# zlib level for PNG (0-9) and lossy quality for WebP (0-100)
+DEPICTION_PNG_COMPRESS_LEVEL = int(os.environ.get("DEPICTION_PNG_COMPRESS_LEVEL", 6))
+DEPICTION_WEBP_QUALITY = int(os.environ.get("DEPICTION_WEBP_QUALITY", 80))
+DEPICTION_CACHE_BYTES = int(os.environ.get("DEPICTION_CACHE_BYTES", 64 * 2**20))
+DEPICTION_WORKERS = int(os.environ.get("DEPICTION_WORKERS", min(8, os.cpu_count() or 1)))
+# below this many cache misses rendering inline beats the round trip to the pool
+DEPICTION_POOL_MIN_BATCH = 4
+
+
+class DepictionCache():
+    """
+    LRU cache of rendered molecule images keyed by (canonical SMILES, size, format, quality),
+    bounded by the total number of bytes held rather than by entry count.
+    """
+
+    def __init__(self, max_bytes: int = DEPICTION_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+depiction_cache = DepictionCache()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=DEPICTION_WORKERS)
+        return _pool
+
+
+def shutdown_depiction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _draw(mol, size: tuple, drawer_class) -> bytes:
+    drawer = drawer_class(*size)
+    rdMolDraw2D.PrepareAndDrawMolecule(drawer, mol)
+    drawer.FinishDrawing()
+    return drawer.GetDrawingText()
+
+
+def render_molecule(smiles: str, size: tuple = (600, 600), fmt: str = "png",
+                    quality: int = None) -> bytes:
+    """
+    Render a SMILES string to image bytes with RDKit's 2D drawers.
+
+    `fmt` is one of "png", "webp" or "svg". `quality` is the zlib level for
+    PNG (0-9) and the lossy quality for WebP (0-100); it is ignored for SVG.
+    Raises ValueError for invalid SMILES or unknown formats.
+    """
+    mol = mol_cache.get_mol(smiles)
+    if mol is None:
+        raise ValueError(f"Invalid SMILES: {smiles}")
+    size = tuple(size)
+    if fmt == "svg":
+        return _draw(mol, size, rdMolDraw2D.MolDraw2DSVG).encode("utf-8")
+    if fmt not in DEPICTION_FORMATS:
+        raise ValueError(f"Unknown image format {fmt}, expected one of {DEPICTION_FORMATS}")
+    if hasattr(rdMolDraw2D, "MolDraw2DCairo"):
+        png = _draw(mol, size, rdMolDraw2D.MolDraw2DCairo)
+        if fmt == "png" and quality is None:
+            return png
+        img = Image.open(BytesIO(png))
+    else:
+        # RDKit builds without Cairo only have the PIL based drawer
+        img = Draw.MolToImage(mol, size=size)
+    buffer = BytesIO()
+    if fmt == "webp":
+        img.save(buffer, format="WEBP",
+                 quality=DEPICTION_WEBP_QUALITY if quality is None else quality)
+    else:
+        img.save(buffer, format="PNG",
+                 compress_level=DEPICTION_PNG_COMPRESS_LEVEL if quality is None else quality)
+    return buffer.getvalue()
+
+
+def _render_batch(specs: list) -> list:
+    return [render_molecule(smiles, size, fmt, quality) for smiles, size, fmt, quality in specs]
+
+
+def depict_many(smiles_list: list, size: tuple = (600, 600), fmt: str = "png",
+                quality: int = None) -> list:
+    """
+    Return rendered image bytes for every SMILES, in input order. Cached images
+    are reused; the distinct misses are rendered in the worker pool when there
+    are enough of them, otherwise inline.
+    """
+    size = tuple(size)
+    keys = [(mol_cache.canonical(smiles), size, fmt, quality) for smiles in smiles_list]
+    images = [depiction_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, image in zip(keys, images) if image is None))
+    if not missing:
+        return images
+    if len(missing) < DEPICTION_POOL_MIN_BATCH or DEPICTION_WORKERS <= 1:
+        rendered = _render_batch(missing)
+    else:
+        pool = _get_pool()
+        step = -(-len(missing) // DEPICTION_WORKERS)
+        futures = [pool.submit(_render_batch, missing[i:i + step])
+                   for i in range(0, len(missing), step)]
+        rendered = [image for future in futures for image in future.result()]
+    rendered = dict(zip(missing, rendered))
+    for key, image in rendered.items():
+        depiction_cache.put(key, image)
+    return [rendered[key] if image is None else image for key, image in zip(keys, images)]
+
+
+def depict(smiles: str, size: tuple = (600, 600), fmt: str = "png",
+           quality: int = None) -> bytes:
+    return depict_many([smiles], size, fmt, quality)[0]
+
+
+def depict_base64(smiles: str, size: tuple = (600, 600), fmt: str = "png",
+                  quality: int = None) -> str:
+    return base64.b64encode(depict(smiles, size, fmt, quality)).decode("utf-8")
@@ -0,0 +1,312 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from rdkit import Chem, RDLogger
+from rdkit.Chem import Descriptors, Lipinski, Crippen, rdFingerprintGenerator
+from app.utils.mol_cache import mol_cache
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+DESCRIPTOR_WORKERS = int(os.environ.get("DESCRIPTOR_WORKERS", min(8, os.cpu_count() or 1)))
+DESCRIPTOR_CHUNK_SIZE = int(os.environ.get("DESCRIPTOR_CHUNK_SIZE", 500))
+# upper bound on the SMILES of one bulk explorer call
+MAX_BULK_SMILES = int(os.environ.get("MAX_BULK_SMILES", 100000))
+MORGAN_COUNT_RADIUS = 2
+MORGAN_COUNT_BITS = int(os.environ.get("MORGAN_COUNT_BITS", 2048))
+
+# the molecule explorer properties, in display order:
+# Molecular Formula     - chemical formula for the molecule
+# Molecular Weight      - approximate weight in daltons
+# Heavy Atoms Count     - count of non-hydrogen atoms
+# H Bond Donor Count    - hydrogen bond donor count
+# H Bond Acceptor Count - hydrogen bond acceptor count
+# Rotatable Bonds Count - number of freely rotating bonds
+# TPSA                  - topological polar surface area
+# Number of Rings       - number of ring structures
+BASIC_DESCRIPTORS = {
+    "Molecular Formula": Chem.rdMolDescriptors.CalcMolFormula,
+    "Molecular Weight": lambda mol: round(float(Descriptors.MolWt(mol)), 3),
+    "Heavy Atoms Count": Descriptors.HeavyAtomCount,
+    "H Bond Donor Count": Descriptors.NumHDonors,
+    "H Bond Acceptor Count": Descriptors.NumHAcceptors,
+    "Rotatable Bonds Count": Descriptors.NumRotatableBonds,
+    "TPSA": Descriptors.TPSA,
+    "Number of Rings": Descriptors.RingCount,
+}
+
+# the order independent polymer explorer properties of a repeat unit
+POLYMER_DESCRIPTORS = {
+    "Molecular Formula": Chem.rdMolDescriptors.CalcMolFormula,
+    "Monomer Molecular Weight": lambda mol: round(float(Descriptors.MolWt(mol)), 3),
+    "Number of Rings in Monomer": Descriptors.RingCount,
+}
+
+
+def lipinski_violations(mol) -> int:
+    return sum([Descriptors.MolWt(mol) > 500,
+                Crippen.MolLogP(mol) > 5,
+                Lipinski.NumHDonors(mol) > 5,
+                Lipinski.NumHAcceptors(mol) > 10])
+
+
+# rule of five properties
+LIPINSKI_DESCRIPTORS = {
+    "MolWt": Descriptors.MolWt,
+    "MolLogP": Crippen.MolLogP,
+    "NumHDonors": Lipinski.NumHDonors,
+    "NumHAcceptors": Lipinski.NumHAcceptors,
+    "NumRotatableBonds": Lipinski.NumRotatableBonds,
+    "TPSA": Descriptors.TPSA,
+    "Lipinski Violations": lipinski_violations,
+}
+
+
+def molecule_descriptors(mol) -> dict:
+    return {name: fn(mol) for name, fn in BASIC_DESCRIPTORS.items()}
+
+
+def polymer_descriptors(mol) -> dict:
+    return {name: fn(mol) for name, fn in POLYMER_DESCRIPTORS.items()}
+
+
+class DescriptorSet():
+    """
+    A named group of descriptor columns.
+
+    Scalar sets compute one value per function and, for single molecules,
+    are cached per molecule in the shared mol cache; vector sets
+    (fingerprint counts) compute the whole row at once. Text columns (e.g.
+    the molecular formula) are kept apart from the numeric matrix.
+    """
+
+    def __init__(self, name: str, functions: dict = None, vector=None, vector_columns: list = None,
+                 integer_columns: list = (), text_columns: list = ()):
+        self.name = name
+        self.functions = functions
+        self.vector = vector
+        self.text_columns = list(text_columns)
+        if functions is not None:
+            self.columns = [column for column in functions if column not in self.text_columns]
+        else:
+            self.columns = list(vector_columns)
+        self.integer_columns = set(self.columns if integer_columns is True else integer_columns)
+
+    def _values(self, mol) -> dict:
+        return {name: fn(mol) for name, fn in self.functions.items()}
+
+    def _row(self, values: dict) -> tuple:
+        return (np.array([values[column] for column in self.columns], dtype=np.float64),
+                [values[column] for column in self.text_columns])
+
+    def compute(self, smiles: str):
+        """
+        Return (numeric row, text values) for a SMILES, None when it cannot be
+        parsed. Scalar sets go through the shared mol cache.
+        """
+        if self.vector is not None:
+            mol = mol_cache.get_mol(smiles)
+            if mol is None:
+                return None
+            return self.compute_mol(mol)
+        values = mol_cache.get_descriptors(smiles, self.name, self._values)
+        if values is None:
+            return None
+        return self._row(values)
+
+    def compute_mol(self, mol) -> tuple:
+        """
+        Return (numeric row, text values) for a parsed molecule, uncached.
+        """
+        if self.vector is not None:
+            return np.asarray(self.vector(mol), dtype=np.float64), []
+        return self._row(self._values(mol))
+
+
+_morgan_generator = threading.local()
+
+
+def morgan_counts(mol) -> np.ndarray:
+    if not hasattr(_morgan_generator, "value"):
+        _morgan_generator.value = rdFingerprintGenerator.GetMorganGenerator(
+            radius=MORGAN_COUNT_RADIUS, fpSize=MORGAN_COUNT_BITS)
+    return _morgan_generator.value.GetCountFingerprintAsNumPy(mol)
+
+
+DESCRIPTOR_SETS = {
+    "basic": DescriptorSet("basic", BASIC_DESCRIPTORS,
+                           integer_columns=["Heavy Atoms Count", "H Bond Donor Count",
+                                            "H Bond Acceptor Count", "Rotatable Bonds Count",
+                                            "Number of Rings"],
+                           text_columns=["Molecular Formula"]),
+    "lipinski": DescriptorSet("lipinski", LIPINSKI_DESCRIPTORS,
+                              integer_columns=["NumHDonors", "NumHAcceptors",
+                                               "NumRotatableBonds", "Lipinski Violations"]),
+    "rdkit": DescriptorSet("rdkit", dict(Descriptors._descList)),
+    "morgan_counts": DescriptorSet("morgan_counts", vector=morgan_counts,
+                                   vector_columns=[f"morgan_{i}" for i in range(MORGAN_COUNT_BITS)],
+                                   integer_columns=True),
+}
+
+
+class DescriptorTable():
+    """
+    Descriptors of many molecules: a float64 `values` matrix with one row per
+    input SMILES and one column per numeric descriptor (NaN on rows that
+    failed), the text columns, and the per-row `error_mask` / `errors`.
+    """
+
+    def __init__(self, smiles: list, sets: list, values: np.ndarray, text: dict, errors: list):
+        self.smiles = smiles
+        self.sets = sets
+        # a column several sets share (e.g. TPSA) is named <set>.<column> after its first occurrence
+        self.columns = []
+        for name in sets:
+            for column in DESCRIPTOR_SETS[name].columns:
+                self.columns.append(f"{name}.{column}" if column in self.columns else column)
+        self.values = values
+        self.text = text
+        self.errors = errors
+        self.error_mask = np.array([error is not None for error in errors], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.smiles)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, self.columns.index(name)]
+
+    def to_columns(self) -> dict:
+        """
+        JSON friendly {column: [value, ...]}, text columns first, with None on
+        failed rows and integer descriptors as ints.
+        """
+        integer_columns = set().union(*(DESCRIPTOR_SETS[name].integer_columns for name in self.sets))
+        integer_columns |= {f"{name}.{column}" for name in self.sets
+                            for column in DESCRIPTOR_SETS[name].integer_columns}
+        columns = dict(self.text)
+        valid = ~self.error_mask
+        for i, name in enumerate(self.columns):
+            values = self.values[:, i]
+            if name in integer_columns:
+                converted = [int(v) for v in values[valid]]
+            else:
+                converted = [None if np.isnan(v) else float(v) for v in values[valid]]
+            converted = iter(converted)
+            columns[name] = [next(converted) if ok else None for ok in valid]
+        return columns
+
+    def to_arrow(self):
+        if pa is None:
+            raise ImportError("Arrow output needs pyarrow, install it with `pip install pyarrow`")
+        mask = self.error_mask
+        arrays = {"smiles": pa.array(self.smiles)}
+        for name, values in self.text.items():
+            arrays[name] = pa.array(values)
+        for i, name in enumerate(self.columns):
+            arrays[name] = pa.array(self.values[:, i], mask=mask)
+        arrays["error"] = pa.array(self.errors)
+        return pa.table(arrays)
+
+
+def _table_chunk(smiles_chunk: list, sets: list) -> tuple:
+    """
+    Compute the descriptor sets of a chunk of SMILES. Returns the chunk's
+    values matrix, its text columns and one error (or None) per SMILES.
+
+    Bulk screens bypass the shared mol cache: it is bounded by entries, not
+    bytes, and a few hundred thousand rows of the "rdkit" set would fill it
+    in every pool worker with values that are never looked up again.
+    """
+    RDLogger.DisableLog("rdApp.*")
+    descriptor_sets = [DESCRIPTOR_SETS[name] for name in sets]
+    width = sum(len(descriptor_set.columns) for descriptor_set in descriptor_sets)
+    values = np.full((len(smiles_chunk), width), np.nan, dtype=np.float64)
+    text = {column: [None] * len(smiles_chunk)
+            for descriptor_set in descriptor_sets for column in descriptor_set.text_columns}
+    errors = [None] * len(smiles_chunk)
+    for row, smiles in enumerate(smiles_chunk):
+        try:
+            mol = Chem.MolFromSmiles(smiles.strip())
+            if mol is None:
+                raise ValueError("Invalid SMILES")
+            offset = 0
+            for descriptor_set in descriptor_sets:
+                numeric, text_values = descriptor_set.compute_mol(Chem.Mol(mol))
+                values[row, offset:offset + len(numeric)] = numeric
+                offset += len(numeric)
+                for column, value in zip(descriptor_set.text_columns, text_values):
+                    text[column][row] = value
+        except Exception as e:
+            values[row] = np.nan
+            for column in text:
+                text[column][row] = None
+            errors[row] = str(e)
+    return values, text, errors
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=DESCRIPTOR_WORKERS)
+        return _pool
+
+
+def shutdown_descriptor_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def compute_descriptor_table(smiles_list: list, sets: list = ("basic",),
+                             chunk_size: int = DESCRIPTOR_CHUNK_SIZE,
+                             workers: int = None) -> DescriptorTable:
+    """
+    Compute the named descriptor sets of many SMILES, in chunks across the
+    worker pool (inline when everything fits in one chunk or `workers` is 1).
+    Raises ValueError for unknown set names.
+    """
+    sets = list(dict.fromkeys(sets))
+    unknown = [name for name in sets if name not in DESCRIPTOR_SETS]
+    if unknown:
+        raise ValueError(f"Unknown descriptor sets {unknown}, expected any of {list(DESCRIPTOR_SETS)}")
+    workers = DESCRIPTOR_WORKERS if workers is None else workers
+    chunks = [smiles_list[i:i + chunk_size] for i in range(0, len(smiles_list), chunk_size)]
+    if len(chunks) <= 1 or workers <= 1:
+        parts = [_table_chunk(chunk, sets) for chunk in chunks]
+    elif workers == DESCRIPTOR_WORKERS:
+        parts = list(_get_pool().map(_table_chunk, chunks, [sets] * len(chunks)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_table_chunk, chunks, [sets] * len(chunks)))
+    width = sum(len(DESCRIPTOR_SETS[name].columns) for name in sets)
+    values = np.vstack([part[0] for part in parts]) if parts else np.empty((0, width))
+    text = {column: [value for part in parts for value in part[1][column]]
+            for name in sets for column in DESCRIPTOR_SETS[name].text_columns}
+    errors = [error for part in parts for error in part[2]]
+    return DescriptorTable(list(smiles_list), sets, values, text, errors)
+
+
+def compute_descriptor_columns(smiles_list: list, sets: list = ("basic",),
+                               chunk_size: int = DESCRIPTOR_CHUNK_SIZE) -> dict:
+    """
+    Compute descriptor sets of many SMILES and return them column-wise:
+    {"columns": {name: [value, ...]}, "error_mask": [bool, ...],
+    "errors": [message or None, ...]}, all in input order, with None in
+    every column of a row that failed.
+    """
+    table = compute_descriptor_table(smiles_list, sets, chunk_size)
+    return {
+        "columns": table.to_columns(),
+        "error_mask": table.error_mask.tolist(),
+        "errors": table.errors
+    }
@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from rdkit import Chem
+
+_BRACKET_OR_WILDCARD = re.compile(r"\[[^\]]*\]|\*")
+
+
+def canonical_smiles_from_mol(mol) -> str:
+    """
+    Write a molecule as canonical SMILES, with bare wildcard atoms as `[*]`
+    so canonical PSMILES keep the notation polyBERT was trained on.
+    """
+    canonical = Chem.MolToSmiles(mol)
+    return _BRACKET_OR_WILDCARD.sub(
+        lambda m: "[*]" if m.group(0) == "*" else m.group(0), canonical)
+
+
+def canonicalize_smiles(smiles: str) -> str:
+    """
+    Return the RDKit canonical form of a SMILES or PSMILES string.
+
+    Strings RDKit cannot parse are returned stripped, so they still get a
+    stable (if not canonical) cache key.
+    """
+    smiles = smiles.strip()
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return smiles
+    return canonical_smiles_from_mol(mol)
+
+
+def record_id(canonical: str) -> str:
+    """
+    Id of a canonical SMILES/PSMILES in the similarity collections.
+    """
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore():
+    """
+    Append-only on-disk embedding store.
+
+    Vectors live in a memory-mapped float32 matrix (`embeddings.f32`) and the
+    row of every key is recorded in a tab separated index (`keys.tsv`). The
+    matrix doubles its capacity when it runs full. Writers in different
+    processes (e.g. several uvicorn workers sharing one directory) take an
+    exclusive lock on `store.lock` and catch up with the rows the others
+    appended before writing theirs; within a process `EmbeddingCache`
+    serializes access.
+    """
+
+    def __init__(self, path: str, initial_capacity: int = 1024):
+        self.path = path
+        self.initial_capacity = initial_capacity
+        self.matrix_path = os.path.join(path, "embeddings.f32")
+        self.index_path = os.path.join(path, "keys.tsv")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock_path = os.path.join(path, "store.lock")
+        self.dim = None
+        self.capacity = 0
+        self.index = {}
+        self._matrix = None
+        # bytes of keys.tsv already read into the index
+        self._index_offset = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["capacity"] != self.capacity:
+            self.dim = meta["dim"]
+            self.capacity = meta["capacity"]
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+",
+                                     shape=(self.capacity, self.dim))
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # a line still being written by another process is picked up next time
+        complete = data[:data.rfind(b"\n") + 1]
+        self._index_offset += len(complete)
+        for line in complete.decode("utf-8").splitlines():
+            key, _, row = line.rpartition("\t")
+            if key:
+                self.index[key] = int(row)
+
+    def _write_meta(self):
+        with open(self.meta_path, "w") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity}, f)
+
+    def _grow(self, capacity: int):
+        if self._matrix is not None:
+            self._matrix.flush()
+            del self._matrix
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(capacity * self.dim * np.dtype(np.float32).itemsize)
+        self.capacity = capacity
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+",
+                                 shape=(self.capacity, self.dim))
+        self._write_meta()
+
+    def __contains__(self, key: str):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, key: str):
+        row = self.index.get(key)
+        if row is None:
+            return None
+        return np.array(self._matrix[row])
+
+    def put(self, key: str, vector):
+        if key in self.index:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # rows and growth written by other processes since the last put
+                self._load()
+                if key in self.index:
+                    return
+                if self.dim is None:
+                    self.dim = int(vector.shape[0])
+                    self._grow(self.initial_capacity)
+                if len(self.index) >= self.capacity:
+                    self._grow(self.capacity * 2)
+                row = len(self.index)
+                self._matrix[row] = vector
+                self._matrix.flush()
+                with open(self.index_path, "a") as f:
+                    f.write(f"{key}\t{row}\n")
+                    self._index_offset = f.tell()
+                self.index[key] = row
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def flush(self):
+        if self._matrix is not None:
+            self._matrix.flush()
+
+
+class EmbeddingCache():
+    """
+    Two-tier embedding cache keyed by canonical SMILES/PSMILES.
+
+    The first tier is an in-memory LRU bounded to `max_entries` vectors, the
+    optional second tier a `DiskEmbeddingStore` that survives restarts. Disk
+    hits are promoted into memory. Hit and miss counters are available through
+    `stats()` to size the cache.
+    """
+
+    def __init__(self, max_entries: int = 10000, disk_store: DiskEmbeddingStore = None):
+        self.max_entries = max_entries
+        self.disk_store = disk_store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+            if self.disk_store is not None:
+                vector = self.disk_store.get(key)
+                if vector is not None:
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self.disk_store is not None:
+                self.disk_store.put(key, vector)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_entries": len(self.disk_store) if self.disk_store is not None else 0,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
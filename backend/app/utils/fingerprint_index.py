@@ -0,0 +1,245 @@
+import os
+import json
+import threading
+import numpy as np
+from rdkit import Chem, RDLogger
+from rdkit.Chem import rdFingerprintGenerator
+
+FINGERPRINT_STORE_PATH = "./dist/fingerprint_store"
+MORGAN_RADIUS = 2
+MORGAN_N_BITS = 2048
+
+# popcount of every possible byte, used when numpy has no bitwise_count (< 2.0)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_generators = threading.local()
+
+
+def _morgan_generator(radius: int, n_bits: int):
+    # fingerprint generators are not thread-safe, keep one per thread
+    key = (radius, n_bits)
+    cache = getattr(_generators, "cache", None)
+    if cache is None:
+        cache = _generators.cache = {}
+    if key not in cache:
+        cache[key] = rdFingerprintGenerator.GetMorganGenerator(
+            radius=radius, fpSize=n_bits)
+    return cache[key]
+
+
+def morgan_fingerprint(mol, radius: int = MORGAN_RADIUS, n_bits: int = MORGAN_N_BITS) -> np.ndarray:
+    """
+    Return the Morgan fingerprint of a molecule packed into n_bits / 8 bytes.
+    """
+    bits = _morgan_generator(radius, n_bits).GetFingerprintAsNumPy(mol)
+    return np.packbits(bits.astype(np.uint8))
+
+
+def popcount_rows(packed: np.ndarray) -> np.ndarray:
+    """
+    Count the set bits of every row of a packed (N, n_bytes) uint8 matrix.
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT_TABLE[packed].sum(axis=1, dtype=np.int32)
+
+
+class FingerprintIndexWriter():
+    """
+    Streams fingerprints into a `FingerprintIndex` directory.
+
+    Packed fingerprints are appended to `fingerprints.u8`, their bit counts to
+    `counts.i32` and the SMILES to `smiles.txt`. `meta.json` records how many
+    rows are complete and is rewritten by `commit()`; reopening with
+    `append=True` drops any rows written after the last commit, or after the
+    first `count` rows when given (rows `flush()`ed but not yet committed).
+    """
+
+    def __init__(self, path: str,
+                 radius: int = MORGAN_RADIUS,
+                 n_bits: int = MORGAN_N_BITS,
+                 append: bool = False,
+                 count: int = None):
+        self.path = path
+        self.radius = radius
+        self.n_bits = n_bits
+        os.makedirs(path, exist_ok=True)
+        self.count = 0
+        fingerprints_path = os.path.join(path, "fingerprints.u8")
+        counts_path = os.path.join(path, "counts.i32")
+        smiles_path = os.path.join(path, "smiles.txt")
+        if append and os.path.exists(os.path.join(path, "meta.json")):
+            meta = FingerprintIndex.read_meta(path)
+            if (meta["radius"], meta["n_bits"]) != (radius, n_bits):
+                raise ValueError(
+                    f"Index at {path} uses radius {meta['radius']} / {meta['n_bits']} bits")
+            self.count = meta["count"] if count is None else count
+            self._truncate(fingerprints_path, counts_path, smiles_path)
+            self._fingerprints = open(fingerprints_path, "ab")
+            self._counts = open(counts_path, "ab")
+            self._smiles = open(smiles_path, "a")
+        else:
+            self._fingerprints = open(fingerprints_path, "wb")
+            self._counts = open(counts_path, "wb")
+            self._smiles = open(smiles_path, "w")
+
+    def _truncate(self, fingerprints_path: str, counts_path: str, smiles_path: str):
+        with open(fingerprints_path, "r+b") as f:
+            f.truncate(self.count * (self.n_bits // 8))
+        with open(counts_path, "r+b") as f:
+            f.truncate(self.count * np.dtype(np.int32).itemsize)
+        with open(smiles_path, "r+b") as f:
+            for _ in range(self.count):
+                f.readline()
+            f.truncate()
+
+    def add_packed(self, smiles: str, packed: np.ndarray):
+        self._fingerprints.write(packed.tobytes())
+        self._counts.write(popcount_rows(packed[None, :]).tobytes())
+        self._smiles.write(smiles + "\n")
+        self.count += 1
+
+    def add_mol(self, smiles: str, mol):
+        self.add_packed(smiles, morgan_fingerprint(mol, self.radius, self.n_bits))
+
+    def add(self, smiles: str) -> bool:
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            return False
+        self.add_mol(smiles, mol)
+        return True
+
+    def flush(self):
+        # rows reach the files, meta.json still holds the last committed count
+        self._fingerprints.flush()
+        self._counts.flush()
+        self._smiles.flush()
+
+    def smiles(self) -> list:
+        """
+        SMILES of the rows written so far, flushed first.
+        """
+        self.flush()
+        with open(os.path.join(self.path, "smiles.txt"), "r") as f:
+            return [line.rstrip("\n") for _, line in zip(range(self.count), f)]
+
+    def commit(self):
+        self.flush()
+        meta_path = os.path.join(self.path, "meta.json")
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump({"radius": self.radius, "n_bits": self.n_bits,
+                       "count": self.count}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def close(self):
+        self.commit()
+        self._fingerprints.close()
+        self._counts.close()
+        self._smiles.close()
+
+
+class FingerprintIndex():
+    """
+    Read-only Morgan fingerprint library answering top-k Tanimoto queries.
+
+    The packed fingerprints are memory-mapped, so every process serving the
+    same library shares its pages, and a query is a vectorized AND + popcount
+    over the whole matrix, processed in row chunks to bound temporaries.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = 1 << 16):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        meta = self.read_meta(path)
+        self.radius = meta["radius"]
+        self.n_bits = meta["n_bits"]
+        self.count = meta["count"]
+        n_bytes = self.n_bits // 8
+        if self.count:
+            self.fingerprints = np.memmap(os.path.join(path, "fingerprints.u8"),
+                                          dtype=np.uint8, mode="r",
+                                          shape=(self.count, n_bytes))
+            self.counts = np.memmap(os.path.join(path, "counts.i32"),
+                                    dtype=np.int32, mode="r", shape=(self.count,))
+        else:
+            self.fingerprints = np.zeros((0, n_bytes), dtype=np.uint8)
+            self.counts = np.zeros((0,), dtype=np.int32)
+        with open(os.path.join(path, "smiles.txt"), "r") as f:
+            self.smiles = [line.rstrip("\n") for _, line in zip(range(self.count), f)]
+
+    @staticmethod
+    def read_meta(path: str) -> dict:
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            return json.load(f)
+
+    @classmethod
+    def build(cls, path: str, smiles_list,
+              radius: int = MORGAN_RADIUS, n_bits: int = MORGAN_N_BITS):
+        RDLogger.DisableLog("rdApp.*")
+        writer = FingerprintIndexWriter(path, radius=radius, n_bits=n_bits)
+        for smiles in smiles_list:
+            writer.add(smiles)
+        writer.close()
+        return cls(path)
+
+    def __len__(self):
+        return self.count
+
+    def fingerprint(self, smiles: str) -> np.ndarray:
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            raise ValueError(f"Invalid SMILES: {smiles}")
+        return morgan_fingerprint(mol, self.radius, self.n_bits)
+
+    def similarities(self, query_fp: np.ndarray, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Tanimoto similarity of a packed query fingerprint against rows [start, stop).
+        """
+        rows = self.fingerprints[start:stop]
+        query_count = int(popcount_rows(query_fp[None, :])[0])
+        common = popcount_rows(np.bitwise_and(rows, query_fp))
+        union = self.counts[start:stop] + query_count - common
+        return np.divide(common, union, out=np.zeros(len(rows), dtype=np.float64),
+                         where=union > 0)
+
+    def top_k(self, smiles: str, k: int = 5):
+        """
+        Return the k most similar library rows as (row indices, similarities),
+        best first.
+        """
+        query_fp = self.fingerprint(smiles)
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float64)
+        for start in range(0, self.count, self.chunk_rows):
+            scores = self.similarities(query_fp, start, start + self.chunk_rows)
+            if len(scores) > k:
+                keep = np.argpartition(-scores, k - 1)[:k]
+            else:
+                keep = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, keep + start])
+            best_scores = np.concatenate([best_scores, scores[keep]])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores, kind="stable")
+        return best_rows[order], best_scores[order]
+
+    def query(self, query_val: str, top_k: int = 3):
+        """
+        Same result layout as a single Chroma query. The distance of every hit
+        is 1 - Tanimoto similarity, so lower is closer as with polyBERT.
+        """
+        rows, scores = self.top_k(query_val, top_k)
+        return {
+            "ids": [[str(row) for row in rows]],
+            "metadatas": [[{"smiles": self.smiles[row]} for row in rows]],
+            "distances": [[float(1.0 - score) for score in scores]]
+        }
+
+    def query_batch(self, query_vals: list, top_k: int = 3):
+        results = {"ids": [], "metadatas": [], "distances": []}
+        for query_val in query_vals:
+            single = self.query(query_val, top_k)
+            for key in results:
+                results[key].append(single[key][0])
+        return results
@@ -1,13 +1,139 @@
 from rdkit import Chem
 from rdkit.Chem import Draw
-from rdkit.Chem.BRICS import BRICSDecompose, BRICSBuild
+from rdkit.Chem.BRICS import BRICSBuild
+import os
+import time
 import random
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from app.utils.mol_cache import mol_cache
+from .fragment_store import fragment_store, FragmentLibrary
+
+# enumeration budgets of the BRICS tools; BRICSBuild's own default depth is 3
+BRICS_MAX_CANDIDATES = int(os.environ.get("BRICS_MAX_CANDIDATES", 1000))
+BRICS_MAX_DEPTH = int(os.environ.get("BRICS_MAX_DEPTH", 3))
+BRICS_TIME_BUDGET_S = float(os.environ.get("BRICS_TIME_BUDGET_S", 30))
+# processes of the sharded enumeration, 1 builds in the calling process
+BRICS_WORKERS = int(os.environ.get("BRICS_WORKERS", min(8, os.cpu_count() or 1)))
+# below this many fragments the pool overhead outweighs the sharding
+BRICS_PARALLEL_MIN_FRAGMENTS = int(os.environ.get("BRICS_PARALLEL_MIN_FRAGMENTS", 8))
+# shards per worker and phase, more shards balance the very uneven cost of seeds
+BRICS_SHARDS_PER_WORKER = 4
+# attachment points left on a BRICS product mark it as an intermediate
+_DUMMY_PATTERN = Chem.MolFromSmiles("[*]")
+
+
+def _enumerate(mol_list: list, seeds, max_candidates: int, max_depth: int, deadline: float, accept,
+               intermediates: list = None) -> tuple:
+  """
+  Lazily consume BRICSBuild until it is exhausted or a budget is hit.
+  Returns (accepted complete products, truncated). With `intermediates`,
+  the products that still carry attachment points are appended to it as
+  SMILES instead of being dropped (only meaningful with max_depth 0).
+  """
+  build = []
+  truncated = False
+  products = BRICSBuild(mol_list, seeds=seeds, maxDepth=max_depth,
+                        onlyCompleteMols=intermediates is None)
+  try:
+    for mol in products:
+      if deadline is not None and time.monotonic() > deadline:
+        truncated = True
+        break
+      smiles = Chem.MolToSmiles(mol)
+      if intermediates is not None and mol.HasSubstructMatch(_DUMMY_PATTERN):
+        intermediates.append(smiles)
+        continue
+      if accept is not None and not accept(smiles):
+        continue
+      if max_candidates is not None and len(build) >= max_candidates:
+        truncated = True
+        break
+      build.append(smiles)
+  finally:
+    products.close()
+  return build, truncated
+
+
+# fragment sets parsed by a pool worker, every shard of a build reuses them
+_worker_fragments = {}
+
+
+def _fragment_mols(fragments: tuple) -> list:
+  mol_list = _worker_fragments.get(fragments)
+  if mol_list is None:
+    # a handful of recent builds, parsed outside the worker's mol cache
+    if len(_worker_fragments) >= 4:
+      _worker_fragments.clear()
+    mol_list = _worker_fragments[fragments] = [Chem.MolFromSmiles(fragment) for fragment in fragments]
+  return mol_list
+
+
+def _first_level_shard(fragments: tuple, seed_indices: list, max_candidates: int,
+                       deadline: float, accept, random_seed: int) -> tuple:
+  # runs in a pool worker; the monotonic clock is shared by all processes of the host
+  random.seed(random_seed)
+  mol_list = _fragment_mols(fragments)
+  intermediates = []
+  build, truncated = _enumerate(mol_list, [mol_list[i] for i in seed_indices],
+                                max_candidates, 0, deadline, accept, intermediates)
+  return build, truncated, intermediates
+
+
+def _deep_shard(fragments: tuple, seeds: list, max_candidates: int, max_depth: int,
+                deadline: float, accept, random_seed: int) -> tuple:
+  random.seed(random_seed)
+  return _enumerate(_fragment_mols(fragments), [Chem.MolFromSmiles(seed) for seed in seeds],
+                    max_candidates, max_depth, deadline, accept)
+
+
+def _iter_shards(pool: ProcessPoolExecutor, shard_fn, shard_args, window: int):
+  # a bounded window of shards in flight, results come back in submission order;
+  # closing the generator early cancels the shards that have not started
+  pending = deque()
+  try:
+    for args in shard_args:
+      pending.append(pool.submit(shard_fn, *args))
+      if len(pending) >= window:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+  finally:
+    for future in pending:
+      future.cancel()
+
+
+# one pool per worker count, so benchmarks and non-default counts do not pay a start-up per call
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int = None) -> ProcessPoolExecutor:
+  workers = workers or BRICS_WORKERS
+  with _pool_lock:
+    pool = _pools.get(workers)
+    if pool is None:
+      pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return pool
+
+
+def shutdown_brics_pool():
+  with _pool_lock:
+    for pool in _pools.values():
+      pool.shutdown(wait=False, cancel_futures=True)
+    _pools.clear()
+
 
 class BRICSGenerator():
-  def __init__(self, random_seed = 99, verbose=False):
+  def __init__(self, random_seed = 99, verbose=False, store=None, workers=1):
     self.input_types = ["smiles", "psmiles"]
     self.random_seed = random_seed
     self.verbose = verbose
+    # decompositions are memoized per canonical SMILES in the shared fragment store
+    self.store = store if store is not None else fragment_store
+    # with more than one worker the enumeration is sharded by seed fragment across processes
+    self.workers = workers
 
   def _BRICS_decompose(self, smiles_list: list):
     break_repo = []
@@ -15,9 +141,7 @@ class BRICSGenerator():
       print(f"[+] Incoming molecules ...")
     #   display(Draw.MolsToGridImage([Chem.MolFromSmiles(b) for b in smiles_list], molsPerRow=5, subImgSize=(200, 200)))
       print(f"[+] Decomposing the molecules ...")
-    for smiles in smiles_list:
-      mol = Chem.MolFromSmiles(smiles)
-      dec = list(BRICSDecompose(mol))
+    for dec in self.store.decompose_many(smiles_list):
       break_repo.extend(dec)
     if self.verbose:
       print(f"[+] Decomposed the molecules ...")
@@ -25,16 +149,105 @@ class BRICSGenerator():
     return break_repo
 
 
-  def _BRICS_build(self, decomposed_list: list):
-    mol_list = [Chem.MolFromSmiles(dec) for dec in decomposed_list]
+  def build_fragment_library(self, smiles_list: list):
+    # deduplicated fragments of the inputs, with the number of inputs each came from
+    return self.store.build_library(smiles_list)
+
+  def _BRICS_build(self, decomposed_list, max_candidates: int = None, max_depth: int = BRICS_MAX_DEPTH,
+                   time_budget_s: float = None, accept=None):
+    """
+    Enumerate BRICS products of the fragments lazily, stopping once
+    `max_candidates` products were accepted or `time_budget_s` has passed
+    (checked between products). `accept(smiles)` filters products as they
+    come, so only accepted ones count towards the budget. Returns
+    (SMILES list, truncated), truncated telling whether a budget cut the
+    enumeration short.
+    """
+    # a list of fragments, a FragmentLibrary or the name of a saved library
+    if isinstance(decomposed_list, str):
+      decomposed_list = self.store.load_library(decomposed_list)
+    if isinstance(decomposed_list, FragmentLibrary):
+      decomposed_list = decomposed_list.fragments
     if self.verbose:
       print(f"[+] Building the molecules ...")
-    build = list(BRICSBuild(mol_list))
-    random.seed(self.random_seed)
+    deadline = time.monotonic() + time_budget_s if time_budget_s is not None else None
+    if self.workers > 1 and len(decomposed_list) >= BRICS_PARALLEL_MIN_FRAGMENTS:
+      build, truncated = self._BRICS_build_parallel(list(decomposed_list), max_candidates, max_depth,
+                                                    deadline, accept)
+    else:
+      # BRICSBuild shuffles its reagents, seed first so budgeted runs are reproducible
+      random.seed(self.random_seed)
+      mol_list = [mol_cache.get_mol(dec) for dec in decomposed_list]
+      build, truncated = _enumerate(mol_list, None, max_candidates, max_depth, deadline, accept)
     if self.verbose:
-      print(f"[+] Built the molecules ...")
+      print(f"[+] Built {len(build)} molecules{' (truncated)' if truncated else ''} ...")
     #   display(Draw.MolsToGridImage(build, molsPerRow=5, subImgSize=(400, 400)))
-    return [Chem.MolToSmiles(mol) for mol in build]
+    return build, truncated
+
+  def _BRICS_build_parallel(self, fragments: list, max_candidates: int, max_depth: int,
+                            deadline: float, accept) -> tuple:
+    """
+    Sharded BRICSBuild in two phases across the process pool. First every
+    fragment is joined once with every other one, the seed fragments split
+    across the workers; this yields the complete products of the first
+    level and the intermediates that still have attachment points. The
+    intermediates are deduplicated, as one BRICSBuild call would do, and
+    split again across the workers to be built `max_depth - 1` levels
+    further. This yields exactly the products of a sequential build.
+
+    Every shard enforces the candidate and time budgets itself. Shard
+    results are merged in shard order as they come back, deduplicated by
+    canonical SMILES, and once more than `max_candidates` are merged the
+    shards not yet started are cancelled, so a budgeted build stops early
+    and its result does not depend on shard timing. `accept` must be
+    picklable.
+    """
+    pool = _get_pool(self.workers)
+    n_shards = self.workers * BRICS_SHARDS_PER_WORKER
+    window = self.workers * 2
+    fragments = tuple(fragments)
+    merged = {}
+    truncated = False
+
+    def full() -> bool:
+      return max_candidates is not None and len(merged) > max_candidates
+
+    # seeds are dealt round robin, so fragments of one source land on different shards
+    seed_shards = [list(range(i, len(fragments), n_shards)) for i in range(min(n_shards, len(fragments)))]
+    intermediates = {}
+    results = _iter_shards(pool, _first_level_shard,
+                           ((fragments, shard, max_candidates, deadline, accept, self.random_seed)
+                            for shard in seed_shards), window)
+    try:
+      for build, shard_truncated, shard_intermediates in results:
+        merged.update(dict.fromkeys(build))
+        intermediates.update(dict.fromkeys(shard_intermediates))
+        truncated = truncated or shard_truncated
+        if full():
+          break
+    finally:
+      results.close()
+    if max_depth > 0 and intermediates and not truncated and not full():
+      # contiguous runs of intermediates mostly share a seed, and with it deeper intermediates
+      # that one BRICSBuild call deduplicates
+      intermediates = list(intermediates)
+      size = -(-len(intermediates) // n_shards)
+      results = _iter_shards(pool, _deep_shard,
+                             ((fragments, intermediates[i:i + size], max_candidates, max_depth - 1,
+                               deadline, accept, self.random_seed)
+                              for i in range(0, len(intermediates), size)), window)
+      try:
+        for build, shard_truncated in results:
+          merged.update(dict.fromkeys(build))
+          truncated = truncated or shard_truncated
+          if full():
+            break
+      finally:
+        results.close()
+    build = list(merged)
+    if max_candidates is not None and len(build) > max_candidates:
+      build, truncated = build[:max_candidates], True
+    return build, truncated
 
   def replace_wildcards_with_vatoms(self, psmiles_list: list):
     mod_list = []
@@ -55,60 +268,64 @@ class BRICSGenerator():
       mod_list.append(psmiles.replace("[At]", "[*]"))
     return mod_list
 
+  @staticmethod
+  def is_polymer_candidate(smiles: str):
+    return smiles.count("[At]") >= 2
+
   def filter_candidates(self, gen_mol_list: list):
-    filtered_mols = list(filter(lambda mol: mol.count("[At]") >= 2, gen_mol_list))
+    filtered_mols = list(filter(self.is_polymer_candidate, gen_mol_list))
     if self.verbose:
       print(f"[+] Filtering the molecules ...")
     #   display(Draw.MolsToGridImage([Chem.MolFromSmiles(b) for b in filtered_mols], molsPerRow=5, subImgSize=(200, 200)))
     return filtered_mols
 
-  def generate(self, smiles_list: list, is_polymer: bool = False):
+  def generate(self, smiles_list: list, is_polymer: bool = False, max_candidates: int = None,
+               max_depth: int = BRICS_MAX_DEPTH, time_budget_s: float = None):
+    """
+    Returns (candidates, count, truncated). Polymer candidates are filtered
+    while enumerating, so `max_candidates` bounds the valid ones.
+    """
     if is_polymer:
         smiles_list = self.replace_wildcards_with_vatoms(smiles_list)
-    decomposed_list = self._BRICS_decompose(smiles_list)
-    built_atoms_w_vatoms = self._BRICS_build(decomposed_list)
-    if is_polymer:
-        filtered_mols= self.filter_candidates(built_atoms_w_vatoms)
-    else :
-        filtered_mols = built_atoms_w_vatoms
+    library = self.build_fragment_library(smiles_list)
+    filtered_mols, truncated = self._BRICS_build(library, max_candidates, max_depth, time_budget_s,
+                                                 accept=self.is_polymer_candidate if is_polymer else None)
     if self.verbose:
       print(f"[+] total {len(filtered_mols)} are created in the process !")
     if is_polymer:
         filtered_mols = self.replace_vatoms_with_wildcards(filtered_mols)
-    return filtered_mols, len(filtered_mols)
+    return filtered_mols, len(filtered_mols), truncated
         
 
-  def stream_generate(self, smiles_list: list, is_polymer: bool = False):
+  def stream_generate(self, smiles_list: list, is_polymer: bool = False, max_candidates: int = None,
+                      max_depth: int = BRICS_MAX_DEPTH, time_budget_s: float = None):
     try:
       if is_polymer:
           smiles_list = self.replace_wildcards_with_vatoms(smiles_list)
-      decomposed_list = self._BRICS_decompose(smiles_list)
-      print("decomposed_list", decomposed_list)
+      library = self.build_fragment_library(smiles_list)
+      print("decomposed_list", library.fragments)
       yield {
           "type": "signal",
           "step" : "decomposition",
-          "data": len(decomposed_list)
+          "data": len(library)
       }
-      built_atoms_w_vatoms = self._BRICS_build(decomposed_list)
+      filtered_mols, truncated = self._BRICS_build(library, max_candidates, max_depth, time_budget_s,
+                                                   accept=self.is_polymer_candidate if is_polymer else None)
       yield {
           "type": "signal",
           "step" : "composition",
-          "data": len(built_atoms_w_vatoms)
+          "data": len(filtered_mols)
       }
-      print("composed_list", built_atoms_w_vatoms)
-      if is_polymer:
-          filtered_mols= self.filter_candidates(built_atoms_w_vatoms)
+      print("composed_list", filtered_mols)
       if self.verbose:
         print(f"[+] total {len(filtered_mols)} are created in the process !")
       if is_polymer:
           filtered_mols = self.replace_vatoms_with_wildcards(filtered_mols)
-      else:
-          filtered_mols = built_atoms_w_vatoms
 
       yield {
           "type": "completed",
           "step" : "completed",
-          "data": [filtered_mols, len(filtered_mols)]
+          "data": [filtered_mols, len(filtered_mols), truncated]
         }
     except Exception as e:
       yield {
@@ -116,4 +333,3 @@ class BRICSGenerator():
           "step": "error",
           "data": str(e)
       }
- 
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+Memoized BRICS decompositions and reusable fragment libraries.
+
+Decompositions are keyed by canonical SMILES (PSMILES come in with their
+wildcards already replaced by virtual atoms), held in an in-process LRU in
+front of an SQLite store, so a seed set decomposed once is never
+decomposed again, even across restarts. A `FragmentLibrary` is the
+deduplicated union of the fragments of many molecules with, for every
+fragment, the number of source molecules it came from; libraries can be
+saved under a name and handed to `BRICSGenerator._BRICS_build` directly.
+Saved libraries live in their own table of the same file, outside the
+byte-bounded decomposition cache, and are never evicted.
+
+Build and save a library from a file of seeds, from the backend directory:
+
+    python -m app.utils.generators.fragment_store seeds.smi --name kinase_seeds
+    python -m app.utils.generators.fragment_store polymers.smi --name polymer_seeds --psmiles
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+from rdkit.Chem.BRICS import BRICSDecompose
+from app.utils.mol_cache import mol_cache
+from app.utils.pdb_cache import PersistentCache
+
+FRAGMENT_STORE_PATH = os.environ.get("FRAGMENT_STORE_PATH", "./dist/brics_fragments.sqlite3")
+FRAGMENT_STORE_ENABLED = os.environ.get("FRAGMENT_STORE_ENABLED", "1") != "0"
+FRAGMENT_STORE_MAX_BYTES = int(os.environ.get("FRAGMENT_STORE_MAX_BYTES", 64 * 2**20))
+FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 5000))
+
+
+class FragmentLibrary():
+    """
+    Deduplicated BRICS fragments, in the order they were first seen, with
+    the number of distinct source molecules each one came from.
+    """
+
+    def __init__(self, counts: dict = None, sources: list = None):
+        self.counts = dict(counts or {})
+        self.sources = list(sources or [])
+        self._seen = set(self.sources)
+
+    @property
+    def fragments(self) -> list:
+        return list(self.counts)
+
+    def add(self, source: str, fragments: list):
+        # a source given twice (e.g. the same seed spelled differently) counts once
+        if source in self._seen:
+            return
+        self._seen.add(source)
+        self.sources.append(source)
+        for fragment in fragments:
+            self.counts[fragment] = self.counts.get(fragment, 0) + 1
+
+    def most_common(self, n: int = None) -> list:
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:n]
+
+    def to_dict(self) -> dict:
+        return {"fragments": self.counts, "sources": self.sources}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FragmentLibrary":
+        return cls(data["fragments"], data["sources"])
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+class FragmentStore():
+    """
+    LRU of BRICS decompositions per canonical SMILES in front of an SQLite
+    store that never expires its entries, plus the named fragment libraries.
+    """
+
+    def __init__(self, path: str = FRAGMENT_STORE_PATH,
+                 max_entries: int = FRAGMENT_CACHE_SIZE,
+                 enabled: bool = FRAGMENT_STORE_ENABLED):
+        self.max_entries = max_entries
+        self.path = path
+        self._conn = None
+        self.disk = PersistentCache(path, ttl=float("inf"), max_stale=0,
+                                    max_bytes=FRAGMENT_STORE_MAX_BYTES) if enabled else None
+        self._decompositions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _libraries(self) -> sqlite3.Connection:
+        # called with the lock held; the decomposition cache evicts from its own table only
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS libraries (
+                                name TEXT PRIMARY KEY,
+                                value BLOB NOT NULL,
+                                stored_at REAL NOT NULL)""")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _decompose(canonical: str) -> list:
+        mol = mol_cache.get_mol(canonical)
+        if mol is None:
+            raise ValueError(f"Invalid SMILES: {canonical}")
+        return sorted(BRICSDecompose(mol))
+
+    def _decompose_missing(self, keys: list) -> dict:
+        return {key: self._decompose(key) for key in keys}
+
+    def decompose_many(self, smiles_list: list) -> list:
+        """
+        Return the BRICS fragments of every SMILES, in input order. Raises
+        ValueError for SMILES that cannot be parsed.
+        """
+        keys = [mol_cache.canonical(smiles) for smiles in smiles_list]
+        found = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                fragments = self._decompositions.get(key)
+                if fragments is not None:
+                    self._decompositions.move_to_end(key)
+                    found[key] = fragments
+            self.hits += len(found)
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            self.misses += len(missing)
+        if missing:
+            if self.disk is not None:
+                fetched = self.disk.get_or_fetch_many("decomposition", missing, self._decompose_missing)
+            else:
+                fetched = self._decompose_missing(missing)
+            with self._lock:
+                for key in missing:
+                    found[key] = self._decompositions[key] = tuple(fetched[key])
+                while len(self._decompositions) > self.max_entries:
+                    self._decompositions.popitem(last=False)
+                    self.evictions += 1
+        return [list(found[key]) for key in keys]
+
+    def decompose(self, smiles: str) -> list:
+        return self.decompose_many([smiles])[0]
+
+    def build_library(self, smiles_list: list, library: FragmentLibrary = None) -> FragmentLibrary:
+        """
+        Decompose the SMILES into a deduplicated fragment library, or into
+        `library` when given; sources it already holds are not counted again.
+        """
+        library = library if library is not None else FragmentLibrary()
+        for smiles, fragments in zip(smiles_list, self.decompose_many(smiles_list)):
+            library.add(mol_cache.canonical(smiles), fragments)
+        return library
+
+    def save_library(self, name: str, library: FragmentLibrary):
+        if self.disk is None:
+            raise RuntimeError("The fragment store is disabled, set FRAGMENT_STORE_ENABLED=1 to save libraries")
+        data = json.dumps(library.to_dict()).encode("utf-8")
+        with self._lock:
+            self._libraries().execute("INSERT OR REPLACE INTO libraries VALUES (?, ?, ?)",
+                                      (name, data, time.time()))
+
+    def load_library(self, name: str) -> FragmentLibrary:
+        """
+        Return the library saved under `name`. Raises KeyError when there is none.
+        """
+        row = None
+        if self.disk is not None:
+            with self._lock:
+                row = self._libraries().execute("SELECT value FROM libraries WHERE name = ?",
+                                                (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"No fragment library named {name}")
+        return FragmentLibrary.from_dict(json.loads(row[0].decode("utf-8")))
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "entries": len(self._decompositions),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+            with self._lock:
+                stats["libraries"] = self._libraries().execute(
+                    "SELECT COUNT(*) FROM libraries").fetchone()[0]
+        return stats
+
+
+fragment_store = FragmentStore()
+
+
+def main(argv=None):
+    from app.utils.generators.BRICSGenerator import BRICSGenerator
+
+    parser = argparse.ArgumentParser(description="Build and save a BRICS fragment library from a file of seeds")
+    parser.add_argument("input", help="file with one SMILES / PSMILES per line (first token)")
+    parser.add_argument("--name", required=True, help="name the library is saved under")
+    parser.add_argument("--psmiles", action="store_true", help="the seeds are PSMILES")
+    parser.add_argument("--merge", action="store_true", help="add to the library saved under the name")
+    args = parser.parse_args(argv)
+
+    with open(args.input) as f:
+        seeds = [line.split()[0] for line in f if line.strip()]
+    if args.psmiles:
+        seeds = BRICSGenerator().replace_wildcards_with_vatoms(seeds)
+    library = None
+    if args.merge:
+        try:
+            library = fragment_store.load_library(args.name)
+        except KeyError:
+            pass
+    library = fragment_store.build_library(seeds, library)
+    fragment_store.save_library(args.name, library)
+    print(f"[+] Saved {len(library)} fragments from {len(library.sources)} molecules as {args.name}")
+    for fragment, count in library.most_common(10):
+        print(f"    {count:>6}  {fragment}")
+    fragment_store.close()
+
+
+if __name__ == "__main__":
+    main()
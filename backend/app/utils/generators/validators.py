@@ -1,5 +1,6 @@
 from rdkit import Chem
 import re
+from app.utils.mol_cache import mol_cache
 
 class PSMILESValidator():
 
@@ -18,7 +19,7 @@ class PSMILESValidator():
     """
         smiles = smiles.strip().replace(" ", "").replace("[*]", "*")
         try:
-            mol = Chem.MolFromSmiles(smiles)
+            mol = mol_cache.get_mol(smiles)
             if mol is not None:
                 return True
             else:
@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # the async client is optional
+    httpx = None
+
+# base URLs are configurable so the protein tools can run against a local stub server
+RCSB_DATA_URL = os.environ.get("RCSB_DATA_URL", "https://data.rcsb.org")
+RCSB_SEARCH_URL = os.environ.get("RCSB_SEARCH_URL", "https://search.rcsb.org/rcsbsearch/v2/query")
+RCSB_IMAGE_URL = os.environ.get("RCSB_IMAGE_URL", "https://cdn.rcsb.org/images/structures")
+RCSB_FILES_URL = os.environ.get("RCSB_FILES_URL", "https://files.rcsb.org")
+
+HTTP_CONNECT_TIMEOUT_S = float(os.environ.get("HTTP_CONNECT_TIMEOUT_S", 3.05))
+HTTP_READ_TIMEOUT_S = float(os.environ.get("HTTP_READ_TIMEOUT_S", 15))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get("HTTP_BACKOFF_FACTOR", 0.5))
+# number of hosts with a kept-alive pool, and connections kept per host
+HTTP_POOL_HOSTS = int(os.environ.get("HTTP_POOL_HOSTS", 10))
+HTTP_POOL_PER_HOST = int(os.environ.get("HTTP_POOL_PER_HOST", 20))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# bound on concurrent per-hit fetches (images, entry summaries) of one request
+HTTP_FETCH_WORKERS = int(os.environ.get("HTTP_FETCH_WORKERS", 8))
+HTTP_FETCH_TIMEOUT_S = float(os.environ.get("HTTP_FETCH_TIMEOUT_S", 10))
+
+
+# monotonic deadline of the calls `fetch_all` runs on the current thread
+_deadline = threading.local()
+
+
+def remaining_time():
+    """
+    Seconds left before the current thread's `fetch_all` deadline, None outside one.
+    """
+    deadline = getattr(_deadline, "value", None)
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry that gives up instead of backing off past the current thread's
+    `fetch_all` deadline, so retries cannot outlast it.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        remaining = remaining_time()
+        if remaining is not None:
+            backoff = retry.get_backoff_time()
+            if response is not None and retry.respect_retry_after_header:
+                backoff = max(backoff, retry.get_retry_after(response) or 0)
+            if backoff >= remaining:
+                raise MaxRetryError(_pool, url, error or TimeoutError("deadline exceeded"))
+        return retry
+
+
+class TimeoutSession(requests.Session):
+    """
+    requests.Session that applies a default (connect, read) timeout to every
+    request, so a hung endpoint can never block a worker forever. Inside
+    `fetch_all` both are further cut to the time left before its deadline.
+    """
+
+    def __init__(self, timeout: tuple):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        remaining = remaining_time()
+        if remaining is not None:
+            if remaining <= 0:
+                raise requests.Timeout(f"deadline exceeded before {method} {url}")
+            timeout = kwargs["timeout"]
+            if isinstance(timeout, tuple):
+                kwargs["timeout"] = tuple(remaining if t is None else min(t, remaining) for t in timeout)
+            else:
+                kwargs["timeout"] = remaining if timeout is None else min(timeout, remaining)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(retries: int = HTTP_RETRIES,
+                  backoff_factor: float = HTTP_BACKOFF_FACTOR,
+                  pool_hosts: int = HTTP_POOL_HOSTS,
+                  pool_per_host: int = HTTP_POOL_PER_HOST,
+                  timeout: tuple = (HTTP_CONNECT_TIMEOUT_S, HTTP_READ_TIMEOUT_S)) -> TimeoutSession:
+    """
+    Build a keep-alive session with bounded per-host pools and exponential
+    backoff retries on connection errors and retryable statuses.
+    """
+    retry = DeadlineRetry(total=retries,
+                          connect=retries,
+                          read=retries,
+                          status=retries,
+                          backoff_factor=backoff_factor,
+                          status_forcelist=RETRY_STATUSES,
+                          allowed_methods=frozenset(["GET", "HEAD", "POST"]),
+                          respect_retry_after_header=True,
+                          raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_hosts,
+                          pool_maxsize=pool_per_host,
+                          max_retries=retry,
+                          pool_block=True)
+    session = TimeoutSession(timeout)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> TimeoutSession:
+    """
+    Return the process-wide session shared by all the protein tools.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def close_http_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _timed_call(fetch, key, deadline: float) -> dict:
+    start = time.perf_counter()
+    _deadline.value = deadline
+    try:
+        value, error = fetch(key), None
+    except Exception as e:
+        value, error = None, str(e)
+    finally:
+        _deadline.value = None
+    return {"value": value, "error": error,
+            "fetch_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def fetch_all(fetch, keys: list, timeout: float = HTTP_FETCH_TIMEOUT_S) -> list:
+    """
+    Call `fetch(key)` for every key on a pool of at most HTTP_FETCH_WORKERS
+    threads owned by this call and wait at most `timeout` seconds for all of
+    them. Returns one dict per key, in input order, with the `value`, an
+    `error` message (None on success) and the `fetch_ms` spent on it. Calls
+    that miss the deadline are reported as errors instead of holding up the
+    ones that finished.
+
+    Requests `fetch` sends through the shared session inherit the deadline:
+    their timeouts are cut to the time left and no retry backs off past it,
+    so a slow endpoint releases its thread shortly after the deadline.
+    """
+    if not keys:
+        return []
+    deadline = time.monotonic() + timeout
+    pool = ThreadPoolExecutor(max_workers=min(HTTP_FETCH_WORKERS, len(keys)),
+                              thread_name_prefix="http-fetch")
+    try:
+        futures = [pool.submit(_timed_call, fetch, key, deadline) for key in keys]
+        wait(futures, timeout=timeout)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    results = []
+    for future in futures:
+        if future.done() and not future.cancelled():
+            results.append(future.result())
+        else:
+            results.append({"value": None,
+                            "error": f"timed out after {timeout}s",
+                            "fetch_ms": round(timeout * 1000, 1)})
+    return results
+
+
+def get_async_client(timeout: tuple = (HTTP_CONNECT_TIMEOUT_S, HTTP_READ_TIMEOUT_S),
+                     pool_per_host: int = HTTP_POOL_PER_HOST):
+    """
+    Build an httpx.AsyncClient with the same limits and timeouts as the sync
+    session. httpx is an optional dependency.
+    """
+    if httpx is None:
+        raise ImportError("The async HTTP client needs httpx, install it with `pip install httpx`")
+    connect_timeout, read_timeout = timeout
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        limits=httpx.Limits(max_connections=pool_per_host * HTTP_POOL_HOSTS,
+                            max_keepalive_connections=pool_per_host),
+        transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES))
+
+
+async def async_request(client, method: str, url: str,
+                        retries: int = HTTP_RETRIES,
+                        backoff_factor: float = HTTP_BACKOFF_FACTOR,
+                        **kwargs):
+    """
+    Send a request with the async client, retrying retryable statuses and
+    timeouts with exponential backoff (the transport only retries connects).
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+        except httpx.TimeoutException:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(backoff_factor * (2 ** attempt))
@@ -0,0 +1,67 @@
+import os
+import re
+import json
+import base64
+
+# "inline" embeds base64 images in tool results, "ref" returns image ids that
+# the /images endpoint renders or fetches on demand
+IMAGE_DELIVERY_MODE = os.environ.get("IMAGE_DELIVERY_MODE", "inline")
+IMAGE_ROUTE_PREFIX = "/images"
+IMAGE_KINDS = ["smiles", "pdb"]
+IMAGE_FORMATS = ["png", "webp", "svg", "jpeg"]
+MAX_IMAGE_SIZE = 2000
+# the endpoint is unauthenticated, only well-formed PDB ids reach RCSB and the pdb cache
+PDB_ID_PATTERN = re.compile(r"[0-9][A-Za-z0-9]{3}")
+
+
+def make_image_id(kind: str, value: str, size: tuple = None, fmt: str = "png") -> str:
+    """
+    Build a stable image id. The id encodes everything needed to produce the
+    image, so any worker can serve it without shared state and the same
+    molecule always gets the same id (and ETag).
+    """
+    spec = [kind, value, list(size) if size else None, fmt]
+    encoded = base64.urlsafe_b64encode(
+        json.dumps(spec, separators=(",", ":")).encode("utf-8"))
+    return encoded.decode("ascii").rstrip("=")
+
+
+def parse_image_id(image_id: str) -> dict:
+    """
+    Decode an image id built by `make_image_id`. Raises ValueError for ids
+    that are malformed or ask for something the endpoint does not serve.
+    """
+    try:
+        padded = image_id + "=" * (-len(image_id) % 4)
+        kind, value, size, fmt = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError(f"Malformed image id {image_id}")
+    if kind not in IMAGE_KINDS or fmt not in IMAGE_FORMATS or not isinstance(value, str):
+        raise ValueError(f"Unsupported image id {image_id}")
+    if kind == "pdb" and (fmt != "jpeg" or not PDB_ID_PATTERN.fullmatch(value)):
+        raise ValueError(f"Unsupported image id {image_id}")
+    if size is not None:
+        if (len(size) != 2 or not all(isinstance(v, int) for v in size)
+                or not all(0 < v <= MAX_IMAGE_SIZE for v in size)):
+            raise ValueError(f"Unsupported image size {size}")
+        size = tuple(size)
+    return {"kind": kind, "value": value, "size": size, "format": fmt}
+
+
+def image_reference(kind: str, value: str, size: tuple = None, fmt: str = "png") -> dict:
+    image_id = make_image_id(kind, value, size, fmt)
+    return {"image_id": image_id, "image_url": f"{IMAGE_ROUTE_PREFIX}/{image_id}"}
+
+
+def image_fields(kind: str, value: str, load_inline, size: tuple = None,
+                 fmt: str = "png", mode: str = None) -> dict:
+    """
+    Return the image entries of a tool result: `image` with the base64 data
+    from `load_inline()` in inline mode, `image_id` / `image_url` in ref mode.
+    """
+    mode = mode or IMAGE_DELIVERY_MODE
+    if mode == "ref":
+        return image_reference(kind, value, size, fmt)
+    if mode != "inline":
+        raise ValueError(f"Unknown image delivery mode {mode}, expected inline or ref")
+    return {"image": load_inline()}
@@ -0,0 +1,316 @@
+"""
+Offline bulk builder for the SMILES / PSMILES similarity collections.
+
+Streams a large input file, canonicalizes and validates the strings in a
+process pool, encodes them with polyBERT in large batches and upserts them
+into the persistent Chroma store in bulk chunks. With --fingerprints the
+Morgan fingerprint library for the Tanimoto backend is written alongside.
+Progress is checkpointed after every upsert so an interrupted build resumes
+where it stopped.
+
+Run from the backend directory:
+
+    python -m app.utils.index_builder data/smiles.csv.gz --collection smiles_data
+    python -m app.utils.index_builder data/polymers.smi --collection psmiles_data --kind psmiles --fingerprints
+"""
+import os
+import csv
+import gzip
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from rdkit import Chem, RDLogger
+from app.utils.embedding_cache import canonical_smiles_from_mol, record_id
+from app.utils.fingerprint_index import (
+    FingerprintIndexWriter,
+    morgan_fingerprint,
+    FINGERPRINT_STORE_PATH
+)
+from app.utils.searchers import (
+    searcher_registry,
+    CHROMADB_PERSISTENT_PATH,
+    POLYBERT_MODEL_NAME
+)
+
+CSV_COLUMN_CANDIDATES = ["smiles", "SMILES", "psmiles", "PSMILES"]
+
+
+def open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="")
+    return open(path, "r", newline="")
+
+
+def iter_input_records(path: str, column: str = None):
+    """
+    Yield raw SMILES/PSMILES strings from a CSV, .smi or plain text file,
+    optionally gzip compressed. For CSV input the column is detected from
+    the header unless given.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    with open_text(path) as f:
+        if name.endswith(".csv"):
+            reader = csv.DictReader(f)
+            if column is None:
+                column = next((c for c in CSV_COLUMN_CANDIDATES
+                               if c in (reader.fieldnames or [])), None)
+                if column is None:
+                    raise ValueError(
+                        f"No SMILES column found in {path}, pass --column explicitly")
+            for row in reader:
+                yield row.get(column) or ""
+        else:
+            # .smi files carry the SMILES as the first whitespace separated token
+            for line in f:
+                parts = line.split()
+                yield parts[0] if parts else ""
+
+
+def iter_chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def canonicalize_chunk(chunk: list, kind: str = "smiles", fingerprints: bool = False) -> list:
+    """
+    Canonicalize a chunk of strings. Invalid entries come back as None;
+    PSMILES need at least two wildcard atoms to be valid. With fingerprints,
+    valid entries come back as (canonical, packed Morgan fingerprint).
+    """
+    RDLogger.DisableLog("rdApp.*")
+    canonical = []
+    for smiles in chunk:
+        mol = Chem.MolFromSmiles(smiles.strip()) if smiles else None
+        if mol is not None and kind == "psmiles":
+            if sum(1 for atom in mol.GetAtoms() if atom.GetSymbol() == "*") < 2:
+                mol = None
+        if mol is None:
+            canonical.append(None)
+        elif fingerprints:
+            canonical.append((canonical_smiles_from_mol(mol), morgan_fingerprint(mol)))
+        else:
+            canonical.append(canonical_smiles_from_mol(mol))
+    return canonical
+
+
+class Checkpoint():
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.records_done = 0
+        self.indexed = 0
+        self.invalid = 0
+        # fingerprint library rows covered by the checkpoint, None without one
+        self.fingerprint_rows = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        if state.get("input_path") != self.input_path:
+            raise ValueError(
+                f"Checkpoint {self.path} belongs to {state.get('input_path')}, "
+                "remove it or pass --no-resume to start over")
+        self.records_done = state["records_done"]
+        self.indexed = state["indexed"]
+        self.invalid = state["invalid"]
+        self.fingerprint_rows = state.get("fingerprint_rows")
+        return self
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"input_path": self.input_path,
+                       "records_done": self.records_done,
+                       "indexed": self.indexed,
+                       "invalid": self.invalid,
+                       "fingerprint_rows": self.fingerprint_rows}, f)
+        os.replace(tmp_path, self.path)
+
+
+class IndexBuilder():
+    def __init__(self,
+                 collection_name: str,
+                 persist_directory: str = CHROMADB_PERSISTENT_PATH,
+                 model_name: str = POLYBERT_MODEL_NAME,
+                 kind: str = "smiles",
+                 workers: int = None,
+                 canonicalize_chunk_size: int = 2000,
+                 encode_batch_size: int = 256,
+                 upsert_size: int = 4096,
+                 report_every_s: float = 10.0,
+                 fingerprint_directory: str = None):
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.model_name = model_name
+        self.kind = kind
+        self.workers = workers or os.cpu_count()
+        self.canonicalize_chunk_size = canonicalize_chunk_size
+        self.encode_batch_size = encode_batch_size
+        self.upsert_size = upsert_size
+        self.report_every_s = report_every_s
+        # directory of the fingerprint stores, None skips the fingerprint library
+        self.fingerprint_directory = fingerprint_directory
+
+    def _iter_canonical_chunks(self, records):
+        # keep a bounded window of chunks in flight so the input is streamed,
+        # not read into memory up front, and results come back in input order
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for chunk in iter_chunks(records, self.canonicalize_chunk_size):
+                pending.append(pool.submit(canonicalize_chunk, chunk, self.kind,
+                                           self.fingerprint_directory is not None))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _flush(self, collection, encoder, batch: dict, fingerprint_writer=None):
+        canonical = list(batch)
+        embeddings = encoder.encode(canonical,
+                                    batch_size=self.encode_batch_size,
+                                    show_progress_bar=False)
+        collection.upsert(ids=[record_id(c) for c in canonical],
+                          embeddings=embeddings.tolist(),
+                          metadatas=[{"smiles": c} for c in canonical])
+        if fingerprint_writer is not None:
+            # flushed, not committed: the checkpoint records the rows first, see _save
+            for smiles, packed in batch.items():
+                fingerprint_writer.add_packed(smiles, packed)
+            fingerprint_writer.flush()
+
+    @staticmethod
+    def _save(checkpoint, fingerprint_writer=None):
+        # checkpoint before meta.json: a crash in between leaves flushed rows the
+        # checkpoint covers, and resuming truncates the library to exactly those
+        if fingerprint_writer is not None:
+            checkpoint.fingerprint_rows = fingerprint_writer.count
+        checkpoint.save()
+        if fingerprint_writer is not None:
+            fingerprint_writer.commit()
+
+    def build(self, input_path: str, column: str = None,
+              checkpoint_path: str = None, resume: bool = True):
+        checkpoint_path = checkpoint_path or os.path.join(
+            self.persist_directory, f"{self.collection_name}.checkpoint.json")
+        os.makedirs(self.persist_directory, exist_ok=True)
+        checkpoint = Checkpoint(checkpoint_path, input_path)
+        if resume:
+            checkpoint.load()
+        if checkpoint.records_done:
+            print(f"[+] Resuming after {checkpoint.records_done} records ...")
+
+        client = searcher_registry.get_client(self.persist_directory)
+        collection = client.get_or_create_collection(name=self.collection_name)
+        encoder = searcher_registry.get_encoder(self.model_name)
+        upsert_size = self.upsert_size
+        if hasattr(client, "get_max_batch_size"):
+            upsert_size = min(upsert_size, client.get_max_batch_size())
+        fingerprint_writer = None
+        # canonical SMILES indexed so far, a molecule recurring in a later batch is skipped
+        seen = set()
+        if self.fingerprint_directory is not None:
+            # resuming keeps the rows covered by the last checkpoint
+            fingerprint_writer = FingerprintIndexWriter(
+                os.path.join(self.fingerprint_directory, self.collection_name),
+                append=checkpoint.records_done > 0, count=checkpoint.fingerprint_rows)
+            seen.update(fingerprint_writer.smiles())
+            fingerprint_writer.commit()
+
+        records = islice(iter_input_records(input_path, column),
+                         checkpoint.records_done, None)
+        # canonical SMILES -> packed fingerprint (or None), ordered and free of the
+        # duplicate ids Chroma rejects within one upsert. Without a fingerprint
+        # library `seen` starts empty on resume; re-upserting an id is harmless
+        batch = {}
+        pending_records = 0
+        started = last_report = time.time()
+        records_seen = 0
+
+        for canonical_chunk in self._iter_canonical_chunks(records):
+            for canonical in canonical_chunk:
+                if canonical is None:
+                    checkpoint.invalid += 1
+                else:
+                    smiles, packed = canonical if fingerprint_writer is not None else (canonical, None)
+                    if smiles not in seen:
+                        seen.add(smiles)
+                        batch[smiles] = packed
+                pending_records += 1
+                records_seen += 1
+                # flush mid-chunk, an upsert never exceeds the client's max batch size
+                if len(batch) >= upsert_size:
+                    self._flush(collection, encoder, batch, fingerprint_writer)
+                    checkpoint.indexed += len(batch)
+                    checkpoint.records_done += pending_records
+                    self._save(checkpoint, fingerprint_writer)
+                    batch, pending_records = {}, 0
+            now = time.time()
+            if now - last_report >= self.report_every_s:
+                rate = records_seen / (now - started)
+                print(f"[+] {checkpoint.records_done + pending_records} records read, "
+                      f"{checkpoint.indexed} indexed, {checkpoint.invalid} invalid, "
+                      f"{rate:.1f} records/s")
+                last_report = now
+
+        if batch:
+            self._flush(collection, encoder, batch, fingerprint_writer)
+            checkpoint.indexed += len(batch)
+        checkpoint.records_done += pending_records
+        self._save(checkpoint, fingerprint_writer)
+        if fingerprint_writer is not None:
+            fingerprint_writer.close()
+        elapsed = time.time() - started
+        print(f"[+] Done: {checkpoint.indexed} indexed, {checkpoint.invalid} invalid "
+              f"in {elapsed:.1f}s ({records_seen / max(elapsed, 1e-9):.1f} records/s)")
+        return checkpoint
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build the SMILES / PSMILES similarity collections from a file")
+    parser.add_argument("input", help="CSV, .smi or text file, optionally .gz")
+    parser.add_argument("--collection", required=True,
+                        help="Chroma collection name, e.g. smiles_data or psmiles_data")
+    parser.add_argument("--kind", choices=["smiles", "psmiles"], default="smiles")
+    parser.add_argument("--column", default=None, help="CSV column holding the strings")
+    parser.add_argument("--persist-directory", default=CHROMADB_PERSISTENT_PATH)
+    parser.add_argument("--model", default=POLYBERT_MODEL_NAME)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=2000,
+                        help="records per canonicalization task")
+    parser.add_argument("--encode-batch-size", type=int, default=256)
+    parser.add_argument("--upsert-size", type=int, default=4096)
+    parser.add_argument("--fingerprints", action="store_true",
+                        help="also write the Morgan fingerprint library for the Tanimoto backend")
+    parser.add_argument("--fingerprint-directory", default=FINGERPRINT_STORE_PATH)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--no-resume", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    builder = IndexBuilder(collection_name=args.collection,
+                           persist_directory=args.persist_directory,
+                           model_name=args.model,
+                           kind=args.kind,
+                           workers=args.workers,
+                           canonicalize_chunk_size=args.chunk_size,
+                           encode_batch_size=args.encode_batch_size,
+                           upsert_size=args.upsert_size,
+                           fingerprint_directory=args.fingerprint_directory if args.fingerprints else None)
+    builder.build(args.input, column=args.column,
+                  checkpoint_path=args.checkpoint, resume=not args.no_resume)
+
+
+if __name__ == "__main__":
+    main()
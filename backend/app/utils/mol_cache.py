@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import OrderedDict
+from rdkit import Chem
+from app.utils.embedding_cache import canonical_smiles_from_mol
+
+MOL_CACHE_SIZE = int(os.environ.get("MOL_CACHE_SIZE", 20000))
+
+
+class MolCache():
+    """
+    Bounded LRU cache of parsed molecules and their computed descriptors,
+    shared by all the tools.
+
+    Parsed molecules are stored as RDKit binaries together with their
+    canonical SMILES, under the input string, so a repeated input is neither
+    parsed nor canonicalized again and the Mol keeps the atom order of that
+    input (atom indices shown to users stay meaningful). Descriptors are
+    stored under the canonical SMILES, so every spelling of a molecule
+    shares them. Every `get_mol` returns a fresh Mol, callers are free to
+    modify it.
+    """
+
+    def __init__(self, max_entries: int = MOL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._mols = OrderedDict()
+        self._descriptors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.descriptor_hits = 0
+        self.descriptor_misses = 0
+        self.descriptor_evictions = 0
+
+    def _lookup(self, smiles: str) -> tuple:
+        """
+        Return (canonical SMILES, binary), parsing the SMILES on a miss. The
+        binary is None when RDKit cannot parse it.
+        """
+        with self._lock:
+            cached = self._mols.get(smiles)
+            if cached is not None:
+                self._mols.move_to_end(smiles)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        mol = Chem.MolFromSmiles(smiles.strip())
+        if mol is None:
+            cached = (smiles.strip(), None)
+        else:
+            cached = (canonical_smiles_from_mol(mol), mol.ToBinary())
+        with self._lock:
+            self._mols[smiles] = cached
+            while len(self._mols) > self.max_entries:
+                self._mols.popitem(last=False)
+                self.evictions += 1
+        return cached
+
+    def get_mol(self, smiles: str):
+        """
+        Return a new Mol for the SMILES, None when it cannot be parsed.
+        """
+        _, binary = self._lookup(smiles)
+        if binary is None:
+            return None
+        return Chem.Mol(binary)
+
+    def canonical(self, smiles: str) -> str:
+        """
+        Return the canonical SMILES (wildcards as [*]), or the stripped input
+        when it cannot be parsed.
+        """
+        return self._lookup(smiles)[0]
+
+    def get_descriptors(self, smiles: str, name: str, compute) -> dict:
+        """
+        Return the descriptor dict `compute(mol)` cached under `name` for the
+        molecule, None when the SMILES cannot be parsed. The dict is a copy.
+        Descriptors cached this way must not depend on the atom order.
+        """
+        key, binary = self._lookup(smiles)
+        if binary is None:
+            return None
+        with self._lock:
+            sets = self._descriptors.get(key)
+            if sets is not None and name in sets:
+                self._descriptors.move_to_end(key)
+                self.descriptor_hits += 1
+                return dict(sets[name])
+            self.descriptor_misses += 1
+        descriptors = compute(Chem.Mol(binary))
+        with self._lock:
+            self._descriptors.setdefault(key, {})[name] = descriptors
+            self._descriptors.move_to_end(key)
+            while len(self._descriptors) > self.max_entries:
+                self._descriptors.popitem(last=False)
+                self.descriptor_evictions += 1
+        return dict(descriptors)
+
+    def clear(self):
+        with self._lock:
+            self._mols.clear()
+            self._descriptors.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            descriptor_lookups = self.descriptor_hits + self.descriptor_misses
+            return {
+                "molecules": len(self._mols),
+                "descriptor_entries": len(self._descriptors),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "descriptor_hits": self.descriptor_hits,
+                "descriptor_misses": self.descriptor_misses,
+                "descriptor_evictions": self.descriptor_evictions,
+                "descriptor_hit_rate": (self.descriptor_hits / descriptor_lookups
+                                        if descriptor_lookups else 0.0)
+            }
+
+
+mol_cache = MolCache()
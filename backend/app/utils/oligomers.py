@@ -0,0 +1,195 @@
+import os
+import copy
+import threading
+from collections import OrderedDict
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import Descriptors, Crippen, rdMolDescriptors
+from app.utils.mol_cache import mol_cache
+
+OLIGOMER_CACHE_SIZE = int(os.environ.get("OLIGOMER_CACHE_SIZE", 2000))
+OLIGOMER_MAX_N = 20
+
+# properties that grow with every repeat unit; extrapolated as the increment per unit
+EXTENSIVE_DESCRIPTORS = {
+    "Molecular Weight": Descriptors.MolWt,
+    "Heavy Atoms Count": Descriptors.HeavyAtomCount,
+    "MolLogP": Crippen.MolLogP,
+    "TPSA": Descriptors.TPSA,
+    "Rotatable Bonds Count": Descriptors.NumRotatableBonds,
+    "Number of Rings": Descriptors.RingCount,
+    "H Bond Donor Count": Descriptors.NumHDonors,
+    "H Bond Acceptor Count": Descriptors.NumHAcceptors,
+}
+# properties that converge with chain length; extrapolated to n -> infinity
+INTENSIVE_DESCRIPTORS = {
+    "Fraction CSP3": rdMolDescriptors.CalcFractionCSP3,
+    "Heteroatom Fraction": lambda mol: (sum(atom.GetAtomicNum() not in (1, 6) for atom in mol.GetAtoms())
+                                        / max(mol.GetNumHeavyAtoms(), 1)),
+}
+
+
+def polymer_open_bond_indices(mol) -> list:
+    """
+    Indices of the [*] open-bond atoms of a PSMILES repeat unit, in atom order.
+    """
+    return [atom.GetIdx() for atom in mol.GetAtoms() if atom.GetSymbol() == '*']
+
+
+def _link(mol, wildcard: int) -> tuple:
+    # the atom a wildcard is bonded to and the type of that bond
+    atom = mol.GetAtomWithIdx(wildcard)
+    if atom.GetDegree() != 1:
+        raise ValueError("Every open-bond atom [*] must be bonded to exactly one atom")
+    bond = atom.GetBonds()[0]
+    return bond.GetOtherAtomIdx(wildcard), bond.GetBondType()
+
+
+def build_oligomer(repeat_unit, n: int, cap: bool = True):
+    """
+    Join `n` copies of a repeat unit head to tail: the atom bonded to the
+    second [*] of copy i is bonded to the atom bonded to the first [*] of
+    copy i + 1, and both wildcards are dropped. With `cap` the two chain
+    ends are saturated with hydrogens, otherwise they stay open as [*].
+    """
+    wildcards = polymer_open_bond_indices(repeat_unit)
+    if len(wildcards) != 2:
+        raise ValueError(f"A repeat unit needs exactly 2 open-bond atoms [*], found {len(wildcards)}")
+    if n < 1:
+        raise ValueError("The number of repeat units must be at least 1")
+    head, tail = wildcards
+    head_atom, _ = _link(repeat_unit, head)
+    tail_atom, bond_type = _link(repeat_unit, tail)
+    size = repeat_unit.GetNumAtoms()
+
+    chain = Chem.Mol(repeat_unit)
+    for _ in range(n - 1):
+        chain = Chem.CombineMols(chain, repeat_unit)
+    chain = Chem.RWMol(chain)
+    for i in range(n - 1):
+        chain.AddBond(i * size + tail_atom, (i + 1) * size + head_atom, bond_type)
+    inner = [i * size + tail for i in range(n - 1)] + [(i + 1) * size + head for i in range(n - 1)]
+    ends = [head, (n - 1) * size + tail]
+    if cap:
+        # hydrogens in place of the end wildcards, removed again below; a double or
+        # triple open bond becomes single and its lost order goes to the end atom's hydrogens
+        for index in ends:
+            atom = chain.GetAtomWithIdx(index)
+            bond = atom.GetBonds()[0]
+            lost = int(bond.GetBondTypeAsDouble()) - 1
+            if lost > 0:
+                bond.SetBondType(Chem.BondType.SINGLE)
+                end_atom = bond.GetOtherAtom(atom)
+                if end_atom.GetNoImplicit():
+                    end_atom.SetNumExplicitHs(end_atom.GetNumExplicitHs() + lost)
+            atom.SetAtomicNum(1)
+    for index in sorted(inner, reverse=True):
+        chain.RemoveAtom(index)
+    oligomer = chain.GetMol()
+    Chem.SanitizeMol(oligomer)
+    return Chem.RemoveHs(oligomer) if cap else oligomer
+
+
+def oligomer_descriptors(mol) -> dict:
+    descriptors = {name: fn(mol) for name, fn in EXTENSIVE_DESCRIPTORS.items()}
+    descriptors.update({name: fn(mol) for name, fn in INTENSIVE_DESCRIPTORS.items()})
+    return {name: round(float(value), 4) for name, value in descriptors.items()}
+
+
+def extrapolate(ns: list, rows: list) -> dict:
+    """
+    Fit the per-n descriptors. Extensive properties are fit as a + b * n,
+    `b` being the contribution of one repeat unit in an infinite chain and
+    `a` that of the end groups; intensive ones as y_inf + c / n, `y_inf`
+    being the infinite chain limit. Needs at least two chain lengths.
+    """
+    if len(ns) < 2:
+        return None
+    ns = np.asarray(ns, dtype=np.float64)
+    per_unit, end_groups, limits = {}, {}, {}
+    for name in EXTENSIVE_DESCRIPTORS:
+        slope, intercept = np.polyfit(ns, [row[name] for row in rows], 1)
+        per_unit[name] = round(float(slope), 4)
+        end_groups[name] = round(float(intercept), 4)
+    for name in INTENSIVE_DESCRIPTORS:
+        _, limit = np.polyfit(1.0 / ns, [row[name] for row in rows], 1)
+        limits[name] = round(float(limit), 4)
+    return {"per_repeat_unit": per_unit, "end_groups": end_groups, "infinite_chain_limit": limits}
+
+
+class OligomerCache():
+    """
+    LRU cache of oligomer series keyed by (canonical PSMILES, max n, capped),
+    so every spelling of a repeat unit shares one entry. Lookups return copies.
+    """
+
+    def __init__(self, max_entries: int = OLIGOMER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+oligomer_cache = OligomerCache()
+
+
+def oligomer_series(psmiles: str, max_n: int = 5, cap: bool = True) -> dict:
+    """
+    Build the 1..max_n-mers of a PSMILES repeat unit, compute their
+    descriptors and extrapolate them to an infinite chain. Results are cached
+    per canonical PSMILES. Raises ValueError for invalid repeat units.
+    """
+    if not 1 <= max_n <= OLIGOMER_MAX_N:
+        raise ValueError(f"max_n must be between 1 and {OLIGOMER_MAX_N}")
+    canonical = mol_cache.canonical(psmiles)
+    key = (canonical, max_n, cap)
+    cached = oligomer_cache.get(key)
+    if cached is not None:
+        return cached
+    repeat_unit = mol_cache.get_mol(canonical)
+    if repeat_unit is None:
+        raise ValueError(f"Invalid PSMILES: {psmiles}")
+    oligomers = []
+    for n in range(1, max_n + 1):
+        oligomer = build_oligomer(repeat_unit, n, cap)
+        oligomers.append({"n": n, "smiles": Chem.MolToSmiles(oligomer), **oligomer_descriptors(oligomer)})
+    series = {
+        "psmiles": canonical,
+        "capped": cap,
+        "oligomers": oligomers,
+        "extrapolation": extrapolate([row["n"] for row in oligomers], oligomers)
+    }
+    oligomer_cache.put(key, series)
+    return copy.deepcopy(series)
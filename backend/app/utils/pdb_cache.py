@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PDB_CACHE_PATH = os.environ.get("PDB_CACHE_PATH", "./dist/pdb_cache.sqlite3")
+PDB_CACHE_ENABLED = os.environ.get("PDB_CACHE_ENABLED", "1") != "0"
+# entries younger than the TTL are served as is; older ones are served stale
+# for up to PDB_CACHE_MAX_STALE_S more while a background refresh runs
+PDB_CACHE_TTL_S = float(os.environ.get("PDB_CACHE_TTL_S", 7 * 24 * 3600))
+PDB_CACHE_MAX_STALE_S = float(os.environ.get("PDB_CACHE_MAX_STALE_S", 30 * 24 * 3600))
+PDB_CACHE_MAX_BYTES = int(os.environ.get("PDB_CACHE_MAX_BYTES", 256 * 2**20))
+PDB_CACHE_REFRESH_WORKERS = 2
+
+# value codecs per namespace, "json" for dicts, "bytes" for raw images
+CODECS = {
+    "json": (lambda value: json.dumps(value).encode("utf-8"),
+             lambda data: json.loads(data.decode("utf-8"))),
+    "bytes": (bytes, bytes)
+}
+
+
+class PersistentCache():
+    """
+    SQLite backed key/value cache for data fetched from remote services.
+
+    Entries live in namespaces ("entry", "summary", "image", ...) and carry
+    the time they were stored. Fresh entries are returned directly, stale
+    ones are returned while `fetch` runs again in the background, and
+    expired ones are fetched synchronously. A None result is cached too, so
+    known misses (e.g. entries without an image) are not retried on every
+    call. The total stored size is capped by evicting the least recently
+    used entries.
+    """
+
+    def __init__(self, path: str = PDB_CACHE_PATH,
+                 ttl: float = PDB_CACHE_TTL_S,
+                 max_stale: float = PDB_CACHE_MAX_STALE_S,
+                 max_bytes: int = PDB_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._refresh_pool = None
+        self._refreshing = set()
+        self.current_bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # called with the lock held
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                namespace TEXT NOT NULL,
+                                key TEXT NOT NULL,
+                                value BLOB,
+                                size INTEGER NOT NULL,
+                                stored_at REAL NOT NULL,
+                                accessed_at REAL NOT NULL,
+                                PRIMARY KEY (namespace, key))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self.current_bytes = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, namespace: str, key: str):
+        """
+        Return (value bytes, age in seconds) or None when the key is not cached.
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, stored_at FROM entries WHERE namespace = ? AND key = ?",
+                               (namespace, key)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                         (now, namespace, key))
+            return row[0], now - row[1]
+
+    def put(self, namespace: str, key: str, data):
+        size = len(data) if data is not None else 0
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            previous = conn.execute("SELECT size FROM entries WHERE namespace = ? AND key = ?",
+                                    (namespace, key)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                         (namespace, key, data, size, now, now))
+            self.current_bytes += size - (previous[0] if previous else 0)
+            if self.current_bytes > self.max_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        # drop least recently used entries until 10% below the cap, so a
+        # full cache does not evict on every single write
+        target = self.max_bytes * 0.9
+        rows = conn.execute("SELECT namespace, key, size FROM entries ORDER BY accessed_at")
+        evicted = []
+        for namespace, key, size in rows:
+            if self.current_bytes <= target:
+                break
+            evicted.append((namespace, key))
+            self.current_bytes -= size
+        rows.close()
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def _refresh(self, namespace: str, keys: list, fetch_many, encode):
+        try:
+            fetched = fetch_many(keys)
+            for key in keys:
+                if key in fetched:
+                    value = fetched[key]
+                    self.put(namespace, key, encode(value) if value is not None else None)
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            print(f"Refreshing {namespace}/{','.join(keys)} failed: {e}")
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.difference_update((namespace, key) for key in keys)
+
+    def _schedule_refresh(self, namespace: str, keys: list, fetch_many, encode):
+        with self._lock:
+            keys = [key for key in keys if (namespace, key) not in self._refreshing]
+            if not keys:
+                return
+            self._refreshing.update((namespace, key) for key in keys)
+            if self._refresh_pool is None:
+                self._refresh_pool = ThreadPoolExecutor(max_workers=PDB_CACHE_REFRESH_WORKERS,
+                                                        thread_name_prefix="pdb-cache-refresh")
+            self._refresh_pool.submit(self._refresh, namespace, keys, fetch_many, encode)
+
+    def get_or_fetch_many(self, namespace: str, keys: list, fetch_many, codec: str = "json") -> dict:
+        """
+        Return a {key: value} dict for `keys`, calling `fetch_many(missing_keys)`
+        once for all the keys that are not cached. `fetch_many` returns a
+        {key: value} dict; keys it leaves out are returned as None and not
+        cached, so lookups that failed are retried next time. Stale keys are
+        refreshed together in one background `fetch_many` call.
+        """
+        encode, decode = CODECS[codec]
+        values = {}
+        missing = []
+        stale = []
+        for key in dict.fromkeys(keys):
+            cached = self.lookup(namespace, key)
+            if cached is None or cached[1] > self.ttl + self.max_stale:
+                missing.append(key)
+                continue
+            data, age = cached
+            values[key] = decode(data) if data is not None else None
+            if age > self.ttl:
+                stale.append(key)
+        with self._lock:
+            self.hits += len(values) - len(stale)
+            self.stale_hits += len(stale)
+            self.misses += len(missing)
+        if stale:
+            self._schedule_refresh(namespace, stale, fetch_many, encode)
+        if missing:
+            fetched = fetch_many(missing)
+            for key in missing:
+                values[key] = fetched.get(key)
+                if key in fetched:
+                    self.put(namespace, key, encode(values[key]) if values[key] is not None else None)
+        return values
+
+    def get_or_fetch(self, namespace: str, key: str, fetch, codec: str = "json"):
+        """
+        Return the cached value for (namespace, key), calling `fetch()` to
+        produce it on a miss. Exceptions from `fetch` are not cached.
+        """
+        return self.get_or_fetch_many(namespace, [key], lambda keys: {keys[0]: fetch()}, codec)[key]
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            conn = self._connect()
+            if namespace is None:
+                conn.execute("DELETE FROM entries")
+            else:
+                conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            self.current_bytes = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._refresh_pool is not None:
+                self._refresh_pool.shutdown(wait=False, cancel_futures=True)
+                self._refresh_pool = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connect()
+            entries = dict(conn.execute(
+                "SELECT namespace, COUNT(*) FROM entries GROUP BY namespace").fetchall())
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+            }
+
+
+pdb_cache = PersistentCache()
+
+
+def cached(namespace: str, key: str, fetch, codec: str = "json"):
+    """
+    Go through the shared PDB cache unless it is disabled with PDB_CACHE_ENABLED=0.
+    """
+    if not PDB_CACHE_ENABLED:
+        return fetch()
+    return pdb_cache.get_or_fetch(namespace, key, fetch, codec)
+
+
+def cached_many(namespace: str, keys: list, fetch_many, codec: str = "json") -> dict:
+    if not PDB_CACHE_ENABLED:
+        fetched = fetch_many(list(dict.fromkeys(keys)))
+        return {key: fetched.get(key) for key in keys}
+    return pdb_cache.get_or_fetch_many(namespace, keys, fetch_many, codec)
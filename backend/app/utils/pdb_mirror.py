@@ -0,0 +1,245 @@
+"""
+Local mirror of the RCSB data used by the protein tools.
+
+The mirror directory holds gzip'd entry JSON, optional gzip'd mmCIF files,
+the assembly images and the precomputed structure similarity results of
+every ingested PDB ID, plus an index.json mapping each ID to its files so a
+lookup never scans the directory:
+
+    <mirror>/index.json
+    <mirror>/entries/<xy>/<ID>.json.gz
+    <mirror>/mmcif/<xy>/<ID>.cif.gz
+    <mirror>/images/<xy>/<id>_assembly-1.jpeg
+    <mirror>/similar/<xy>/<ID>.json.gz
+
+where <xy> are the middle two characters of the ID, as in the wwPDB archive.
+With PDB_MIRROR_DIR set the protein tools read from the mirror first, and
+with PDB_OFFLINE=1 as well they never touch the network.
+
+Build or extend a mirror (where network access is allowed) from the backend
+directory:
+
+    python -m app.utils.pdb_mirror ids.txt --out ./dist/pdb_mirror --mmcif --similar
+"""
+import os
+import json
+import gzip
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+PDB_MIRROR_DIR = os.environ.get("PDB_MIRROR_DIR")
+# never fall back to RCSB, misses raise (or have no image) instead
+PDB_OFFLINE = os.environ.get("PDB_OFFLINE", "0") == "1"
+MIRROR_KINDS = ["entry", "mmcif", "image", "similar"]
+MIRROR_INDEX_VERSION = 1
+# rows of similar structures stored per entry at ingest time
+MIRROR_SIMILAR_ROWS = 25
+
+
+def _shard(pdb_id: str) -> str:
+    return pdb_id[1:3].lower()
+
+
+def relative_path(kind: str, pdb_id: str) -> str:
+    pdb_id = pdb_id.upper()
+    if kind == "entry":
+        return os.path.join("entries", _shard(pdb_id), f"{pdb_id}.json.gz")
+    if kind == "mmcif":
+        return os.path.join("mmcif", _shard(pdb_id), f"{pdb_id}.cif.gz")
+    if kind == "image":
+        return os.path.join("images", _shard(pdb_id), f"{pdb_id.lower()}_assembly-1.jpeg")
+    if kind == "similar":
+        return os.path.join("similar", _shard(pdb_id), f"{pdb_id}.json.gz")
+    raise ValueError(f"Unknown mirror kind {kind}, expected one of {MIRROR_KINDS}")
+
+
+class PDBMirror():
+    """
+    Read access to a mirror directory. The index maps every PDB ID to the
+    kinds stored for it: a relative file path, or None when RCSB itself has
+    nothing (e.g. no assembly image), so known misses need no network either.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        index_path = os.path.join(path, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {"version": MIRROR_INDEX_VERSION, "entries": {}}
+        self.entries = self.index["entries"]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def has(self, kind: str, pdb_id: str) -> bool:
+        return kind in self.entries.get(pdb_id.upper(), {})
+
+    def read(self, kind: str, pdb_id: str):
+        """
+        Return the stored value: a dict for "entry" / "similar", bytes for
+        "image", the file path for "mmcif"; None when the kind is recorded as
+        absent. Raises KeyError when the kind was never ingested for the ID.
+        """
+        relative = self.entries[pdb_id.upper()][kind]
+        if relative is None:
+            return None
+        file_path = os.path.join(self.path, relative)
+        if kind == "mmcif":
+            return file_path
+        if kind == "image":
+            with open(file_path, "rb") as f:
+                return f.read()
+        with gzip.open(file_path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write(self, kind: str, pdb_id: str, value):
+        """
+        Store a value and record it in the in-memory index; call
+        `save_index` to persist the index.
+        """
+        pdb_id = pdb_id.upper()
+        relative = None
+        if value is not None:
+            relative = relative_path(kind, pdb_id)
+            file_path = os.path.join(self.path, relative)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            if kind in ("image", "mmcif"):
+                # mmCIF files arrive already gzip'd from the RCSB file server
+                with open(file_path, "wb") as f:
+                    f.write(value)
+            else:
+                with gzip.open(file_path, "wt", encoding="utf-8") as f:
+                    json.dump(value, f)
+        self.entries.setdefault(pdb_id, {})[kind] = relative
+
+    def save_index(self):
+        self.index["updated_at"] = time.time()
+        os.makedirs(self.path, exist_ok=True)
+        index_path = os.path.join(self.path, "index.json")
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, index_path)
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_pdb_mirror():
+    """
+    Return the mirror configured by PDB_MIRROR_DIR, None when there is none.
+    """
+    global _mirror
+    if PDB_MIRROR_DIR is None:
+        return None
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = PDBMirror(PDB_MIRROR_DIR)
+    return _mirror
+
+
+def mirror_lookup(kind: str, pdb_id: str):
+    """
+    Return (True, value) when the mirror holds `kind` for the ID and
+    (False, None) when the caller should ask RCSB. In offline mode a miss
+    raises LookupError instead.
+    """
+    mirror = get_pdb_mirror()
+    if mirror is not None and mirror.has(kind, pdb_id):
+        return True, mirror.read(kind, pdb_id)
+    if PDB_OFFLINE:
+        raise LookupError(f"No {kind} for PDB ID {pdb_id} in the local PDB mirror")
+    return False, None
+
+
+def download_mmcif(pdb_id: str):
+    from app.utils.http_client import get_http_session, RCSB_FILES_URL
+    response = get_http_session().get(f"{RCSB_FILES_URL}/download/{pdb_id.upper()}.cif.gz")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+def ingest(pdb_ids: list, out: str, mmcif: bool = False, similar: bool = False,
+           similar_rows: int = MIRROR_SIMILAR_ROWS, workers: int = 8,
+           overwrite: bool = False, save_every: int = 500) -> PDBMirror:
+    """
+    Download the entry JSON, assembly image and optionally the mmCIF file and
+    similar-structure results of every ID into the mirror at `out`. IDs
+    already in the mirror are skipped unless `overwrite`, so an interrupted
+    ingest can simply be run again.
+    """
+    # the download helpers bypass the mirror, so ingest works with PDB_MIRROR_DIR set
+    from app.utils.tool_repository import (
+        download_pdb_entry,
+        download_pdb_image,
+        RCSBSearcher,
+        RCSBQuery
+    )
+    kinds = ["entry", "image"] + (["mmcif"] if mmcif else []) + (["similar"] if similar else [])
+    mirror = PDBMirror(out)
+    searcher = RCSBSearcher()
+
+    def fetch(pdb_id: str) -> dict:
+        values = {}
+        for kind in kinds:
+            if not overwrite and mirror.has(kind, pdb_id):
+                continue
+            if kind == "entry":
+                values[kind] = download_pdb_entry(pdb_id)
+            elif kind == "image":
+                values[kind] = download_pdb_image(pdb_id)
+            elif kind == "mmcif":
+                values[kind] = download_mmcif(pdb_id)
+            else:
+                values[kind] = searcher.fetch(RCSBQuery(entry_id=pdb_id, rows=similar_rows))
+        return values
+
+    pdb_ids = list(dict.fromkeys(pdb_id.strip().upper() for pdb_id in pdb_ids if pdb_id.strip()))
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, pdb_id): pdb_id for pdb_id in pdb_ids}
+        for done, future in enumerate(as_completed(futures), 1):
+            pdb_id = futures[future]
+            try:
+                for kind, value in future.result().items():
+                    mirror.write(kind, pdb_id, value)
+            except Exception as e:
+                failed += 1
+                print(f"[-] {pdb_id}: {e}")
+            if done % save_every == 0:
+                mirror.save_index()
+                print(f"[+] {done}/{len(pdb_ids)} entries ingested")
+    mirror.save_index()
+    print(f"[+] Mirror at {out} holds {len(mirror)} entries ({failed} failed)")
+    return mirror
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or extend a local PDB mirror")
+    parser.add_argument("ids", help="file with one PDB ID per line (or comma separated)")
+    parser.add_argument("--out", default=PDB_MIRROR_DIR or "./dist/pdb_mirror")
+    parser.add_argument("--mmcif", action="store_true", help="also store the mmCIF files")
+    parser.add_argument("--similar", action="store_true",
+                        help="also store the structure similarity search results")
+    parser.add_argument("--similar-rows", type=int, default=MIRROR_SIMILAR_ROWS)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--overwrite", action="store_true",
+                        help="download IDs again even if they are mirrored")
+    args = parser.parse_args(argv)
+
+    with open(args.ids) as f:
+        pdb_ids = [pdb_id for line in f for pdb_id in line.replace(",", " ").split()]
+    ingest(pdb_ids, args.out, mmcif=args.mmcif, similar=args.similar,
+           similar_rows=args.similar_rows, workers=args.workers, overwrite=args.overwrite)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import os
+import threading
+import numpy as np
+import chromadb
+from sentence_transformers import SentenceTransformer
+from app.utils.embedding_cache import (
+    EmbeddingCache,
+    DiskEmbeddingStore,
+    canonicalize_smiles,
+    record_id
+)
+from app.utils.fingerprint_index import FingerprintIndex, FINGERPRINT_STORE_PATH
+from app.utils.substructure_index import SubstructureIndex, SUBSTRUCTURE_STORE_PATH
+from app.utils.vector_index import VectorIndex
+
+CHROMADB_SMILES_DB_NAME = "smiles_data"
+CHROMADB_PSMILES_DB_NAME = "psmiles_data"
+CHROMADB_PERSISTENT_PATH = "./dist/chroma_store"
+POLYBERT_MODEL_NAME = "kuelumbus/polyBERT"
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 10000))
+# set to a directory to persist embeddings across restarts
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR")
+# "polybert" searches the Chroma collections, "fingerprint" the Morgan/Tanimoto
+# libraries and "hybrid" prefilters by fingerprint and reranks with polyBERT
+SIMILARITY_BACKEND = os.environ.get("SIMILARITY_BACKEND", "polybert")
+SIMILARITY_BACKENDS = ["polybert", "fingerprint", "hybrid"]
+HYBRID_PREFILTER_SIZE = int(os.environ.get("HYBRID_PREFILTER_SIZE", 2000))
+HYBRID_FINGERPRINT_WEIGHT = float(os.environ.get("HYBRID_FINGERPRINT_WEIGHT", 0.5))
+# set to a directory of exported vector indexes (app.utils.vector_index) to
+# serve polyBERT searches from them instead of the Chroma store
+VECTOR_INDEX_DIRECTORY = os.environ.get("VECTOR_INDEX_DIRECTORY")
+VECTOR_INDEX_NPROBE = int(os.environ.get("VECTOR_INDEX_NPROBE", 8))
+
+
+class ChromaSearcher():
+    def __init__(self,
+                 collection_name: str,
+                 persist_directory: str,
+                 client=None,
+                 model=None,
+                 embedding_cache: EmbeddingCache = None,
+                 vector_index: VectorIndex = None):
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        if vector_index is not None:
+            # the exported index answers `query` like a Chroma collection
+            self.client = None
+            self.collection = vector_index
+        else:
+            self.client = client if client is not None else chromadb.PersistentClient(
+                path=self.persist_directory)
+            self.collection = self.client.get_or_create_collection(
+                name=collection_name)
+        self.model = model if model is not None else SentenceTransformer(
+            POLYBERT_MODEL_NAME)
+        self.embedding_cache = embedding_cache
+
+    def get_embedding(self, smiles: str):
+        if self.embedding_cache is None:
+            return self.model.encode(smiles).tolist()
+        return self.get_embeddings([smiles])[0]
+
+    def query(self, query_val: str, top_k: int = 3):
+        embedding = self.get_embedding(query_val)
+        return self.collection.query(query_embeddings=[embedding],
+                                     n_results=top_k)
+
+    def get_embeddings(self, smiles_list: list):
+        if self.embedding_cache is None:
+            return self.model.encode(list(smiles_list)).tolist()
+        # look every canonical key up first and encode only the misses, in one batch
+        keys = [canonicalize_smiles(smiles) for smiles in smiles_list]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(
+            key for key, embedding in zip(keys, embeddings) if embedding is None))
+        if missing:
+            encoded = dict(zip(missing, self.model.encode(missing)))
+            for key, embedding in encoded.items():
+                self.embedding_cache.put(key, embedding)
+            embeddings = [encoded[key] if embedding is None else embedding
+                          for key, embedding in zip(keys, embeddings)]
+        return [embedding.tolist() for embedding in embeddings]
+
+    def get_stored_embeddings(self, canonical_list: list) -> dict:
+        """
+        Embeddings the collection already holds for canonical SMILES, keyed
+        by SMILES; those it does not hold are left out. Nothing is encoded.
+        """
+        if not canonical_list or not hasattr(self.collection, "get"):
+            return {}
+        ids = {record_id(canonical): canonical for canonical in canonical_list}
+        stored = self.collection.get(ids=list(ids), include=["embeddings"])
+        embeddings = stored.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return {}
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return {ids[record]: embedding for record, embedding in zip(stored["ids"], embeddings)}
+
+    def query_batch(self, query_vals: list, top_k: int = 3):
+        """
+        Encode all the queries in one model batch and run them as a single
+        multi-embedding Chroma query. Results are indexed in input order.
+        """
+        if len(query_vals) == 0:
+            return {"ids": [], "metadatas": [], "distances": []}
+        embeddings = self.get_embeddings(query_vals)
+        return self.collection.query(query_embeddings=embeddings,
+                                     n_results=top_k)
+
+
+class HybridSearcher():
+    """
+    Two-stage search: a Tanimoto prefilter over the fingerprint library picks
+    `prefilter_size` candidates, which are then reranked by polyBERT embedding
+    distance to the query. Candidates are read back from the collection by
+    id (every fingerprint library row was indexed there by the same build);
+    only those it does not hold are encoded, through the embedding cache.
+
+    The reported distance is the weighted sum
+    `fingerprint_weight * (1 - tanimoto) + (1 - fingerprint_weight) * cosine_distance / 2`,
+    both terms in [0, 1] and lower meaning closer.
+    """
+
+    def __init__(self,
+                 fingerprint_index: FingerprintIndex,
+                 embedding_searcher: ChromaSearcher,
+                 prefilter_size: int = HYBRID_PREFILTER_SIZE,
+                 fingerprint_weight: float = HYBRID_FINGERPRINT_WEIGHT):
+        self.fingerprint_index = fingerprint_index
+        self.embedding_searcher = embedding_searcher
+        self.prefilter_size = prefilter_size
+        self.fingerprint_weight = fingerprint_weight
+
+    def rerank(self, query_val: str, top_k: int = 3):
+        rows, similarities = self.fingerprint_index.top_k(query_val, self.prefilter_size)
+        if len(rows) == 0:
+            return rows, [], np.zeros(0)
+        candidates = [self.fingerprint_index.smiles[row] for row in rows]
+        stored = self.embedding_searcher.get_stored_embeddings(candidates)
+        missing = list(dict.fromkeys(c for c in candidates if c not in stored))
+        embeddings = np.asarray(
+            self.embedding_searcher.get_embeddings([query_val] + missing),
+            dtype=np.float32)
+        query_embedding = embeddings[0]
+        stored.update(zip(missing, embeddings[1:]))
+        candidate_embeddings = np.stack([stored[candidate] for candidate in candidates])
+        norms = np.linalg.norm(candidate_embeddings, axis=1) * np.linalg.norm(query_embedding)
+        cosine = candidate_embeddings @ query_embedding / np.maximum(norms, 1e-12)
+        distances = (self.fingerprint_weight * (1.0 - similarities)
+                     + (1.0 - self.fingerprint_weight) * (1.0 - cosine) / 2.0)
+        order = np.argsort(distances, kind="stable")[:top_k]
+        return rows[order], [candidates[i] for i in order], distances[order]
+
+    def query(self, query_val: str, top_k: int = 3):
+        rows, hits, distances = self.rerank(query_val, top_k)
+        return {
+            "ids": [[str(row) for row in rows]],
+            "metadatas": [[{"smiles": hit} for hit in hits]],
+            "distances": [[float(distance) for distance in distances]]
+        }
+
+    def query_batch(self, query_vals: list, top_k: int = 3):
+        results = {"ids": [], "metadatas": [], "distances": []}
+        for query_val in query_vals:
+            single = self.query(query_val, top_k)
+            for key in results:
+                results[key].append(single[key][0])
+        return results
+
+
+class SearcherRegistry():
+    """
+    Process-wide registry of polyBERT encoders, Chroma clients and searchers.
+
+    Loading a SentenceTransformer model or opening a persistent Chroma store
+    takes seconds, so every tool call shares the instances held here instead
+    of building its own. Encoders are keyed by model name, clients by persist
+    directory and searchers by (collection name, persist directory, model name).
+    All mutations go through a single re-entrant lock, which also guarantees that
+    concurrent first calls load a model only once.
+    """
+
+    def __init__(self,
+                 persist_directory: str = CHROMADB_PERSISTENT_PATH,
+                 model_name: str = POLYBERT_MODEL_NAME):
+        self.persist_directory = persist_directory
+        self.model_name = model_name
+        self._lock = threading.RLock()
+        self._encoders = {}
+        self._clients = {}
+        self._searchers = {}
+        self._embedding_caches = {}
+        self._fingerprint_indexes = {}
+        self._substructure_indexes = {}
+
+    def get_encoder(self, model_name: str = None):
+        model_name = model_name or self.model_name
+        encoder = self._encoders.get(model_name)
+        if encoder is not None:
+            return encoder
+        with self._lock:
+            if model_name not in self._encoders:
+                self._encoders[model_name] = SentenceTransformer(model_name)
+            return self._encoders[model_name]
+
+    def get_client(self, persist_directory: str = None):
+        persist_directory = persist_directory or self.persist_directory
+        client = self._clients.get(persist_directory)
+        if client is not None:
+            return client
+        with self._lock:
+            if persist_directory not in self._clients:
+                self._clients[persist_directory] = chromadb.PersistentClient(
+                    path=persist_directory)
+            return self._clients[persist_directory]
+
+    def get_embedding_cache(self, model_name: str = None) -> EmbeddingCache:
+        model_name = model_name or self.model_name
+        cache = self._embedding_caches.get(model_name)
+        if cache is not None:
+            return cache
+        with self._lock:
+            if model_name not in self._embedding_caches:
+                disk_store = None
+                if EMBEDDING_CACHE_DIR:
+                    disk_store = DiskEmbeddingStore(os.path.join(
+                        EMBEDDING_CACHE_DIR, model_name.replace("/", "__")))
+                self._embedding_caches[model_name] = EmbeddingCache(
+                    max_entries=EMBEDDING_CACHE_SIZE, disk_store=disk_store)
+            return self._embedding_caches[model_name]
+
+    def cache_stats(self) -> dict:
+        return {model_name: cache.stats()
+                for model_name, cache in self._embedding_caches.items()}
+
+    def get_searcher(self,
+                     collection_name: str,
+                     persist_directory: str = None,
+                     model_name: str = None) -> ChromaSearcher:
+        persist_directory = persist_directory or self.persist_directory
+        model_name = model_name or self.model_name
+        key = (collection_name, persist_directory, model_name)
+        searcher = self._searchers.get(key)
+        if searcher is not None:
+            return searcher
+        with self._lock:
+            if key not in self._searchers:
+                vector_index = self.get_vector_index(collection_name)
+                self._searchers[key] = ChromaSearcher(
+                    collection_name=collection_name,
+                    persist_directory=persist_directory,
+                    client=self.get_client(persist_directory) if vector_index is None else None,
+                    model=self.get_encoder(model_name),
+                    embedding_cache=self.get_embedding_cache(model_name),
+                    vector_index=vector_index)
+            return self._searchers[key]
+
+    def get_vector_index(self, collection_name: str):
+        """
+        Open the exported vector index of a collection, None when
+        VECTOR_INDEX_DIRECTORY is unset or holds no index for it.
+        """
+        if not VECTOR_INDEX_DIRECTORY:
+            return None
+        path = os.path.join(VECTOR_INDEX_DIRECTORY, collection_name)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return VectorIndex(path, nprobe=VECTOR_INDEX_NPROBE)
+
+    def get_fingerprint_index(self,
+                              collection_name: str,
+                              store_directory: str = FINGERPRINT_STORE_PATH) -> FingerprintIndex:
+        key = (collection_name, store_directory)
+        index = self._fingerprint_indexes.get(key)
+        if index is not None:
+            return index
+        with self._lock:
+            if key not in self._fingerprint_indexes:
+                self._fingerprint_indexes[key] = FingerprintIndex(
+                    os.path.join(store_directory, collection_name))
+            return self._fingerprint_indexes[key]
+
+    def get_substructure_index(self,
+                               collection_name: str,
+                               store_directory: str = SUBSTRUCTURE_STORE_PATH) -> SubstructureIndex:
+        key = (collection_name, store_directory)
+        index = self._substructure_indexes.get(key)
+        if index is not None:
+            return index
+        with self._lock:
+            if key not in self._substructure_indexes:
+                self._substructure_indexes[key] = SubstructureIndex(
+                    os.path.join(store_directory, collection_name))
+            return self._substructure_indexes[key]
+
+    def get_backend_searcher(self, collection_name: str, backend: str = None):
+        """
+        Return the searcher of the given similarity backend for a collection.
+        Every backend answers `query` / `query_batch` with Chroma's result layout.
+        """
+        backend = backend or SIMILARITY_BACKEND
+        if backend == "polybert":
+            return self.get_searcher(collection_name)
+        if backend == "fingerprint":
+            return self.get_fingerprint_index(collection_name)
+        if backend == "hybrid":
+            return HybridSearcher(self.get_fingerprint_index(collection_name),
+                                  self.get_searcher(collection_name))
+        raise ValueError(
+            f"Unknown similarity backend {backend}, expected one of {SIMILARITY_BACKENDS}")
+
+    def warmup(self, collection_names: list = (CHROMADB_SMILES_DB_NAME,
+                                               CHROMADB_PSMILES_DB_NAME)):
+        """
+        Eagerly load the encoder and open the given collections, e.g. at app startup.
+        """
+        for collection_name in collection_names:
+            self.get_searcher(collection_name)
+
+    def close(self, collection_name: str = None):
+        """
+        Drop cached searchers. Without a collection name every searcher, client
+        and encoder is released; otherwise only that collection's searchers.
+        """
+        with self._lock:
+            if collection_name is not None:
+                for key in [k for k in self._searchers if k[0] == collection_name]:
+                    del self._searchers[key]
+                for key in [k for k in self._fingerprint_indexes if k[0] == collection_name]:
+                    del self._fingerprint_indexes[key]
+                for key in [k for k in self._substructure_indexes if k[0] == collection_name]:
+                    del self._substructure_indexes[key]
+                return
+            self._searchers.clear()
+            self._fingerprint_indexes.clear()
+            self._substructure_indexes.clear()
+            for client in self._clients.values():
+                # chromadb keeps one shared system per path, clear it so a
+                # reload actually re-opens the store from disk
+                if hasattr(client, "clear_system_cache"):
+                    client.clear_system_cache()
+            self._clients.clear()
+            self._encoders.clear()
+            for cache in self._embedding_caches.values():
+                if cache.disk_store is not None:
+                    cache.disk_store.flush()
+
+    def reload(self, collection_name: str = None):
+        """
+        Close and re-open searchers, picking up a rebuilt store or a new model.
+        """
+        with self._lock:
+            loaded = [k for k in self._searchers
+                      if collection_name is None or k[0] == collection_name]
+            if not loaded and collection_name is not None:
+                loaded = [(collection_name, None, None)]
+            self.close(collection_name)
+            for key in loaded:
+                self.get_searcher(*key)
+
+
+searcher_registry = SearcherRegistry()
@@ -0,0 +1,132 @@
+import os
+import copy
+import json
+import inspect
+import threading
+from functools import wraps
+
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "1") != "0"
+# PDB ids are case-insensitive, so call keys use their upper case form; SMILES are
+# keyed as given, tools echo them and report atom indices in the caller's atom order
+PDB_ID_ARGUMENTS = {"pdb_id", "pdb_ids"}
+
+
+class _Call():
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    """
+    Coalesces identical concurrent calls: while a call for a key is running,
+    further calls with the same key wait for it and share its outcome
+    instead of doing the work again. Nothing is cached once the call has
+    finished, the next call for the key executes afresh.
+
+    Every caller gets its own deep copy of the result, since callers mutate
+    tool results (e.g. popping images before they go back to the model).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced
+            }
+
+
+single_flight = SingleFlight()
+
+
+def _normalize(value, normalize):
+    if isinstance(value, str):
+        return normalize(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item, normalize) for item in value]
+    return value
+
+
+def normalize_argument(parameter: str, value):
+    """
+    Form of a tool argument in call keys: upper case PDB ids, every other
+    argument as it is.
+    """
+    if parameter in PDB_ID_ARGUMENTS:
+        return _normalize(value, lambda pdb_id: pdb_id.strip().upper())
+    return value
+
+
+def call_key(name: str, fn, args: tuple, kwargs: dict):
+    """
+    Key of a call: the tool name and its arguments bound to the signature with
+    defaults applied and PDB ids upper-cased, so positional, keyword and
+    defaulted spellings of the same call match. None when the arguments cannot be serialized.
+    """
+    try:
+        bound = inspect.signature(fn).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {parameter: normalize_argument(parameter, value)
+                     for parameter, value in bound.arguments.items()}
+        return name + ":" + json.dumps(arguments, sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+
+
+def coalesced(name: str, fn):
+    """
+    Wrap a tool callable so identical concurrent calls share one execution.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = call_key(name, fn, args, kwargs)
+        if key is None:
+            return fn(*args, **kwargs)
+        return single_flight.do(key, fn, *args, **kwargs)
+    return wrapper
+
+
+def coalesce_tools(tool_map: list, exclude: list = None) -> list:
+    """
+    Replace every `callable` of a tool map with its coalesced wrapper, except
+    those of the tools mapped in `exclude`: tools whose result differs from
+    call to call (e.g. sampling generators) must not share one.
+    """
+    exclude = set(exclude or [])
+    if SINGLE_FLIGHT_ENABLED:
+        for tool in tool_map:
+            if tool["map"] not in exclude:
+                tool["callable"] = coalesced(tool["map"], tool["callable"])
+    return tool_map
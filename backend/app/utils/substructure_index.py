@@ -0,0 +1,328 @@
+"""
+Substructure (SMARTS) search over the SMILES / PSMILES libraries.
+
+Every molecule's RDKit pattern fingerprint is stored packed, next to the
+molecule itself as an RDKit binary. A query is screened against the whole
+matrix first: a molecule can only contain the query if its fingerprint has
+every bit of the query's set. Only the survivors are parsed and verified
+with `HasSubstructMatch`, in chunks across a process pool, and matches are
+yielded as their chunk finishes.
+
+Build a library from the same inputs as the similarity collections (or
+from a fingerprint store's smiles.txt), from the backend directory:
+
+    python -m app.utils.substructure_index data/smiles.csv.gz --collection smiles_data
+    python -m app.utils.substructure_index data/polymers.smi --collection psmiles_data --kind psmiles
+"""
+import os
+import json
+import uuid
+import shutil
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from rdkit import Chem, DataStructs, RDLogger
+from app.utils.embedding_cache import canonical_smiles_from_mol
+
+SUBSTRUCTURE_STORE_PATH = "./dist/substructure_store"
+PATTERN_FP_BITS = 2048
+SUBSTRUCTURE_WORKERS = int(os.environ.get("SUBSTRUCTURE_WORKERS", min(8, os.cpu_count() or 1)))
+# survivors verified per pool task
+SUBSTRUCTURE_VERIFY_CHUNK = int(os.environ.get("SUBSTRUCTURE_VERIFY_CHUNK", 1000))
+SUBSTRUCTURE_MAX_HITS = int(os.environ.get("SUBSTRUCTURE_MAX_HITS", 1000))
+
+
+def pattern_fingerprint(mol, n_bits: int = PATTERN_FP_BITS) -> np.ndarray:
+    """
+    Return the RDKit pattern fingerprint of a molecule or query packed into n_bits / 8 bytes.
+    """
+    bits = np.zeros((n_bits,), dtype=np.uint8)
+    DataStructs.ConvertToNumpyArray(Chem.PatternFingerprint(mol, fpSize=n_bits), bits)
+    return np.packbits(bits)
+
+
+def parse_query(smarts: str):
+    query = Chem.MolFromSmarts(smarts.strip()) if smarts else None
+    if query is None:
+        raise ValueError(f"Invalid SMARTS: {smarts}")
+    return query
+
+
+class SubstructureIndexWriter():
+    """
+    Streams molecules into a `SubstructureIndex` directory: packed pattern
+    fingerprints to `fingerprints.u8`, RDKit binaries to `mols.bin` with
+    their end offsets in `offsets.i64`, and the SMILES to `smiles.txt`.
+    The library is built in a sibling `.tmp` directory and swapped in by
+    `close()`, so a library already open (memory-mapped) keeps reading the
+    previous files intact during a rebuild.
+    """
+
+    def __init__(self, path: str, n_bits: int = PATTERN_FP_BITS):
+        self.path = path
+        self.n_bits = n_bits
+        self._build_path = path + ".tmp"
+        shutil.rmtree(self._build_path, ignore_errors=True)
+        os.makedirs(self._build_path)
+        self.count = 0
+        self._offset = 0
+        self._fingerprints = open(os.path.join(self._build_path, "fingerprints.u8"), "wb")
+        self._mols = open(os.path.join(self._build_path, "mols.bin"), "wb")
+        self._offsets = open(os.path.join(self._build_path, "offsets.i64"), "wb")
+        self._smiles = open(os.path.join(self._build_path, "smiles.txt"), "w")
+
+    def add_packed(self, smiles: str, packed: np.ndarray, binary: bytes):
+        self._fingerprints.write(packed.tobytes())
+        self._mols.write(binary)
+        self._offset += len(binary)
+        self._offsets.write(np.int64(self._offset).tobytes())
+        self._smiles.write(smiles + "\n")
+        self.count += 1
+
+    def add_mol(self, smiles: str, mol):
+        self.add_packed(smiles, pattern_fingerprint(mol, self.n_bits), mol.ToBinary())
+
+    def close(self):
+        for f in (self._fingerprints, self._mols, self._offsets, self._smiles):
+            f.close()
+        with open(os.path.join(self._build_path, "meta.json"), "w") as f:
+            json.dump({"n_bits": self.n_bits, "count": self.count,
+                       "build_id": uuid.uuid4().hex}, f)
+        # a directory only replaces an empty one, the previous library is moved
+        # aside first; open memmaps keep its files alive after the rmtree
+        previous_path = self.path + ".old"
+        shutil.rmtree(previous_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, previous_path)
+        os.replace(self._build_path, self.path)
+        shutil.rmtree(previous_path, ignore_errors=True)
+
+
+class SubstructureIndex():
+    """
+    Read-only substructure library. Fingerprints, binaries and offsets are
+    memory-mapped, so the pool workers verifying a query share their pages
+    with the serving process.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = 1 << 16):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.n_bits = meta["n_bits"]
+        self.count = meta["count"]
+        self.build_id = meta.get("build_id")
+        n_bytes = self.n_bits // 8
+        if self.count:
+            self.fingerprints = np.memmap(os.path.join(path, "fingerprints.u8"),
+                                          dtype=np.uint8, mode="r", shape=(self.count, n_bytes))
+            self.offsets = np.memmap(os.path.join(path, "offsets.i64"),
+                                     dtype=np.int64, mode="r", shape=(self.count,))
+            self.mols = np.memmap(os.path.join(path, "mols.bin"), dtype=np.uint8, mode="r")
+        else:
+            self.fingerprints = np.zeros((0, n_bytes), dtype=np.uint8)
+            self.offsets = np.zeros((0,), dtype=np.int64)
+            self.mols = np.zeros((0,), dtype=np.uint8)
+        with open(os.path.join(path, "smiles.txt"), "r") as f:
+            self.smiles = [line.rstrip("\n") for _, line in zip(range(self.count), f)]
+
+    @classmethod
+    def build(cls, path: str, smiles_list, n_bits: int = PATTERN_FP_BITS):
+        RDLogger.DisableLog("rdApp.*")
+        writer = SubstructureIndexWriter(path, n_bits=n_bits)
+        for smiles in smiles_list:
+            mol = Chem.MolFromSmiles(smiles)
+            if mol is not None:
+                writer.add_mol(smiles, mol)
+        writer.close()
+        return cls(path)
+
+    def __len__(self):
+        return self.count
+
+    def mol(self, row: int):
+        start = int(self.offsets[row - 1]) if row else 0
+        return Chem.Mol(self.mols[start:int(self.offsets[row])].tobytes())
+
+    def screen(self, query_fp: np.ndarray, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Rows in [start, stop) whose fingerprint holds every bit of the query's.
+        """
+        rows = self.fingerprints[start:stop]
+        keep = np.all(np.bitwise_and(rows, query_fp) == query_fp, axis=1)
+        return np.flatnonzero(keep) + start
+
+    def verify(self, query, rows) -> list:
+        """
+        Return (row, coverage) of the rows that contain the query, coverage
+        being the fraction of the molecule's atoms the query accounts for.
+        """
+        matches = []
+        n_query = query.GetNumAtoms()
+        for row in rows:
+            mol = self.mol(int(row))
+            if mol.HasSubstructMatch(query):
+                matches.append((int(row), n_query / max(mol.GetNumAtoms(), 1)))
+        return matches
+
+    def iter_candidates(self, query_fp: np.ndarray, chunk_size: int):
+        # screen lazily, so the first matches do not wait for the whole library
+        for start in range(0, self.count, self.chunk_rows):
+            rows = self.screen(query_fp, start, start + self.chunk_rows)
+            for i in range(0, len(rows), chunk_size):
+                yield rows[i:i + chunk_size]
+
+    def iter_matches(self, smarts: str, max_hits: int = SUBSTRUCTURE_MAX_HITS,
+                     workers: int = None, chunk_size: int = SUBSTRUCTURE_VERIFY_CHUNK):
+        """
+        Yield {"row", "smiles", "coverage"} for every molecule containing the
+        SMARTS query, in library order, stopping after `max_hits`. Survivors
+        of the fingerprint screen are verified in the worker pool (inline
+        with one worker). Raises ValueError for an invalid query.
+        """
+        query = parse_query(smarts)
+        if max_hits <= 0:
+            return
+        query_fp = pattern_fingerprint(query, self.n_bits)
+        workers = SUBSTRUCTURE_WORKERS if workers is None else workers
+        if workers <= 1:
+            results = (self.verify(query, rows)
+                       for rows in self.iter_candidates(query_fp, chunk_size))
+        else:
+            results = self._iter_pool_results(smarts, query_fp, chunk_size, workers)
+        hits = 0
+        try:
+            for matches in results:
+                for row, coverage in matches:
+                    yield {"row": row, "smiles": self.smiles[row], "coverage": round(coverage, 4)}
+                    hits += 1
+                    if hits >= max_hits:
+                        return
+        finally:
+            results.close()
+
+    def _iter_pool_results(self, smarts: str, query_fp: np.ndarray, chunk_size: int, workers: int):
+        # a bounded window of chunks in flight, results come back in submission order
+        pool = _get_pool()
+        pending = deque()
+
+        def result(future, rows):
+            # None: the worker only finds a rebuilt library, verify against ours
+            matches = future.result()
+            return self.verify(parse_query(smarts), rows) if matches is None else matches
+        try:
+            for rows in self.iter_candidates(query_fp, chunk_size):
+                future = pool.submit(_verify_rows, self.path, self.count, self.build_id, smarts, rows)
+                pending.append((future, rows))
+                if len(pending) >= workers * 2:
+                    yield result(*pending.popleft())
+            while pending:
+                yield result(*pending.popleft())
+        finally:
+            for future, _ in pending:
+                future.cancel()
+
+
+# libraries opened by pool workers, keyed by (path, count, build_id) so a rebuilt library is reopened
+_worker_indexes = {}
+
+
+def _verify_rows(path: str, count: int, build_id: str, smarts: str, rows) -> list:
+    RDLogger.DisableLog("rdApp.*")
+    key = (path, count, build_id)
+    index = _worker_indexes.get(key)
+    if index is None:
+        index = SubstructureIndex(path)
+        if (index.count, index.build_id) != (count, build_id):
+            return None
+        _worker_indexes[key] = index
+    return index.verify(parse_query(smarts), rows)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=SUBSTRUCTURE_WORKERS)
+        return _pool
+
+
+def shutdown_substructure_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def pattern_chunk(chunk: list, kind: str = "smiles", n_bits: int = PATTERN_FP_BITS) -> list:
+    """
+    Canonicalize a chunk of strings into (canonical, packed pattern
+    fingerprint, RDKit binary); invalid entries come back as None. PSMILES
+    need at least two wildcard atoms to be valid.
+    """
+    RDLogger.DisableLog("rdApp.*")
+    rows = []
+    for smiles in chunk:
+        mol = Chem.MolFromSmiles(smiles.strip()) if smiles else None
+        if mol is not None and kind == "psmiles":
+            if sum(1 for atom in mol.GetAtoms() if atom.GetSymbol() == "*") < 2:
+                mol = None
+        if mol is None:
+            rows.append(None)
+        else:
+            rows.append((canonical_smiles_from_mol(mol), pattern_fingerprint(mol, n_bits), mol.ToBinary()))
+    return rows
+
+
+def main(argv=None):
+    # the input readers live with the similarity index builder
+    from app.utils.index_builder import iter_input_records, iter_chunks
+
+    parser = argparse.ArgumentParser(description="Build a substructure search library from a file")
+    parser.add_argument("input", help="CSV, .smi or text file, optionally .gz")
+    parser.add_argument("--collection", required=True,
+                        help="library name, e.g. smiles_data or psmiles_data")
+    parser.add_argument("--kind", choices=["smiles", "psmiles"], default="smiles")
+    parser.add_argument("--column", default=None, help="CSV column holding the strings")
+    parser.add_argument("--store-directory", default=SUBSTRUCTURE_STORE_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    writer = SubstructureIndexWriter(os.path.join(args.store_directory, args.collection))
+    workers = args.workers or os.cpu_count()
+    seen = set()
+    invalid = 0
+
+    def add(rows):
+        nonlocal invalid
+        for row in rows:
+            if row is None:
+                invalid += 1
+            elif row[0] not in seen:
+                seen.add(row[0])
+                writer.add_packed(*row)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # a bounded window of chunks in flight keeps the input streamed
+        pending = deque()
+        for chunk in iter_chunks(iter_input_records(args.input, args.column), args.chunk_size):
+            pending.append(pool.submit(pattern_chunk, chunk, args.kind))
+            if len(pending) >= workers * 2:
+                add(pending.popleft().result())
+        while pending:
+            add(pending.popleft().result())
+    writer.close()
+    print(f"[+] Done: {writer.count} molecules indexed, {invalid} invalid")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,31 @@
 #################################
-from pypdb import get_info
-import requests
 from rdkit import Chem
 from rdkit.Chem import Draw
 from rdkit.Chem import Descriptors
 from io import BytesIO
 import base64
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import json
-from dataclasses import dataclass
-from typing import List, Dict, Any
+from dataclasses import dataclass, replace
+from typing import List, Dict, Any, Optional
 from urllib.parse import urlencode
-from app.utils.generators.BRICSGenerator import BRICSGenerator
+from app.utils.generators.BRICSGenerator import BRICSGenerator, BRICS_MAX_CANDIDATES, BRICS_MAX_DEPTH, BRICS_TIME_BUDGET_S, BRICS_WORKERS
 from app.utils.generators.LSTMGenerator import RNNPolymerGenerator
+from app.utils.searchers import (
+    ChromaSearcher,
+    searcher_registry,
+    CHROMADB_SMILES_DB_NAME,
+    CHROMADB_PSMILES_DB_NAME,
+    CHROMADB_PERSISTENT_PATH
+)
+from app.utils.substructure_index import SUBSTRUCTURE_MAX_HITS
+from app.utils.mol_cache import mol_cache
+from app.utils.descriptors import molecule_descriptors, polymer_descriptors, compute_descriptor_columns, MAX_BULK_SMILES
+from app.utils.oligomers import oligomer_series, polymer_open_bond_indices
+from app.utils.depiction import depict_many, depict_base64, DEPICTION_FORMAT
+from app.utils.image_refs import image_fields, image_reference, IMAGE_DELIVERY_MODE
+from app.utils.pdb_mirror import get_pdb_mirror, mirror_lookup, PDB_OFFLINE
+from app.utils.pdb_cache import pdb_cache, cached, cached_many, CODECS, PDB_CACHE_ENABLED
+from app.utils.http_client import get_http_session, fetch_all, RCSB_DATA_URL, RCSB_SEARCH_URL, RCSB_IMAGE_URL
 
 # from utils.generators.BRICSGenerator import BRICSGenerator
 # from utils.generators.LSTMGenerator import RNNPolymerGenerator
@@ -23,10 +34,34 @@ from app.utils.generators.LSTMGenerator import RNNPolymerGenerator
 # from generators.LSTMGenerator import RNNPolymerGenerator
 
 ##### Testing Setup ##############
-CHROMADB_SMILES_DB_NAME = "smiles_data"
-CHROMADB_PSMILES_DB_NAME = "psmiles_data"
-CHROMADB_PERSISTENT_PATH = "./dist/chroma_store"
-RCSB_URL = "https://search.rcsb.org/rcsbsearch/v2/query"
+RCSB_URL = RCSB_SEARCH_URL
+# hits requested per page when walking RCSB structure similarity results
+RCSB_PAGE_SIZE = 25
+# upper bound on the candidates of a single similar-proteins call
+RCSB_MAX_CANDIDATES = 1000
+# entries fetched per GraphQL request in the batch protein explorer
+RCSB_GRAPHQL_BATCH_SIZE = 100
+# only the fields read by extract_simplified_pdb_data
+RCSB_ENTRIES_QUERY = """
+query entries($ids: [String!]!) {
+  entries(entry_ids: $ids) {
+    rcsb_id
+    struct { title }
+    audit_author { name }
+    citation {
+      id rcsb_journal_abbrev journal_abbrev year journal_volume
+      page_first page_last pdbx_database_id_doi pdbx_database_id_pub_med
+    }
+    exptl { method }
+    rcsb_entry_info {
+      molecular_weight deposited_model_count polymer_entity_count
+      deposited_polymer_monomer_count resolution_combined
+    }
+    struct_keywords { text }
+    rcsb_accession_info { initial_release_date }
+  }
+}
+"""
 
 #################################
 # UTILS FUNCTIONS
@@ -77,9 +112,11 @@ def extract_simplified_pdb_data(pdb_data: dict) -> dict:
         else:
             pages = None
         simplified_data['Pages'] = pages
-        simplified_data['Doi'] = primary_citation.get('pdbx_database_id_doi')
+        # the REST API spells these pdbx_database_id_DOI / _PubMed, GraphQL lowercases them
+        simplified_data['Doi'] = primary_citation.get(
+            'pdbx_database_id_doi') or primary_citation.get('pdbx_database_id_DOI')
         simplified_data['Pubmed_Id'] = primary_citation.get(
-            'pdbx_database_id_pub_med')
+            'pdbx_database_id_pub_med') or primary_citation.get('pdbx_database_id_PubMed')
     else:
         simplified_data['Journal'] = None
         simplified_data['Year'] = None
@@ -145,76 +182,186 @@ def extract_simplified_pdb_data(pdb_data: dict) -> dict:
     return simplified_data
 
 
+def download_pdb_entry(pdb_id: str) -> dict:
+    """
+    Fetch the raw entry record from the RCSB data API.
+    """
+    url = f"{RCSB_DATA_URL}/rest/v1/core/entry/{pdb_id.upper()}"
+    response = get_http_session().get(url)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_pdb_entry(pdb_id: str) -> dict:
+    mirrored, entry = mirror_lookup("entry", pdb_id)
+    if mirrored:
+        return entry
+    return cached("entry", pdb_id.upper(), lambda: download_pdb_entry(pdb_id))
+
+
 def get_pdb_info(pdb_id: str) -> dict:
     """
-    Return basic RDKit descriptors from a SMILES string.
+    Return the simplified summary of a PDB entry.
     """
-    info = get_info(pdb_id)
-    extract = extract_simplified_pdb_data(info)
-    return extract
+    def fetch():
+        # a refreshed summary always comes from a freshly downloaded entry
+        info = download_pdb_entry(pdb_id)
+        pdb_cache.put("entry", pdb_id.upper(), CODECS["json"][0](info))
+        return extract_simplified_pdb_data(info)
+
+    mirrored, entry = mirror_lookup("entry", pdb_id)
+    if mirrored:
+        return extract_simplified_pdb_data(entry)
+    if not PDB_CACHE_ENABLED:
+        return extract_simplified_pdb_data(download_pdb_entry(pdb_id))
+    return cached("summary", pdb_id.upper(), fetch)
+
+
+def drop_nulls(value):
+    # GraphQL returns null for absent objects where the REST API leaves the key out
+    if isinstance(value, dict):
+        return {k: drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_nulls(v) for v in value if v is not None]
+    return value
+
+
+def download_pdb_entries(pdb_ids: list) -> dict:
+    """
+    Fetch the entry records of many PDB IDs with one GraphQL request per
+    RCSB_GRAPHQL_BATCH_SIZE ids. IDs that RCSB does not know are left out.
+    """
+    entries = {}
+    for i in range(0, len(pdb_ids), RCSB_GRAPHQL_BATCH_SIZE):
+        chunk = [pdb_id.upper() for pdb_id in pdb_ids[i:i + RCSB_GRAPHQL_BATCH_SIZE]]
+        response = get_http_session().post(f"{RCSB_DATA_URL}/graphql",
+                                           json={"query": RCSB_ENTRIES_QUERY,
+                                                 "variables": {"ids": chunk}})
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get("errors") and not payload.get("data"):
+            raise ValueError(payload["errors"][0].get("message", "RCSB GraphQL query failed"))
+        for entry in (payload.get("data") or {}).get("entries") or []:
+            if entry is not None:
+                entries[entry["rcsb_id"].upper()] = drop_nulls(entry)
+    return entries
 
 
-def get_pdb_image(pdb_id: str):
-    url = f"https://cdn.rcsb.org/images/structures/{pdb_id.lower()}_assembly-1.jpeg"
-    # get the image using url and return the image data as base64 encoding
+def get_pdb_info_batch(pdb_ids: list) -> dict:
+    """
+    Return {PDB ID: simplified summary} for all the ids, None for unknown ids.
+    """
+    def fetch_many(missing):
+        return {pdb_id: extract_simplified_pdb_data(entry)
+                for pdb_id, entry in download_pdb_entries(missing).items()}
+
+    mirror = get_pdb_mirror()
+    infos = {}
+    remote = []
+    for pdb_id in dict.fromkeys(pdb_id.upper() for pdb_id in pdb_ids):
+        if mirror is not None and mirror.has("entry", pdb_id):
+            infos[pdb_id] = extract_simplified_pdb_data(mirror.read("entry", pdb_id))
+        elif PDB_OFFLINE:
+            infos[pdb_id] = None
+        else:
+            remote.append(pdb_id)
+    if remote:
+        infos.update(cached_many("summary", remote, fetch_many))
+    return infos
+
 
-    image_value = None
-    response = requests.get(url)
+def download_pdb_image(pdb_id: str):
+    url = f"{RCSB_IMAGE_URL}/{pdb_id.lower()}_assembly-1.jpeg"
+    # get the assembly image as raw JPEG bytes, None when RCSB has none
+    response = get_http_session().get(url)
     if response.status_code == 200:
-        image_value = response.content
-        if image_value is None:
-            raise HTTPException(
-                status_code=400, detail="Failed to get image data")
+        return response.content
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return None
+
+
+def get_pdb_image_bytes(pdb_id: str):
+    try:
+        mirrored, image = mirror_lookup("image", pdb_id)
+    except LookupError:
+        # offline and not mirrored, the entry is shown without an image
+        return None
+    if mirrored:
+        return image
+    return cached("image", pdb_id.upper(), lambda: download_pdb_image(pdb_id), codec="bytes")
+
+
+def get_pdb_image(pdb_id: str):
+    # get the image using url and return the image data as base64 encoding
+    image_value = get_pdb_image_bytes(pdb_id)
+    if image_value is not None:
         image_base64 = base64.b64encode(image_value).decode("utf-8")
         return image_base64
 
 
-class ChromaSearcher():
-    def __init__(self,
-                 collection_name: str,
-                 persist_directory: str):
-        self.persist_directory = persist_directory
-        self.client = chromadb.PersistentClient(path=self.persist_directory)
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name)
-        self.model = SentenceTransformer('kuelumbus/polyBERT')
+def format_search_hits(metadatas, distances, image_format=None, image_size=None):
+    image_format = image_format or DEPICTION_FORMAT
+    size = (image_size or 100, image_size or 100)
+    formatted_results = []
+    identifiers = [metadata.get("smiles" if "smiles" in metadata else "SMILES")
+                   for metadata in metadatas]
+    if IMAGE_DELIVERY_MODE == "ref":
+        for identifier, distance in zip(identifiers, distances):
+            formatted_results.append({
+                "identifier": identifier,
+                "score": distance,
+                **image_reference("smiles", identifier, size, image_format),
+                "image_format": image_format
+            })
+        return formatted_results
+    # cached depictions are reused, the rest are rendered together in the worker pool
+    images = depict_many(identifiers, size=size, fmt=image_format)
+    for identifier, distance, image in zip(identifiers, distances, images):
+        formatted_results.append({
+            "identifier": identifier,
+            "score": distance,
+            "image": base64.b64encode(image).decode("utf-8"),
+            "image_format": image_format
+        })
+    return formatted_results
 
-    def get_embedding(self, smiles: str):
-        return self.model.encode(smiles).tolist()
 
-    def query(self, query_val: str, top_k: int = 3):
-        embedding = self.get_embedding(query_val)
-        return self.collection.query(query_embeddings=[embedding],
-                                     n_results=top_k)
+def format_smiles_search_results(results, image_format=None, image_size=None):
+    print("result recieved >>", results)
+    formatted_results = format_search_hits(results["metadatas"][0],
+                                           results["distances"][0],
+                                           image_format, image_size)
+    return {"status": "success", "results": formatted_results}
 
 
-def format_smiles_search_results(results):
+def format_smiles_batch_search_results(queries, results):
     formatted_results = []
-    # try:
-    print("result recieved >>", results)
-    smiles_key_str = "smiles" if "smiles" in results["metadatas"][0][0] else "SMILES"
-    for metadata, distance in zip(results["metadatas"][0], results["distances"][0]):
-        mol = Chem.MolFromSmiles(metadata.get(smiles_key_str))
-        img = Draw.MolToImage(mol, size=(100, 100))
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        image_data = base64.b64encode(buffer.read()).decode("utf-8")
+    for query, metadatas, distances in zip(queries,
+                                           results["metadatas"],
+                                           results["distances"]):
         formatted_results.append({
-            "identifier": metadata.get(smiles_key_str),
-            "score": distance,
-            "image": image_data
+            "query": query,
+            "hits": format_search_hits(metadatas, distances)
         })
     return {"status": "success", "results": formatted_results}
 
 
 def get_smiles_search(collection_name, payload):
-    searcher = ChromaSearcher(
-        collection_name=collection_name, persist_directory=CHROMADB_PERSISTENT_PATH)
+    searcher = searcher_registry.get_backend_searcher(
+        collection_name, payload.get("backend"))
     results = searcher.query(payload["data"], top_k=payload["k"])
     return format_smiles_search_results(results)
 
 
+def get_smiles_search_batch(collection_name, payload):
+    searcher = searcher_registry.get_backend_searcher(
+        collection_name, payload.get("backend"))
+    results = searcher.query_batch(payload["data"], top_k=payload["k"])
+    return format_smiles_batch_search_results(payload["data"], results)
+
+
 @dataclass
 class RCSBQuery:
     entry_id: str
@@ -226,6 +373,8 @@ class RCSBQuery:
 class RCSBSearcher:
     def __init__(self):
         self.base_url = RCSB_URL
+        # set once a page asked for more hits than an offline mirror holds
+        self.truncated = False
 
     def build_query(self, query: RCSBQuery) -> Dict[str, Any]:
         return {
@@ -254,19 +403,63 @@ class RCSBSearcher:
         }
 
     def search(self, query: RCSBQuery) -> Dict[str, Any]:
+        mirrored, stored = mirror_lookup("similar", query.entry_id)
+        if mirrored:
+            stored = stored or {}
+            result_set = stored.get("result_set", [])
+            total_count = stored.get("total_count", len(result_set))
+            # the mirror keeps only the first MIRROR_SIMILAR_ROWS hits, pages past
+            # them come from RCSB, or offline end the results early
+            runs_out = query.start + query.rows > len(result_set) and total_count > len(result_set)
+            if not runs_out or PDB_OFFLINE:
+                self.truncated = self.truncated or runs_out
+                return {"result_set": result_set[query.start:query.start + query.rows],
+                        "total_count": total_count}
+        return self.fetch(query)
+
+    def iter_pages(self, query: RCSBQuery, limit: int = None):
+        """
+        Lazily walk the result pages of a query, starting at `query.start` with
+        `query.rows` hits per page, until `limit` hits were yielded or the
+        results run out. Each page is only requested once the previous one
+        has been consumed.
+        """
+        start = query.start
+        remaining = limit
+        while remaining is None or remaining > 0:
+            rows = query.rows if remaining is None else min(query.rows, remaining)
+            page = self.search(replace(query, start=start, rows=rows))
+            hits = page.get("result_set", [])
+            if not hits:
+                return
+            yield hits
+            start += len(hits)
+            if remaining is not None:
+                remaining -= len(hits)
+            if len(hits) < rows or start >= page.get("total_count", float("inf")):
+                return
+
+    def iter_hits(self, query: RCSBQuery, limit: int = None):
+        for hits in self.iter_pages(query, limit):
+            yield from hits
+
+    def fetch(self, query: RCSBQuery) -> Dict[str, Any]:
         query_dict = self.build_query(query)
         params = {"json": json.dumps(query_dict)}
         url = f"{self.base_url}?{urlencode(params)}"
 
-        response = requests.get(url)
+        response = get_http_session().get(url)
         response.raise_for_status()
+        # the search API answers 204 without a body when nothing matches
+        if response.status_code == 204:
+            return {"result_set": [], "total_count": 0}
         return response.json()
 
 #################################
 # MAIN TOOLS
 
 
-def get_smiles_details(smiles: str) -> dict:
+def get_smiles_details(smiles: str, image_format: Optional[str] = None, image_size: Optional[int] = None) -> dict:
     """
     Get details about a molecule from its SMILES string
 
@@ -277,40 +470,70 @@ def get_smiles_details(smiles: str) -> dict:
     Topological Polar Surface Area (TPSA), and Number of rings.
 
     :param smiles: SMILES string
+    :param image_format: image format of the depiction, "png", "webp" or "svg" (configured default if not given)
+    :param image_size: width and height of the depiction in pixels (600 if not given)
     :return: dict containing details about the molecule
     """
     try:
-        mol = Chem.MolFromSmiles(smiles)
-        if not mol:
+        # Basic properties about the molecule, see BASIC_DESCRIPTORS
+        info = mol_cache.get_descriptors(smiles, "basic", molecule_descriptors)
+        if info is None:
             return {"error": "Invalid SMILES"}
+        image_format = image_format or DEPICTION_FORMAT
+        size = (image_size or 600, image_size or 600)
+        image = image_fields("smiles", smiles,
+                             lambda: depict_base64(smiles, size=size, fmt=image_format),
+                             size=size, fmt=image_format)
+        return {"status": "success", "results": {"type": "smiles", "info": info, **image,
+                                                 "image_format": image_format, "id": smiles}}
+    except Exception as e:
+        return {"error": str(e)}
 
-        # Basic properties about the molecule:
-        # MolecularFormula  - chemical formula for the molecule
-        # MolecularWeight   - approximate weight in daltons
-        # NumHeavyAtoms     - count of non-hydrogen atoms
-        # NumHBD            - hydrogen bond donor count
-        # NumHBA            - hydrogen bond acceptor count
-        # NumRotatableBonds - number of freely rotating bonds
-        # TPSA              - topological polar surface area
-        # NumRings          - number of ring structures
-        info = {
-            "Molecular Formula": Chem.rdMolDescriptors.CalcMolFormula(mol),
-            "Molecular Weight": round(float(Descriptors.MolWt(mol)), 3),
-            "Heavy Atoms Count": Descriptors.HeavyAtomCount(mol),
-            "H Bond Donor Count": Descriptors.NumHDonors(mol),
-            "H Bond Acceptor Count": Descriptors.NumHAcceptors(mol),
-            "Rotatable Bonds Count": Descriptors.NumRotatableBonds(mol),
-            "TPSA": Descriptors.TPSA(mol),
-            "Number of Rings": Descriptors.RingCount(mol),
+
+def get_smiles_details_bulk(smiles_list: list[str], include_images: bool = False,
+                            image_format: Optional[str] = None, image_size: Optional[int] = None,
+                            descriptor_sets: Optional[list[str]] = None) -> dict:
+    """
+    Get details about many molecules at once from their SMILES strings
+
+    The bulk molecule explorer tool takes a list of SMILES strings, up to whole libraries of thousands of molecules,
+    and computes the same properties as the molecule explorer for all of them in parallel. The properties are
+    returned as columns (one list per property, in input order) together with an error mask marking the SMILES
+    that could not be parsed. Images are only rendered when asked for. Other descriptor sets can be computed
+    instead: "basic" (the molecule explorer properties), "lipinski" (rule of five), "rdkit" (all RDKit descriptors)
+    and "morgan_counts" (Morgan fingerprint bit counts).
+
+    :param smiles_list: List of SMILES strings
+    :param include_images: also render the 2D image of every valid molecule
+    :param image_format: image format of the depictions, "png", "webp" or "svg" (configured default if not given)
+    :param image_size: width and height of the depictions in pixels (100 if not given)
+    :param descriptor_sets: names of the descriptor sets to compute (["basic"] if not given)
+    :return: dict containing the property columns, error mask and per row errors
+    """
+    try:
+        if len(smiles_list) > MAX_BULK_SMILES:
+            return {"error": f"At most {MAX_BULK_SMILES} SMILES can be explored at once"}
+        table = compute_descriptor_columns(smiles_list, descriptor_sets or ["basic"])
+        results = {
+            "type": "smiles_table",
+            "smiles": smiles_list,
+            "count": len(smiles_list),
+            "valid": table["error_mask"].count(False),
+            **table
         }
-        if not mol:
-            return None
-        img = Draw.MolToImage(mol, size=(600, 600))
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        image = base64.b64encode(buffer.read()).decode("utf-8")
-        return {"status": "success", "results": {"type": "smiles", "info": info, "image": image, "id": smiles}}
+        if include_images:
+            image_format = image_format or DEPICTION_FORMAT
+            size = (image_size or 100, image_size or 100)
+            valid = [smiles for smiles, failed in zip(smiles_list, table["error_mask"]) if not failed]
+            if IMAGE_DELIVERY_MODE == "ref":
+                images = [image_reference("smiles", smiles, size, image_format)["image_url"] for smiles in valid]
+            else:
+                images = [base64.b64encode(image).decode("utf-8")
+                          for image in depict_many(valid, size=size, fmt=image_format)]
+            images = iter(images)
+            results["images"] = [None if failed else next(images) for failed in table["error_mask"]]
+            results["image_format"] = image_format
+        return {"status": "success", "results": results}
     except Exception as e:
         return {"error": str(e)}
 
@@ -329,13 +552,47 @@ def get_protein_details(pdb_id: str) -> dict:
     """
     try:
         pdb_info = get_pdb_info(pdb_id)
-        pdb_image = get_pdb_image(pdb_id)
-        return {"status": "success", "results": {"type": "protein", "info": pdb_info, "image": pdb_image, "id": pdb_id}}
+        pdb_image = image_fields("pdb", pdb_id, lambda: get_pdb_image(pdb_id), fmt="jpeg")
+        return {"status": "success", "results": {"type": "protein", "info": pdb_info, **pdb_image, "id": pdb_id}}
     except Exception as e:
         return {"error": str(e)}
 
 
-def get_polymer_details(psmiles: str) -> dict:
+def get_protein_details_batch(pdb_ids: list[str]) -> dict:
+    """
+    Get details about many proteins from their PDB IDs at once
+
+    The batch protein explorer tool takes a list of Protein Data Bank IDs (PDB IDs) and returns the same details
+    as the protein explorer for every one of them, fetched together in a single request. 
+    IDs that are not found in the PDB are returned with an error.
+
+    :param pdb_ids: List of PDB IDs
+    :return: dict containing details about every protein, in input order
+    """
+    try:
+        pdb_ids = [pdb_id.strip().upper() for pdb_id in pdb_ids]
+        infos = get_pdb_info_batch(pdb_ids)
+        found = [pdb_id for pdb_id in dict.fromkeys(pdb_ids) if infos.get(pdb_id) is not None]
+        if IMAGE_DELIVERY_MODE == "inline":
+            fetched = fetch_all(get_pdb_image, found)
+            images = {pdb_id: ({"image": fetch["value"]} if fetch["error"] is None
+                               else {"image": None, "error": fetch["error"]})
+                      for pdb_id, fetch in zip(found, fetched)}
+        else:
+            images = {pdb_id: image_reference("pdb", pdb_id, fmt="jpeg") for pdb_id in found}
+        returnable = []
+        for pdb_id in pdb_ids:
+            if infos.get(pdb_id) is None:
+                returnable.append({"type": "protein", "id": pdb_id, "info": None,
+                                   "error": f"PDB ID {pdb_id} not found"})
+                continue
+            returnable.append({"type": "protein", "info": infos[pdb_id], **images[pdb_id], "id": pdb_id})
+        return {"status": "success", "results": returnable}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def get_polymer_details(psmiles: str, image_format: Optional[str] = None, image_size: Optional[int] = None) -> dict:
     """
     Get details about a polymer from its PSMILES string
 
@@ -344,34 +601,55 @@ def get_polymer_details(psmiles: str) -> dict:
     indexes to indicate wher the potential bonds can be formed to connect with the next monomer.
 
     :param psmiles: PSMILES string
+    :param image_format: image format of the depiction, "png", "webp" or "svg" (configured default if not given)
+    :param image_size: width and height of the depiction in pixels (600 if not given)
     :return: dict containing details about the polymer
     """
     try:
-        mol = Chem.MolFromSmiles(psmiles)
+        mol = mol_cache.get_mol(psmiles)
 
-        # get indexes of [*] content in the PSMILES string
-        wildcard_indices = [atom.GetIdx()
-                            for atom in mol.GetAtoms() if atom.GetSymbol() == '*']
-        wildcard_indices = ",".join([str(index) for index in wildcard_indices])
+        # get indexes of [*] content in the PSMILES string, in the atom order of the input
+        wildcard_indices = ",".join([str(index) for index in polymer_open_bond_indices(mol)])
 
         info = {
-            "Molecular Formula": Chem.rdMolDescriptors.CalcMolFormula(mol),
-            "Monomer Molecular Weight": round(float(Descriptors.MolWt(mol)), 3),
-            "Number of Rings in Monomer": Descriptors.RingCount(mol),
+            **mol_cache.get_descriptors(psmiles, "polymer", polymer_descriptors),
             "Open Bond Indexes": wildcard_indices
         }
 
-        img = Draw.MolToImage(mol, size=(600, 600))
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        image = base64.b64encode(buffer.read()).decode("utf-8")
-        return {"status" : "success", "results": {"type": "psmiles", "info": info, "image": image, "id": psmiles}}
+        image_format = image_format or DEPICTION_FORMAT
+        size = (image_size or 600, image_size or 600)
+        image = image_fields("smiles", psmiles,
+                             lambda: depict_base64(psmiles, size=size, fmt=image_format),
+                             size=size, fmt=image_format)
+        return {"status" : "success", "results": {"type": "psmiles", "info": info, **image,
+                                                  "image_format": image_format, "id": psmiles}}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def get_polymer_oligomers(psmiles: str, max_n: int = 5, cap_ends: bool = True) -> dict:
+    """
+    Build oligomers of a polymer repeat unit and estimate its infinite chain properties
+
+    The oligomer builder joins 1 to max_n copies of the PSMILES repeat unit head to tail through its two open bonds [*]
+    and returns the SMILES and descriptors (Molecular Weight, Heavy Atoms Count, MolLogP, TPSA, Rotatable Bonds Count,
+    Number of Rings, H Bond Donor/Acceptor Count, Fraction CSP3, Heteroatom Fraction) of every n-mer. The descriptors
+    are extrapolated to an infinite chain: the contribution of one repeat unit and of the end groups for the additive
+    properties, and the limit value for the fractions.
+
+    :param psmiles: PSMILES string of the repeat unit, with exactly two [*]
+    :param max_n: largest number of repeat units to build (1 to 20, 5 if not given)
+    :param cap_ends: saturate the chain ends with hydrogens instead of leaving them open as [*]
+    :return: dict containing the oligomers and the infinite chain estimates
+    """
+    try:
+        series = oligomer_series(psmiles, max_n, cap_ends)
+        return {"status" : "success", "results": {"type": "oligomers", "id": series["psmiles"], **series}}
     except Exception as e:
         return {"error": str(e)}
 
 
-def get_similar_smiles(smiles: str) -> dict:
+def get_similar_smiles(smiles: str, num_candidates: int = 5, backend: Optional[str] = None) -> dict:
     """
     Get similar molecules from the chemical space using SMILES string
 
@@ -380,18 +658,21 @@ def get_similar_smiles(smiles: str) -> dict:
     indexes to indicate wher the potential bonds can be formed to connect with the next monomer.
 
     :param smiles: SMILES string
+    :param num_candidates: Number of candidates to retrieve
+    :param backend: "polybert" for embedding similarity, "fingerprint" for Morgan fingerprint Tanimoto similarity or "hybrid" for a fingerprint prefilter reranked by polyBERT (configured default if not given)
     :return: dict containing details about the similar molecules
     """
     # collection_name = CHROMADB_SMILES_DB_NAME
     collection_name = CHROMADB_SMILES_DB_NAME
     payload = {
         "data": smiles,
-        "k": 5
+        "k": num_candidates,
+        "backend": backend
     }
     return get_smiles_search(collection_name, payload)
 
 
-def get_similar_psmiles(psmiles: str) -> dict:
+def get_similar_psmiles(psmiles: str, num_candidates: int = 5, backend: Optional[str] = None) -> dict:
     """
     Get similar polymers from the chemical space using PMILES string
 
@@ -401,69 +682,227 @@ def get_similar_psmiles(psmiles: str) -> dict:
     the similarity distance from the queried PSMILES.
 
     :param psmiles: PSMILES string
+    :param num_candidates: Number of candidates to retrieve
+    :param backend: "polybert" for embedding similarity, "fingerprint" for Morgan fingerprint Tanimoto similarity or "hybrid" for a fingerprint prefilter reranked by polyBERT (configured default if not given)
     :return: dict containing details about the similar molecules
     """
     # collection_name = CHROMADB_PSMILES_DB_NAME
     collection_name = CHROMADB_PSMILES_DB_NAME
     payload = {
         "data": psmiles,
-        "k": 5
+        "k": num_candidates,
+        "backend": backend
     }
     return get_smiles_search(collection_name, payload)
 
 
-def get_similar_proteins(pdb_id: str) -> dict:
+def get_similar_smiles_batch(smiles_list: list[str], k: int = 5, backend: Optional[str] = None) -> dict:
+    """
+    Get similar molecules for many SMILES strings in one search
+
+    This tool takes a list of SMILES strings, encodes all of them in a single batch and
+    retrieves the k most similar molecules from the chemical space for each input. The
+    results hold one entry per input SMILES, in input order, with its list of hits.
+
+    :param smiles_list: List of SMILES strings
+    :param k: Number of candidates to retrieve per SMILES
+    :param backend: "polybert", "fingerprint" or "hybrid" similarity (configured default if not given)
+    :return: dict containing one list of similar molecules per input SMILES
+    """
+    payload = {
+        "data": smiles_list,
+        "k": k,
+        "backend": backend
+    }
+    return get_smiles_search_batch(CHROMADB_SMILES_DB_NAME, payload)
+
+
+def get_similar_psmiles_batch(psmiles_list: list[str], k: int = 5, backend: Optional[str] = None) -> dict:
+    """
+    Get similar polymers for many PSMILES strings in one search
+
+    This tool takes a list of PSMILES strings, encodes all of them in a single batch and
+    retrieves the k most similar polymers from the polymer space for each input. The
+    results hold one entry per input PSMILES, in input order, with its list of hits.
+
+    :param psmiles_list: List of PSMILES strings
+    :param k: Number of candidates to retrieve per PSMILES
+    :param backend: "polybert", "fingerprint" or "hybrid" similarity (configured default if not given)
+    :return: dict containing one list of similar polymers per input PSMILES
+    """
+    payload = {
+        "data": psmiles_list,
+        "k": k,
+        "backend": backend
+    }
+    return get_smiles_search_batch(CHROMADB_PSMILES_DB_NAME, payload)
+
+
+SUBSTRUCTURE_SPACES = {"smiles": CHROMADB_SMILES_DB_NAME, "psmiles": CHROMADB_PSMILES_DB_NAME}
+
+
+def iter_substructure_matches(smarts: str, space: str = "smiles", max_hits: int = 25):
+    """
+    Yield {"identifier", "coverage"} for the molecules of a chemical space
+    containing the SMARTS query, as they are verified.
+    """
+    if space not in SUBSTRUCTURE_SPACES:
+        raise ValueError(f"Unknown chemical space {space}, expected one of {list(SUBSTRUCTURE_SPACES)}")
+    index = searcher_registry.get_substructure_index(SUBSTRUCTURE_SPACES[space])
+    for match in index.iter_matches(smarts, max_hits=min(max_hits, SUBSTRUCTURE_MAX_HITS)):
+        yield {"identifier": match["smiles"], "coverage": match["coverage"]}
+
+
+def get_substructure_matches(smarts: str, space: str = "smiles", max_hits: int = 25) -> dict:
+    """
+    Find the molecules or polymers of the chemical space that contain a substructure
+
+    This tool takes a SMARTS pattern (plain SMILES work as well, * matches any atom) and returns the molecules of the
+    SMILES space, or the polymers of the PSMILES space, that contain it, with their images. The score of a hit is the
+    fraction of its atoms not covered by the pattern, so hits closest to the bare pattern score lowest.
+
+    :param smarts: SMARTS pattern of the substructure
+    :param space: "smiles" for the molecule space or "psmiles" for the polymer space
+    :param max_hits: maximum number of matches to return
+    :return: dict containing the matching molecules
+    """
+    try:
+        matches = list(iter_substructure_matches(smarts, space, max_hits))
+        hits = format_search_hits([{"smiles": match["identifier"]} for match in matches],
+                                  [round(1.0 - match["coverage"], 4) for match in matches])
+        return {"status": "success", "results": hits}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def enrich_protein_hits(hits: list, include_info: bool = False) -> list:
+    """
+    Attach the images (and with `include_info` the summaries) to a page of
+    RCSB hits. They are fetched concurrently; a hit whose fetch fails or
+    times out is still returned, with the error attached.
+    """
+    inline_images = IMAGE_DELIVERY_MODE == "inline"
+
+    def fetch_hit(identifier: str) -> dict:
+        fetched = {}
+        if inline_images:
+            fetched["image"] = get_pdb_image(identifier)
+        if include_info:
+            fetched["info"] = get_pdb_info(identifier)
+        return fetched
+
+    fetched = fetch_all(fetch_hit, [r["identifier"] for r in hits])
+    returnable = []
+    for r, fetch in zip(hits, fetched):
+        hit = {
+            "identifier": r["identifier"],
+            "score": r["score"],
+            "fetch_ms": fetch["fetch_ms"]
+        }
+        if inline_images:
+            hit["image"] = None
+        else:
+            hit.update(image_reference("pdb", r["identifier"], fmt="jpeg"))
+        if include_info:
+            hit["info"] = None
+        hit.update(fetch["value"] or {})
+        if fetch["error"] is not None:
+            hit["error"] = fetch["error"]
+        returnable.append(hit)
+    return returnable
+
+
+def similar_proteins_limit(num_candidates: int) -> tuple:
+    """
+    Number of candidates a similar-proteins call retrieves and whether
+    RCSB_MAX_CANDIDATES cut the requested number down to it.
+    """
+    requested = max(1, int(num_candidates))
+    return min(requested, RCSB_MAX_CANDIDATES), requested > RCSB_MAX_CANDIDATES
+
+
+def iter_similar_proteins(pdb_id: str, num_candidates: int = 5, include_info: bool = False,
+                          searcher: RCSBSearcher = None):
+    """
+    Yield the similar proteins of a PDB entry page by page, each page with
+    its images fetched, so results can be streamed as they arrive. At most
+    RCSB_MAX_CANDIDATES are retrieved, see `similar_proteins_limit`; pass a
+    `searcher` to read its `truncated` flag once the hits are consumed.
+    """
+    num_candidates, _ = similar_proteins_limit(num_candidates)
+    query = RCSBQuery(entry_id=pdb_id, rows=min(num_candidates, RCSB_PAGE_SIZE))
+    searcher = searcher or RCSBSearcher()
+    for hits in searcher.iter_pages(query, limit=num_candidates):
+        yield from enrich_protein_hits(hits, include_info)
+
+
+def get_similar_proteins(pdb_id: str, num_candidates: int = 5, include_info: bool = False) -> dict:
     """
     Get similar proteins from the chemical space using PDB ID
 
     This tool uses PDB ID (Protein Databank ID) string to retrieve similar proteins from the PDB space.
     This tool takes the PDB ID string with a the number of candidates to retrieve and does
     the operation and returns a JSON containing list of PDB Ids and corresponding similarity score. 
+    At most 1000 candidates are retrieved; "truncated" tells whether the requested number was cut
+    down to "num_candidates", or the offline PDB mirror holds fewer hits than requested.
 
     :param pdb_id: PDB ID
+    :param num_candidates: number of similar proteins to retrieve
+    :param include_info: also return the summary details of every similar protein
     :return: dict containing details about the similar proteins with their images
     """
-    query = RCSBQuery(entry_id=pdb_id, rows=5)
+    limit, truncated = similar_proteins_limit(num_candidates)
     searcher = RCSBSearcher()
-    results = searcher.search(query)
-    returnable = []
-    for r in results["result_set"]:
-        image_data = get_pdb_image(r["identifier"])
-        returnable.append({
-            "identifier": r["identifier"],
-            "score": r["score"],
-            "image": image_data
-        })
-    return {"status": "success", "results": returnable}
+    returnable = list(iter_similar_proteins(pdb_id, limit, include_info, searcher))
+    return {"status": "success", "results": returnable, "num_candidates": limit,
+            "truncated": truncated or searcher.truncated}
 
 
-def brics_generate_smiles(smiles_list: list[str]) -> list:
+def brics_generate_smiles(smiles_list: list[str], max_candidates: int = BRICS_MAX_CANDIDATES,
+                          max_depth: int = BRICS_MAX_DEPTH, time_budget_s: float = BRICS_TIME_BUDGET_S) -> dict:
     """
     Generate new molecules using BRICS decomposition and reconstruction for molecules using SMILES
 
     This tool uses SMILES string to generate molecules using BRICS algorithm. The algorithm generates hypothetical molecules based on the given input.
     The input is a list of SMILES string and the output is a list of molecules generated based on the input. 
+    The enumeration stops at max_candidates molecules or after time_budget_s seconds, and reports whether it was truncated.
+    The time budget is checked between generated molecules, so a slow joining step (and the decomposition before it) can
+    run past it.
 
     :param smiles_list: List of SMILES strings
-    :return: List of generated SMILES strings
+    :param max_candidates: Maximum number of molecules to generate
+    :param max_depth: Maximum number of fragment joining rounds
+    :param time_budget_s: Time budget of the enumeration in seconds
+    :return: dict with the generated SMILES strings ("candidates"), their "count" and whether a budget "truncated" the enumeration
     """
-    generator = BRICSGenerator()
-    return generator.generate(smiles_list)
+    generator = BRICSGenerator(workers=BRICS_WORKERS)
+    candidates, count, truncated = generator.generate(smiles_list, max_candidates=max_candidates,
+                                                      max_depth=max_depth, time_budget_s=time_budget_s)
+    return {"candidates": candidates, "count": count, "truncated": truncated}
 
 
-def brics_generate_polymer(psmiles_list: list[str]) -> list:
+def brics_generate_polymer(psmiles_list: list[str], max_candidates: int = BRICS_MAX_CANDIDATES,
+                           max_depth: int = BRICS_MAX_DEPTH, time_budget_s: float = BRICS_TIME_BUDGET_S) -> dict:
     """
     Generate new polymers using BRICS decomposition and reconstruction for polymer material using PSMILES
 
     This tool generates molecules using the BRICS algorithm. The BRICS algorithm is a rule-based algorithm that generates molecules based on the given input.
     The input is a list of PSMILES strings. The output will be a set of molecules that are generated based on the input.
-    It returns list of generated candidates from BRICS algorithm.
+    It returns the generated candidates from BRICS algorithm.
+    The enumeration stops at max_candidates polymers or after time_budget_s seconds, and reports whether it was truncated.
+    The time budget is checked between generated polymers, so a slow joining step (and the decomposition before it) can
+    run past it.
 
     :param psmiles_list: List of PSMILES strings
-    :return: List of generated PSMILES strings
+    :param max_candidates: Maximum number of polymers to generate
+    :param max_depth: Maximum number of fragment joining rounds
+    :param time_budget_s: Time budget of the enumeration in seconds
+    :return: dict with the generated PSMILES strings ("candidates"), their "count" and whether a budget "truncated" the enumeration
     """
-    generator = BRICSGenerator()
-    return generator.generate(psmiles_list, is_polymer=True)
+    generator = BRICSGenerator(workers=BRICS_WORKERS)
+    candidates, count, truncated = generator.generate(psmiles_list, is_polymer=True, max_candidates=max_candidates,
+                                                      max_depth=max_depth, time_budget_s=time_budget_s)
+    return {"candidates": candidates, "count": count, "truncated": truncated}
 
 
 def lstm_generate_psmiles(num_generations: int) -> list:
@@ -506,8 +945,11 @@ def lstm_generate_wdg(num_generations: int) -> list:
 
 
 master_tools = [get_smiles_details, get_protein_details,
-                get_polymer_details, get_similar_smiles,
+                get_smiles_details_bulk, get_protein_details_batch,
+                get_polymer_details, get_polymer_oligomers, get_similar_smiles,
                 get_similar_psmiles, get_similar_proteins,
+                get_similar_smiles_batch, get_similar_psmiles_batch,
+                get_substructure_matches,
                 brics_generate_smiles, brics_generate_polymer,
                 lstm_generate_psmiles, lstm_generate_wdg]
 
@@ -1,10 +1,18 @@
+from .single_flight import coalesce_tools
+from .generators.BRICSGenerator import BRICS_MAX_CANDIDATES, BRICS_MAX_DEPTH, BRICS_TIME_BUDGET_S
 from .tool_repository import (
     get_smiles_details,
+    get_smiles_details_bulk,
     get_protein_details,
+    get_protein_details_batch,
     get_polymer_details,
+    get_polymer_oligomers,
     get_similar_smiles,
     get_similar_psmiles,
     get_similar_proteins,
+    get_similar_smiles_batch,
+    get_similar_psmiles_batch,
+    get_substructure_matches,
     brics_generate_smiles,
     brics_generate_polymer,
     lstm_generate_psmiles,
@@ -16,13 +24,24 @@ tool_mapper = [
         "name": "Molecule Explorer",
         "map": "get_smiles_details",
         "description": """The molecule explorer tool takes SMILES string of the molecule and provides details in json with the 2D image of the chemical representation of the molecule and informations it's properties. The information panel shows different chemical details as Molecular Formula, Molecular Weight, Heavy Atoms Count, H Bond Doner Count, H Bond Acceptor Count, Rotatale Bonds Count, Topological Polar Surface Area (TPSA), and Number of rings.""",
-        "input_types": [str],
-        "input_parameters": ["smiles"],
-        "input_descriptions": ["SMILES string of the molecule"],
-        "default_inputs": [None],
+        "input_types": [str, str, int],
+        "input_parameters": ["smiles", "image_format", "image_size"],
+        "input_descriptions": ["SMILES string of the molecule", "Image format, png, webp or svg", "Image width and height in pixels"],
+        "default_inputs": [None, None, None],
         "output_types": [dict],
         "callable": get_smiles_details 
     },
+    {
+        "name": "Bulk Molecule Explorer",
+        "map": "get_smiles_details_bulk",
+        "description": """The bulk molecule explorer tool takes a list of SMILES strings, up to whole libraries of thousands of molecules, and computes the same properties as the molecule explorer for all of them in parallel. The properties are returned as columns (one list per property, in input order) together with an error mask marking the SMILES that could not be parsed. Images are only rendered when asked for. Other descriptor sets can be computed instead: basic (the molecule explorer properties), lipinski (rule of five), rdkit (all RDKit descriptors) and morgan_counts (Morgan fingerprint bit counts).""",
+        "input_types": [list, bool, str, int, list],
+        "input_parameters": ["smiles_list", "include_images", "image_format", "image_size", "descriptor_sets"],
+        "input_descriptions": ["List of SMILES strings", "Also render the 2D image of every valid molecule", "Image format of the depictions, png, webp or svg", "Width and height of the depictions in pixels", "Names of the descriptor sets to compute, basic, lipinski, rdkit or morgan_counts"],
+        "default_inputs": [None, False, None, None, None],
+        "output_types": [dict],
+        "callable": get_smiles_details_bulk
+    },
     {
         "name": "Protein Explorer",
         "map": "get_protein_details",
@@ -34,25 +53,47 @@ tool_mapper = [
         "output_types": [dict],
         "callable": get_protein_details 
     },
+    {
+        "name": "Batch Protein Explorer",
+        "map": "get_protein_details_batch",
+        "description" : """The batch protein explorer tool takes a list of Protein Data Bank IDs (PDB IDs) and returns the same details as the protein explorer for every one of them, fetched together in a single request. IDs that are not found in the PDB are returned with an error.""",
+        "input_types": [list],
+        "input_parameters": ["pdb_ids"],
+        "input_descriptions": ["List of PDB IDs of the proteins"],
+        "default_inputs": [None],
+        "output_types": [dict],
+        "callable": get_protein_details_batch
+    },
     {
         "name": "Polymer Explorer",
         "map": "get_polymer_details",
         "description": """The polymer explorer tool takes PSMILES of the polymer and returns it's 2D image along with relevant details as molecular formulaof the PSMILES, Monomer Molcular Weight, Number of rings in the Monomer, and the corresponding open bondindexes to indicate wher the potential bonds can be formed to connect with the next monomer.""",
-        "input_types": [str],
-        "input_parameters": ["psmiles"],
-        "input_descriptions": ["PSMILES of the polymer"],
-        "default_inputs": [None],
+        "input_types": [str, str, int],
+        "input_parameters": ["psmiles", "image_format", "image_size"],
+        "input_descriptions": ["PSMILES of the polymer", "Image format, png, webp or svg", "Image width and height in pixels"],
+        "default_inputs": [None, None, None],
         "output_types": [dict],
         "callable": get_polymer_details 
     },
+    {
+        "name": "Polymer Oligomer Builder",
+        "map": "get_polymer_oligomers",
+        "description": """The oligomer builder tool takes the PSMILES of a polymer repeat unit with two open bonds and joins 1 to max_n copies of it head to tail. It returns the SMILES and descriptors (Molecular Weight, Heavy Atoms Count, MolLogP, TPSA, Rotatable Bonds Count, Number of Rings, H Bond Donor/Acceptor Count, Fraction CSP3, Heteroatom Fraction) of every n-mer, along with their extrapolation to an infinite chain: the contribution of one repeat unit and of the end groups for additive properties, and the limit value for the fractions.""",
+        "input_types": [str, int, bool],
+        "input_parameters": ["psmiles", "max_n", "cap_ends"],
+        "input_descriptions": ["PSMILES of the repeat unit", "Largest number of repeat units to build, up to 20", "Saturate the chain ends with hydrogens instead of leaving them open"],
+        "default_inputs": [None, 5, True],
+        "output_types": [dict],
+        "callable": get_polymer_oligomers
+    },
     {
         "name": "SMILES Similarity Search",
         "map": "get_similar_smiles",
         "description": """ This tool uses SMILES string to retrieve similar molecules from the chemical space. This tool takes the SMILES string with a the number of candidates to retrieve and does the operation and returns a json that includes the image of the molecules (in base64 encoded strings)  with it's SMILES and the similarity distance from the query SMILES. The results can be downloadable in  a text as well as can be copied to the clipboard.""",
-        "input_types": [str, int],
-        "input_parameters": ["smiles", "num_candidates"],
-        "input_descriptions": ["SMILES string of the molecule", "Number of candidates to retrieve"],
-        "default_inputs": [None, 5],
+        "input_types": [str, int, str],
+        "input_parameters": ["smiles", "num_candidates", "backend"],
+        "input_descriptions": ["SMILES string of the molecule", "Number of candidates to retrieve", "Similarity backend, polybert, fingerprint or hybrid"],
+        "default_inputs": [None, 5, None],
         "output_types": [dict],
         "callable": get_similar_smiles 
     },
@@ -60,10 +101,10 @@ tool_mapper = [
         "name": "Polymer Similarity Search",
         "map": "get_similar_psmiles",
         "description": """ This tool uses PSMILES string to retrieve similar polymers from the polymer space. This tool takes the PSMILES string with a the number of candidates to retrieve and does the operation and returns the json containing image of the polymers with it's PSMILES and  the similarity distance from the queried PSMILES.""",
-        "input_types": [str, int],
-        "input_parameters": ["psmiles", "num_candidates"],
-        "input_descriptions": ["PSMILES string of the polymer", "Number of candidates to retrieve"],
-        "default_inputs": [None, 5],
+        "input_types": [str, int, str],
+        "input_parameters": ["psmiles", "num_candidates", "backend"],
+        "input_descriptions": ["PSMILES string of the polymer", "Number of candidates to retrieve", "Similarity backend, polybert, fingerprint or hybrid"],
+        "default_inputs": [None, 5, None],
         "output_types": [dict],
         "callable": get_similar_psmiles 
     },
@@ -71,32 +112,65 @@ tool_mapper = [
         "name": "Protein Similarity Search",
         "map": "get_similar_proteins",
         "description": """ This tool uses PDB ID (Protein Databank ID) string to retrieve similar proteins from the PDB space. This tool takes the PDB ID string with a the number of candidates to retrieve and does the operation and returns a JSON containing list of PDB Ids and corresponding similarity score.""",
-        "input_types": [str, int],
-        "input_parameters": ["pdb_id", "num_candidates"],
-        "input_descriptions": ["PDB ID of the protein", "Number of candidates to retrieve"],
-        "default_inputs": [None, 5],
+        "input_types": [str, int, bool],
+        "input_parameters": ["pdb_id", "num_candidates", "include_info"],
+        "input_descriptions": ["PDB ID of the protein", "Number of candidates to retrieve", "Also return the summary details of every similar protein"],
+        "default_inputs": [None, 5, False],
         "output_types": [dict],
         "callable": get_similar_proteins 
     },
+    {
+        "name": "Batch SMILES Similarity Search",
+        "map": "get_similar_smiles_batch",
+        "description": """ This tool takes a list of SMILES strings and retrieves similar molecules from the chemical space for every one of them in a single batched search. It returns one list of hits per input SMILES, in input order, each hit with the SMILES, the similarity distance and the image of the molecule.""",
+        "input_types": [list, int, str],
+        "input_parameters": ["smiles_list", "k", "backend"],
+        "input_descriptions": ["List of SMILES strings", "Number of candidates to retrieve per SMILES", "Similarity backend, polybert, fingerprint or hybrid"],
+        "default_inputs": [None, 5, None],
+        "output_types": [dict],
+        "callable": get_similar_smiles_batch
+    },
+    {
+        "name": "Batch Polymer Similarity Search",
+        "map": "get_similar_psmiles_batch",
+        "description": """ This tool takes a list of PSMILES strings and retrieves similar polymers from the polymer space for every one of them in a single batched search. It returns one list of hits per input PSMILES, in input order, each hit with the PSMILES, the similarity distance and the image of the polymer.""",
+        "input_types": [list, int, str],
+        "input_parameters": ["psmiles_list", "k", "backend"],
+        "input_descriptions": ["List of PSMILES strings", "Number of candidates to retrieve per PSMILES", "Similarity backend, polybert, fingerprint or hybrid"],
+        "default_inputs": [None, 5, None],
+        "output_types": [dict],
+        "callable": get_similar_psmiles_batch
+    },
+    {
+        "name": "Substructure Search",
+        "map": "get_substructure_matches",
+        "description": """ This tool finds the molecules of the SMILES space, or the polymers of the PSMILES space, that contain a substructure given as a SMARTS pattern (plain SMILES work as well, * matches any atom). It returns the matching SMILES or PSMILES with their images, scored by the fraction of their atoms the pattern does not cover.""",
+        "input_types": [str, str, int],
+        "input_parameters": ["smarts", "space", "max_hits"],
+        "input_descriptions": ["SMARTS pattern of the substructure", "Chemical space to search, smiles or psmiles", "Maximum number of matches to return"],
+        "default_inputs": [None, "smiles", 25],
+        "output_types": [dict],
+        "callable": get_substructure_matches
+    },
     {
         "name": "BRICS SMILES Generation",
         "map": "brics_generate_smiles",
-        "description": """ This tool uses SMILES string to generate molecules using BRICS algorithm. The algorithm generates hypothetical molecules based on the given input. The input is a list of SMILES string and the output is a list of molecules generated based on the input.""",
-        "input_types": [str],
-        "input_parameters": ["smiles_list"],
-        "input_descriptions": ["List of SMILES strings"],
-        "default_inputs": [None],
+        "description": """ This tool uses SMILES string to generate molecules using BRICS algorithm. The algorithm generates hypothetical molecules based on the given input. The input is a list of SMILES string and the output is the list of molecules generated based on the input ("candidates"), their "count" and whether the enumeration was "truncated". The enumeration stops at max_candidates molecules or after time_budget_s seconds; the time budget is checked between generated molecules, so a slow joining step can run past it.""",
+        "input_types": [str, int, int, float],
+        "input_parameters": ["smiles_list", "max_candidates", "max_depth", "time_budget_s"],
+        "input_descriptions": ["List of SMILES strings", "Maximum number of molecules to generate", "Maximum number of fragment joining rounds", "Time budget of the enumeration in seconds"],
+        "default_inputs": [None, BRICS_MAX_CANDIDATES, BRICS_MAX_DEPTH, BRICS_TIME_BUDGET_S],
         "output_types": [dict],
         "callable": brics_generate_smiles 
     },
     {
         "name": "BRICS PSMILES Generation",
         "map": "brics_generate_polymer",
-        "description": """ This tool generates molecules using the BRICS algorithm. The BRICS algorithm is a rule-based algorithm that generates molecules based on the given input. The input is a list of PSMILES strings. The output will be a set of molecules that are generated based on the input. It returns list of generated candidates from BRICS algorithm. """,
-        "input_types": [str],
-        "input_parameters": ["psmiles_list"],
-        "input_descriptions": ["List of PSMILES strings"],
-        "default_inputs": [None],
+        "description": """ This tool generates molecules using the BRICS algorithm. The BRICS algorithm is a rule-based algorithm that generates molecules based on the given input. The input is a list of PSMILES strings. The output will be a set of molecules that are generated based on the input. It returns the generated candidates from BRICS algorithm ("candidates"), their "count" and whether the enumeration was "truncated". The enumeration stops at max_candidates polymers or after time_budget_s seconds; the time budget is checked between generated polymers, so a slow joining step can run past it. """,
+        "input_types": [str, int, int, float],
+        "input_parameters": ["psmiles_list", "max_candidates", "max_depth", "time_budget_s"],
+        "input_descriptions": ["List of PSMILES strings", "Maximum number of polymers to generate", "Maximum number of fragment joining rounds", "Time budget of the enumeration in seconds"],
+        "default_inputs": [None, BRICS_MAX_CANDIDATES, BRICS_MAX_DEPTH, BRICS_TIME_BUDGET_S],
         "output_types": [dict],
         "callable": brics_generate_polymer 
     },
@@ -105,7 +179,7 @@ tool_mapper = [
         "map": "lstm_generate_psmiles",
         "description": """ This tool generates molecules using the LSTM algorithm. The LSTM algorithm is a deep learning algorithm that generates molecules for required iterations to get the desired number of candidates. The input is a list of PSMILES strings. It might return errors sometimes, if the input is not in the correct format. The output will be a set of molecules that are generated based on the input. """,
         "input_types": [int],
-        "input_parameters": ["num_candidates"],
+        "input_parameters": ["num_generations"],
         "input_descriptions": ["Number of candidates to generate"],
         "default_inputs": [5],
         "output_types": [dict],
@@ -116,10 +190,13 @@ tool_mapper = [
         "map": "lstm_generate_wdg",
         "description": """ This tool generates molecules using the LSTM algorithm. The LSTM algorithm is a deep learning algorithm that generates molecules for required iterations to get the desired number of candidates. The input is a list of weighted directed graph strings. It might return errors sometimes, if the input is not in the correct format.  The output will be a set of molecules that are generated based on the input. """,
         "input_types": [int],
-        "input_parameters": ["num_candidates"],
+        "input_parameters": ["num_generations"],
         "input_descriptions": ["Number of candidates to generate"],
         "default_inputs": [5],
         "output_types": [dict],
         "callable": lstm_generate_wdg 
     }
-]
\ No newline at end of file
+]
+
+# identical concurrent tool calls share one execution, except the sampling generators
+coalesce_tools(tool_mapper, exclude=["lstm_generate_psmiles", "lstm_generate_wdg"])
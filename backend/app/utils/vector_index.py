@@ -0,0 +1,346 @@
+"""
+Read-only, memory-mapped, quantized vector index for the similarity collections.
+
+The similarity collections never change between index builds, so instead of
+keeping a Chroma store resident in every worker they can be exported once to
+this format and memory-mapped; uvicorn workers then share the pages through
+the OS page cache. Vectors are stored either as per-dimension int8 codes or
+as product-quantized (PQ) codes, scanned flat or through IVF partitions.
+
+Export a collection from the backend directory:
+
+    python -m app.utils.vector_index smiles_data --quantization int8 --partitions 256
+"""
+import os
+import json
+import argparse
+import tempfile
+import numpy as np
+
+VECTOR_INDEX_PATH = "./dist/vector_index"
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 99) -> np.ndarray:
+    """
+    Plain Lloyd's k-means, returns the (k, dim) centroids.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = nearest_centroids(data, centroids)
+        for j in range(k):
+            members = data[assignment == j]
+            if len(members):
+                centroids[j] = members.mean(axis=0)
+            else:
+                # re-seed empty clusters on a random point
+                centroids[j] = data[rng.integers(len(data))]
+    return centroids
+
+
+def squared_distances(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return (np.sum(data ** 2, axis=1)[:, None]
+            - 2.0 * data @ centroids.T
+            + np.sum(centroids ** 2, axis=1)[None, :])
+
+
+def nearest_centroids(data: np.ndarray, centroids: np.ndarray, chunk_rows: int = 8192) -> np.ndarray:
+    assignment = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk_rows):
+        chunk = np.asarray(data[start:start + chunk_rows], dtype=np.float32)
+        assignment[start:start + chunk_rows] = np.argmin(
+            squared_distances(chunk, centroids), axis=1)
+    return assignment
+
+
+class Int8Quantizer():
+    """
+    Per-dimension affine quantization of float32 vectors to int8.
+    """
+
+    def __init__(self, minimum: np.ndarray, step: np.ndarray):
+        self.minimum = minimum.astype(np.float32)
+        self.step = step.astype(np.float32)
+
+    @classmethod
+    def train(cls, data: np.ndarray):
+        minimum = data.min(axis=0)
+        step = (data.max(axis=0) - minimum) / 255.0
+        return cls(minimum, np.where(step > 0, step, 1.0))
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        codes = np.rint((data - self.minimum) / self.step) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.minimum + (codes.astype(np.float32) + 128.0) * self.step
+
+    def distances(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        decoded = self.decode(codes)
+        return np.sum((decoded - query) ** 2, axis=1)
+
+    def save(self, path: str):
+        np.save(os.path.join(path, "int8_minimum.npy"), self.minimum)
+        np.save(os.path.join(path, "int8_step.npy"), self.step)
+
+    @classmethod
+    def load(cls, path: str):
+        return cls(np.load(os.path.join(path, "int8_minimum.npy")),
+                   np.load(os.path.join(path, "int8_step.npy")))
+
+
+class ProductQuantizer():
+    """
+    Product quantization: the vector is split into `m` sub-vectors, each
+    replaced by the index of its nearest of (up to) 256 sub-centroids.
+    Distances are computed asymmetrically from a per-query lookup table.
+    """
+
+    def __init__(self, codebooks: np.ndarray):
+        # (m, k, dim / m)
+        self.codebooks = codebooks.astype(np.float32)
+        self.m = codebooks.shape[0]
+
+    @classmethod
+    def train(cls, data: np.ndarray, m: int = 8, iterations: int = 20):
+        if data.shape[1] % m:
+            raise ValueError(f"Dimension {data.shape[1]} is not divisible by m={m}")
+        sub_dim = data.shape[1] // m
+        codebooks = [kmeans(data[:, j * sub_dim:(j + 1) * sub_dim], 256, iterations)
+                     for j in range(m)]
+        k = min(len(codebook) for codebook in codebooks)
+        return cls(np.stack([codebook[:k] for codebook in codebooks]))
+
+    def _sub_vectors(self, data: np.ndarray) -> np.ndarray:
+        return data.reshape(len(data), self.m, -1)
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        sub_vectors = self._sub_vectors(data)
+        codes = np.empty((len(data), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = nearest_centroids(sub_vectors[:, j], self.codebooks[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate([self.codebooks[j][codes[:, j]] for j in range(self.m)], axis=1)
+
+    def distances(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        sub_queries = query.reshape(self.m, -1)
+        table = np.sum((self.codebooks - sub_queries[:, None, :]) ** 2, axis=2)
+        return table[np.arange(self.m), codes].sum(axis=1)
+
+    def save(self, path: str):
+        np.save(os.path.join(path, "pq_codebooks.npy"), self.codebooks)
+
+    @classmethod
+    def load(cls, path: str):
+        return cls(np.load(os.path.join(path, "pq_codebooks.npy")))
+
+
+QUANTIZERS = {"int8": Int8Quantizer, "pq": ProductQuantizer}
+
+
+class VectorIndex():
+    """
+    Memory-mapped quantized vector index answering squared-L2 top-k queries,
+    Chroma's default metric, with Chroma's result layout.
+
+    Rows are stored grouped by IVF partition (a single partition for a flat
+    index); `nprobe` partitions closest to the query are scanned.
+    """
+
+    def __init__(self, path: str, nprobe: int = 8, chunk_rows: int = 8192):
+        self.path = path
+        self.nprobe = nprobe
+        self.chunk_rows = chunk_rows
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.count = self.meta["count"]
+        self.dim = self.meta["dim"]
+        self.quantizer = QUANTIZERS[self.meta["quantization"]].load(path)
+        if self.meta["quantization"] == "int8":
+            code_shape, code_dtype = (self.count, self.dim), np.int8
+        else:
+            code_shape, code_dtype = (self.count, self.quantizer.m), np.uint8
+        self.codes = np.memmap(os.path.join(path, "codes.bin"), dtype=code_dtype,
+                               mode="r", shape=code_shape) if self.count else np.zeros(
+                                   (0, code_shape[1]), dtype=code_dtype)
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        with open(os.path.join(path, "ids.txt"), "r") as f:
+            self.ids = [line.rstrip("\n") for line in f]
+        with open(os.path.join(path, "smiles.txt"), "r") as f:
+            self.smiles = [line.rstrip("\n") for line in f]
+        # id -> row, built by the first `get`
+        self._rows = None
+
+    def __len__(self):
+        return self.count
+
+    def _scan(self, query: np.ndarray, start: int, stop: int, top_k: int):
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_distances = np.zeros(0, dtype=np.float32)
+        for chunk_start in range(start, stop, self.chunk_rows):
+            chunk_stop = min(chunk_start + self.chunk_rows, stop)
+            distances = self.quantizer.distances(query, self.codes[chunk_start:chunk_stop])
+            best_rows = np.concatenate([best_rows, np.arange(chunk_start, chunk_stop)])
+            best_distances = np.concatenate([best_distances, distances])
+            if len(best_distances) > top_k:
+                keep = np.argpartition(best_distances, top_k - 1)[:top_k]
+                best_rows, best_distances = best_rows[keep], best_distances[keep]
+        return best_rows, best_distances
+
+    def search(self, query: np.ndarray, top_k: int = 3):
+        """
+        Return the (rows, squared distances) of the top_k nearest vectors.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        partitions = np.argsort(squared_distances(query[None, :], self.centroids)[0])
+        rows = np.zeros(0, dtype=np.int64)
+        distances = np.zeros(0, dtype=np.float32)
+        for partition in partitions[:self.nprobe]:
+            found_rows, found_distances = self._scan(
+                query, int(self.offsets[partition]), int(self.offsets[partition + 1]), top_k)
+            rows = np.concatenate([rows, found_rows])
+            distances = np.concatenate([distances, found_distances])
+        order = np.argsort(distances, kind="stable")[:top_k]
+        return rows[order], distances[order]
+
+    def get(self, ids: list, include: list = None):
+        """
+        Decoded (approximate) embeddings of the given ids, with Chroma's
+        `get` layout; unknown ids are left out.
+        """
+        if self._rows is None:
+            self._rows = {record: row for row, record in enumerate(self.ids)}
+        rows = [self._rows[record] for record in ids if record in self._rows]
+        embeddings = self.quantizer.decode(self.codes[rows]) if rows else np.zeros((0, self.dim), dtype=np.float32)
+        return {
+            "ids": [self.ids[row] for row in rows],
+            "embeddings": embeddings,
+            "metadatas": [{"smiles": self.smiles[row]} for row in rows]
+        }
+
+    def query(self, query_embeddings: list, n_results: int = 3):
+        results = {"ids": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            rows, distances = self.search(embedding, n_results)
+            results["ids"].append([self.ids[row] for row in rows])
+            results["metadatas"].append([{"smiles": self.smiles[row]} for row in rows])
+            results["distances"].append([float(distance) for distance in distances])
+        return results
+
+
+def build_vector_index(path: str,
+                       embeddings: np.ndarray,
+                       ids: list,
+                       smiles: list,
+                       quantization: str = "int8",
+                       partitions: int = 0,
+                       pq_m: int = 8,
+                       train_size: int = 100000,
+                       chunk_rows: int = 8192,
+                       seed: int = 99) -> VectorIndex:
+    """
+    Quantize `embeddings` (an array or float32 memmap) into a `VectorIndex`
+    directory. `partitions=0` builds a flat index, otherwise an IVF index with
+    that many k-means partitions; quantizers and partitions are trained on a
+    sample of at most `train_size` rows.
+    """
+    if quantization not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization {quantization}, expected one of {list(QUANTIZERS)}")
+    os.makedirs(path, exist_ok=True)
+    count, dim = embeddings.shape
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(count, size=min(train_size, count), replace=False))
+    sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+
+    if quantization == "int8":
+        quantizer = Int8Quantizer.train(sample)
+    else:
+        quantizer = ProductQuantizer.train(sample, m=pq_m)
+    quantizer.save(path)
+
+    if partitions:
+        centroids = kmeans(sample, partitions, seed=seed)
+        assignment = nearest_centroids(embeddings, centroids, chunk_rows)
+    else:
+        centroids = sample.mean(axis=0, keepdims=True) if count else np.zeros((1, dim), np.float32)
+        assignment = np.zeros(count, dtype=np.int64)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+    np.save(os.path.join(path, "centroids.npy"), centroids.astype(np.float32))
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    with open(os.path.join(path, "codes.bin"), "wb") as f:
+        for start in range(0, count, chunk_rows):
+            rows = order[start:start + chunk_rows]
+            # fancy indexing a memmap needs sorted rows to stay sequential-ish
+            sorted_rows = np.sort(rows)
+            chunk = np.asarray(embeddings[sorted_rows], dtype=np.float32)
+            chunk = chunk[np.searchsorted(sorted_rows, rows)]
+            f.write(quantizer.encode(chunk).tobytes())
+    with open(os.path.join(path, "ids.txt"), "w") as f:
+        f.writelines(f"{ids[row]}\n" for row in order)
+    with open(os.path.join(path, "smiles.txt"), "w") as f:
+        f.writelines(f"{smiles[row]}\n" for row in order)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"count": int(count), "dim": int(dim), "metric": "l2",
+                   "quantization": quantization, "partitions": int(len(centroids)),
+                   "pq_m": pq_m if quantization == "pq" else None}, f)
+    return VectorIndex(path)
+
+
+def export_chroma_collection(collection, path: str, page_size: int = 5000, **build_kwargs) -> VectorIndex:
+    """
+    Page every embedding of a Chroma collection into a temporary float32
+    memmap and build a `VectorIndex` from it.
+    """
+    count = collection.count()
+    ids, smiles = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings = None
+        for offset in range(0, count, page_size):
+            page = collection.get(limit=page_size, offset=offset,
+                                  include=["embeddings", "metadatas"])
+            page_embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.memmap(os.path.join(tmp, "embeddings.f32"), dtype=np.float32,
+                                       mode="w+", shape=(count, page_embeddings.shape[1]))
+            embeddings[offset:offset + len(page_embeddings)] = page_embeddings
+            ids.extend(page["ids"])
+            smiles.extend(metadata.get("smiles", metadata.get("SMILES", ""))
+                          for metadata in page["metadatas"])
+        if embeddings is None:
+            raise ValueError("Cannot export an empty collection")
+        embeddings.flush()
+        return build_vector_index(path, embeddings, ids, smiles, **build_kwargs)
+
+
+def main(argv=None):
+    from app.utils.searchers import searcher_registry, CHROMADB_PERSISTENT_PATH
+    parser = argparse.ArgumentParser(
+        description="Export a Chroma similarity collection to a memory-mapped quantized index")
+    parser.add_argument("collection", help="Chroma collection name, e.g. smiles_data")
+    parser.add_argument("--persist-directory", default=CHROMADB_PERSISTENT_PATH)
+    parser.add_argument("--out", default=None,
+                        help=f"output directory, defaults to {VECTOR_INDEX_PATH}/<collection>")
+    parser.add_argument("--quantization", choices=list(QUANTIZERS), default="int8")
+    parser.add_argument("--partitions", type=int, default=0,
+                        help="number of IVF partitions, 0 for a flat index")
+    parser.add_argument("--pq-m", type=int, default=8, help="PQ sub-vectors")
+    args = parser.parse_args(argv)
+
+    client = searcher_registry.get_client(args.persist_directory)
+    collection = client.get_collection(name=args.collection)
+    out = args.out or os.path.join(VECTOR_INDEX_PATH, args.collection)
+    index = export_chroma_collection(collection, out,
+                                     quantization=args.quantization,
+                                     partitions=args.partitions,
+                                     pq_m=args.pq_m)
+    print(f"[+] Exported {len(index)} vectors to {out}")
+
+
+if __name__ == "__main__":
+    main()
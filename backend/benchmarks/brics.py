@@ -0,0 +1,62 @@
+"""
+Throughput of BRICS generation, sequential and sharded across worker pools.
+
+The seeds are decomposed once (the fragment store memoizes them), then the
+same fragment library is enumerated in one process and across pools of
+growing size. Every worker count gets one untimed warm-up build first, so
+the timings leave out the pool start-up a serving process pays once. Every
+parallel run is checked against the sequential one: without budgets both
+must produce the same set of molecules. The seeds are either a SMILES file
+(one per line) or the first synthetic molecules of the descriptor
+benchmark.
+
+Run from the backend directory:
+
+    python -m benchmarks.brics --seeds 12 --max-depth 2 --workers 1 4 8 16 32
+"""
+import time
+import argparse
+from app.utils.generators.BRICSGenerator import BRICSGenerator
+from benchmarks.descriptors import synthetic_library
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input", help="SMILES file, one per line (synthetic seeds if not given)")
+    parser.add_argument("--seeds", type=int, default=8)
+    parser.add_argument("--max-depth", type=int, default=2)
+    parser.add_argument("--max-candidates", type=int, default=None)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input) as f:
+            seeds = [line.split()[0] for line in f if line.strip()][:args.seeds]
+    else:
+        # every fifth molecule, so neighbouring seeds do not share most of their fragments
+        seeds = synthetic_library(args.seeds * 5)[::5]
+
+    library = BRICSGenerator().build_fragment_library(seeds)
+    print(f"{len(seeds)} seeds, {len(library)} fragments, max depth {args.max_depth}")
+    print(f"{'workers':>8}{'seconds':>10}{'molecules':>11}{'mol/s':>10}{'speedup':>9}  truncated / same set")
+    reference = None
+    baseline = None
+    for workers in args.workers:
+        generator = BRICSGenerator(workers=workers)
+        generator._BRICS_build(library, args.max_candidates, args.max_depth)
+        elapsed = float("inf")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            build, truncated = generator._BRICS_build(library, args.max_candidates, args.max_depth)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        if reference is None:
+            reference, baseline = set(build), elapsed
+        # budgeted runs keep whichever candidates their enumeration order reaches first
+        same = set(build) == reference if not truncated else "-"
+        print(f"{workers:>8}{elapsed:>10.2f}{len(build):>11}{len(build) / elapsed:>10.0f}"
+              f"{baseline / elapsed:>9.2f}  {truncated} / {same}")
+
+
+if __name__ == "__main__":
+    main()
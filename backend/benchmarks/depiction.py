@@ -0,0 +1,72 @@
+"""
+Render time and payload size of the molecule depiction formats.
+
+Compares the previous Draw.MolToImage + PIL PNG path against the RDKit 2D
+drawers used by app.utils.depiction (Cairo PNG, WebP, SVG) at the sizes the
+tools use. Payload is reported both raw and base64 encoded, as it travels
+inline in tool results.
+
+Run from the backend directory:
+
+    python -m benchmarks.depiction
+"""
+import time
+import base64
+import argparse
+from io import BytesIO
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import Draw
+from app.utils.depiction import render_molecule
+
+SAMPLE_SMILES = [
+    "CC(=O)OC1=CC=CC=C1C(=O)O",
+    "CC(=O)NC1=CC=C(O)C=C1",
+    "CN1C=NC2=C1C(=O)N(C(=O)N2C)C",
+    "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O",
+    "C(C1C(C(C(C(O1)O)O)O)O)O",
+    "O=C([*])CCCCOC(=O)C(CC1OC([*])C(O)C(O)C1O)N[*]",
+    "O=C([*])CCCCOC(=O)C(Cc1c[nH]cn1)N[*]",
+    "[*]CC(C)(C(=O)OC)[*]",
+]
+
+
+def legacy_png(smiles: str, size: tuple) -> bytes:
+    img = Draw.MolToImage(Chem.MolFromSmiles(smiles), size=size)
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 600])
+    args = parser.parse_args(argv)
+
+    variants = [
+        ("png (MolToImage)", lambda s, size: legacy_png(s, size)),
+        ("png (cairo)", lambda s, size: render_molecule(s, size, "png")),
+        ("png (cairo, z=9)", lambda s, size: render_molecule(s, size, "png", 9)),
+        ("webp (q=80)", lambda s, size: render_molecule(s, size, "webp", 80)),
+        ("webp (q=50)", lambda s, size: render_molecule(s, size, "webp", 50)),
+        ("svg", lambda s, size: render_molecule(s, size, "svg")),
+    ]
+    print(f"{'format':<20}{'size':>6}{'ms/mol':>10}{'bytes':>10}{'base64':>10}")
+    for edge in args.sizes:
+        size = (edge, edge)
+        for name, render in variants:
+            timings, payloads = [], []
+            for _ in range(args.repeats):
+                for smiles in SAMPLE_SMILES:
+                    started = time.perf_counter()
+                    data = render(smiles, size)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    payloads.append(len(data))
+            raw = int(np.mean(payloads))
+            encoded = len(base64.b64encode(b"\0" * raw))
+            print(f"{name:<20}{edge:>6}{np.mean(timings):>10.2f}{raw:>10}{encoded:>10}")
+
+
+if __name__ == "__main__":
+    main()
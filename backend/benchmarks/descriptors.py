@@ -0,0 +1,70 @@
+"""
+Throughput of the descriptor engine, in molecules per second per descriptor set.
+
+Every set is computed over the same library, inline (one process) and
+across worker pools of growing size. The library is either a SMILES file
+(one per line) or a synthetic set of (nearly all) distinct molecules, so the mol
+cache can hardly serve repeats.
+
+Run from the backend directory:
+
+    python -m benchmarks.descriptors --molecules 20000 --workers 1 4 8
+"""
+import time
+import argparse
+from itertools import product
+from app.utils.mol_cache import mol_cache
+from app.utils.descriptors import compute_descriptor_table, DESCRIPTOR_SETS, DESCRIPTOR_CHUNK_SIZE
+
+CORES = ["c1ccccc1", "c1ccncc1", "C1CCCCC1", "c1ccc2ccccc2c1", "C1CCNCC1", "c1ccoc1"]
+LINKERS = ["C", "CC", "O", "N", "C(=O)", "C(=O)N", "S(=O)(=O)", "OC"]
+TAILS = ["C", "CC", "CCC", "O", "N", "F", "Cl", "C(F)(F)F", "C(=O)O", "C#N", "OC", "N(C)C"]
+
+
+def synthetic_library(n: int) -> list:
+    """
+    Distinct drug-like molecules: a core, a linker and a tail, then two
+    cores joined by a linker and capped by a tail once those run out.
+    """
+    library = [f"{core}{linker}{tail}" for core, linker, tail in product(CORES, LINKERS, TAILS)]
+    for first, linker, second, tail in product(CORES, LINKERS, CORES, TAILS):
+        if len(library) >= n:
+            break
+        library.append(f"{first}{linker}{second}{tail}")
+    base = len(library)
+    while len(library) < n:
+        # alkyl chains of growing length keep the molecules distinct past the combinations above
+        library.append("C" * (len(library) // base) + library[len(library) % base])
+    return library[:n]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input", help="SMILES file, one per line (synthetic library if not given)")
+    parser.add_argument("--molecules", type=int, default=5000)
+    parser.add_argument("--sets", nargs="+", default=list(DESCRIPTOR_SETS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--chunk-size", type=int, default=DESCRIPTOR_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input) as f:
+            library = [line.split()[0] for line in f if line.strip()][:args.molecules]
+    else:
+        library = synthetic_library(args.molecules)
+
+    print(f"{len(library)} molecules, chunks of {args.chunk_size}")
+    print(f"{'set':<16}{'columns':>8}{'workers':>9}{'seconds':>10}{'mol/s':>10}{'errors':>8}")
+    for name in args.sets:
+        for workers in args.workers:
+            # forked workers inherit the parent's cache, start every run cold
+            mol_cache.clear()
+            start = time.perf_counter()
+            table = compute_descriptor_table(library, [name], args.chunk_size, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<16}{len(table.columns):>8}{workers:>9}{elapsed:>10.2f}"
+                  f"{len(library) / elapsed:>10.0f}{int(table.error_mask.sum()):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Recall / latency benchmark of the quantized vector index against Chroma.
+
+Ground truth is an exact float32 squared-L2 scan. Queries are stored vectors
+with a little noise added, so every query has true near neighbours.
+
+Run from the backend directory, against an existing collection:
+
+    python -m benchmarks.vector_index --collection smiles_data
+
+or on synthetic data when no Chroma store is available:
+
+    python -m benchmarks.vector_index --synthetic 200000 --dim 600
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from app.utils.vector_index import build_vector_index, squared_distances
+
+VARIANTS = [
+    {"quantization": "int8", "partitions": 0},
+    {"quantization": "int8", "partitions": 256},
+    {"quantization": "pq", "partitions": 0},
+    {"quantization": "pq", "partitions": 256},
+]
+
+
+def exact_top_k(embeddings: np.ndarray, queries: np.ndarray, k: int) -> list:
+    truth = []
+    for query in queries:
+        distances = np.concatenate([
+            squared_distances(np.asarray(embeddings[start:start + 8192]), query[None, :])[:, 0]
+            for start in range(0, len(embeddings), 8192)])
+        truth.append(set(np.argsort(distances)[:k].tolist()))
+    return truth
+
+
+def measure(search, queries: np.ndarray, truth: list, k: int) -> dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(expected & set(found))
+    return {"recall": hits / (k * len(queries)),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95))}
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--collection", default=None)
+    source.add_argument("--synthetic", type=int, default=0, help="number of random vectors")
+    parser.add_argument("--dim", type=int, default=600)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args(argv)
+    if args.collection is None and args.synthetic <= 0:
+        parser.error("--synthetic must be positive")
+    rng = np.random.default_rng(0)
+
+    collection = None
+    if args.collection:
+        from app.utils.searchers import searcher_registry
+        collection = searcher_registry.get_client().get_collection(name=args.collection)
+        page = collection.get(include=["embeddings", "metadatas"])
+        embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+        ids = page["ids"]
+        smiles = [m.get("smiles", m.get("SMILES", "")) for m in page["metadatas"]]
+    else:
+        # clustered synthetic data, closer to real embeddings than uniform noise
+        centers = rng.normal(size=(64, args.dim)).astype(np.float32)
+        embeddings = (centers[rng.integers(64, size=args.synthetic)]
+                      + 0.3 * rng.normal(size=(args.synthetic, args.dim))).astype(np.float32)
+        ids = [str(i) for i in range(len(embeddings))]
+        smiles = ["C"] * len(embeddings)
+
+    picked = rng.choice(len(embeddings), size=args.queries, replace=False)
+    queries = embeddings[picked] + 0.01 * rng.normal(size=(args.queries, embeddings.shape[1])).astype(np.float32)
+    truth = exact_top_k(embeddings, queries, args.k)
+    id_rows = {id_: row for row, id_ in enumerate(ids)}
+    print(f"{len(embeddings)} vectors, dim {embeddings.shape[1]}, k={args.k}, {args.queries} queries")
+    print(f"{'backend':<22}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'size MB':>10}")
+
+    def report(name, result, size=None):
+        size_text = f"{size / 2**20:>10.1f}" if size is not None else f"{'-':>10}"
+        print(f"{name:<22}{result['recall']:>8.3f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{size_text}")
+
+    if collection is not None:
+        def chroma_search(query):
+            found = collection.query(query_embeddings=[query.tolist()], n_results=args.k)["ids"][0]
+            return [id_rows[i] for i in found]
+        report("chroma", measure(chroma_search, queries, truth, args.k))
+
+    for variant in VARIANTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = build_vector_index(tmp, embeddings, ids, smiles, **variant)
+            index.nprobe = args.nprobe
+
+            def index_search(query):
+                found = index.query([query], n_results=args.k)["ids"][0]
+                return [id_rows[i] for i in found]
+            name = f"{variant['quantization']}-{'ivf' + str(variant['partitions']) if variant['partitions'] else 'flat'}"
+            report(name, measure(index_search, queries, truth, args.k), directory_size(tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
 
 GOOGLE_CLOUD_PROJECT_API_KEY = os.environ.get("GOOGLE_CLOUD_PROJECT_API_KEY")
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
\ No newline at end of file
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+PRELOAD_SEARCHERS = os.environ.get("PRELOAD_SEARCHERS", "false").lower() in ("1", "true", "yes")
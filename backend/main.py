@@ -3,8 +3,20 @@ set_env_vars(".env")
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import (
-    chat
+    chat,
+    images,
+    search
 )
+from app.utils.searchers import searcher_registry
+from app.utils.depiction import shutdown_depiction_pool
+from app.utils.descriptors import shutdown_descriptor_pool
+from app.utils.substructure_index import shutdown_substructure_pool
+from app.utils.http_client import close_http_session
+from app.utils.pdb_cache import pdb_cache
+from app.utils.generators.fragment_store import fragment_store
+from app.utils.generators.BRICSGenerator import shutdown_brics_pool
+from app.utils.image_refs import IMAGE_ROUTE_PREFIX
+from get_env_vars import PRELOAD_SEARCHERS
 import uvicorn
 
 app = FastAPI(title="Chemistry API", description="API for Chemistry", version="0.1.0")
@@ -20,6 +32,25 @@ app.add_middleware(
 
 # Include routers
 app.include_router(chat.router, prefix="/chat", tags=["chat"]) # Include the validator router
+app.include_router(images.router, prefix=IMAGE_ROUTE_PREFIX, tags=["images"]) # Serve out-of-band tool images
+app.include_router(search.router, prefix="/search", tags=["search"]) # Stream search results incrementally
+
+@app.on_event("startup")
+def load_searchers():
+    # load polyBERT and open the similarity collections once, before the first request
+    if PRELOAD_SEARCHERS:
+        searcher_registry.warmup()
+
+@app.on_event("shutdown")
+def close_searchers():
+    searcher_registry.close()
+    shutdown_depiction_pool()
+    shutdown_descriptor_pool()
+    shutdown_substructure_pool()
+    shutdown_brics_pool()
+    close_http_session()
+    pdb_cache.close()
+    fragment_store.close()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) # Run the app
\ No newline at end of file
@@ -2,16 +2,32 @@ import React, { useEffect } from "react";
 import "./Formatter.css";
 import ProtViewer from "../ProtViewer/ProtViewer";
 
+const IMAGE_MIME_TYPES = {
+    png: "image/png",
+    webp: "image/webp",
+    svg: "image/svg+xml",
+    jpeg: "image/jpeg",
+};
+
+// Tools either inline images as base64 or reference them by URL (served by the backend /images route)
+const imageSource = (content) => {
+    if (content.image_url) {
+        return `http://localhost:8000${content.image_url}`;
+    }
+    const mimeType = IMAGE_MIME_TYPES[content.image_format] || "image/png";
+    return `data:${mimeType};base64,${content.image}`;
+};
+
 const BodyFormatter = ({ content, cardType }) => {
     useEffect(() => {
         console.log("card type >>", cardType);
     }, [cardType])
 
-    if (["SMILES Similarity Search", "Polymer Similarity Search", "Protein Similarity Search"].includes(cardType)) {
+    if (["SMILES Similarity Search", "Polymer Similarity Search", "Protein Similarity Search", "Substructure Search"].includes(cardType)) {
         console.log("this is gettting triggered")
         return (
             <div className="card-content">
-                {content.image && <img src={`data:image/png;base64,${content.image}`} alt="Tool" />}
+                {(content.image || content.image_url) && <img src={imageSource(content)} alt="Tool" />}
                 {content.identifier && <p className="card-iden">{content.identifier}</p>}
                 {content.score && <p>Score: {content.score.toFixed(3)}</p>}
             </div>
@@ -20,7 +36,7 @@ const BodyFormatter = ({ content, cardType }) => {
     if (["Molecule Explorer", "Polymer Explorer"].includes(cardType)) {
         return (
             <div className="card-content">
-                {content.image && <img src={`data:image/png;base64,${content.image}`} alt="Tool" />}
+                {(content.image || content.image_url) && <img src={imageSource(content)} alt="Tool" />}
                 {content.info && Object.entries(content.info).map(([key, value]) => (
                     <p key={key}>
                         <span className="key-highlight">{key}</span>: <span className="value-gap">{value}</span>
@@ -29,7 +45,7 @@ const BodyFormatter = ({ content, cardType }) => {
             </div>
         );
     }
-    if (cardType === "Protein Explorer") {
+    if (["Protein Explorer", "Batch Protein Explorer"].includes(cardType)) {
         return (
             <div className="card-content">
                 <ProtViewer activeMol={content.id} />